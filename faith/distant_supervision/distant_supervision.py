@@ -5,6 +5,7 @@ import pickle
 
 from tqdm import tqdm
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from clocq.CLOCQ import CLOCQ
 from clocq.interface.CLOCQInterfaceClient import CLOCQInterfaceClient
@@ -38,13 +39,14 @@ class DistantSupervision:
         """
         with open(dataset_path, "r") as fp:
             dataset = json.load(fp)
-        # process data
+        # process data (keeping multiple CLOCQ requests in flight)
         tsf_count = 0
-        for instance in tqdm(dataset):
-            # annotate data
-            success = self.tsf_annotator.process_instance(instance)
-            if success:
-                tsf_count += 1
+        max_workers = self.config.get("clocq_max_in_flight", 8)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for success in tqdm(executor.map(self.tsf_annotator.process_instance, dataset), total=len(dataset)):
+                # annotate data
+                if success:
+                    tsf_count += 1
 
         # log
         self.logger.info(f"Done with DS on: {dataset_path}")
@@ -0,0 +1,90 @@
+import json
+import time
+import random
+import threading
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from faith.library.utils import get_logger
+
+
+class PooledClocqClient:
+    """
+    Access layer for CLOCQ shared by concurrent questions.
+    - keep-alive connections (connection pool of the session of the API client)
+    - limit on the number of requests in flight (across all questions)
+    - retries with jittered exponential backoff until a deadline
+    - identical requests in flight are coalesced into a single request
+    """
+
+    def __init__(self, clocq, config):
+        self.clocq = clocq
+        self.logger = get_logger(__name__, config)
+        self.max_in_flight = config.get("clocq_max_in_flight", 8)
+        self.deadline = config.get("clocq_deadline", 30)
+        self.retry_backoff = config.get("clocq_retry_backoff", 0.5)
+        self.semaphore = threading.BoundedSemaphore(self.max_in_flight)
+        self.lock = threading.Lock()
+        self.in_flight = dict()
+        # keep as many connections alive as requests can be in flight
+        session = getattr(clocq, "req", None)
+        if isinstance(session, requests.Session):
+            adapter = HTTPAdapter(pool_connections=self.max_in_flight, pool_maxsize=self.max_in_flight)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+    def get_search_space(self, question, parameters=dict(), include_labels=True, include_type=False):
+        key = ["search_space", question, parameters, include_labels, include_type]
+        return self._call(key, self.clocq.get_search_space, question, parameters=parameters,
+                          include_labels=include_labels, include_type=include_type)
+
+    def entity_linking(self, question, parameters=dict()):
+        key = ["entity_linking", question, parameters]
+        return self._call(key, self.clocq.entity_linking, question, parameters=parameters)
+
+    def get_neighborhood(self, kb_item, p=1000, include_labels=True):
+        key = ["neighborhood", kb_item, p, include_labels]
+        return self._call(key, self.clocq.get_neighborhood, kb_item, p=p, include_labels=include_labels)
+
+    def __getattr__(self, name):
+        # other functions of CLOCQ are called directly
+        return getattr(self.clocq, name)
+
+    def _call(self, key, function, *args, **kwargs):
+        """Call the function, or wait for the result of an identical request in flight."""
+        key = json.dumps(key, sort_keys=True, default=str)
+        with self.lock:
+            future = self.in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self.in_flight[key] = future
+        if not is_owner:
+            return future.result()
+        try:
+            future.set_result(self._call_with_retries(function, *args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+        return future.result()
+
+    def _call_with_retries(self, function, *args, **kwargs):
+        """Call the function (within the limit of requests in flight), and retry on failure until the deadline."""
+        deadline = time.time() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                with self.semaphore:
+                    return function(*args, **kwargs)
+            except Exception as e:
+                # full jitter: wait a random time up to the exponential backoff
+                backoff = random.uniform(0, self.retry_backoff * 2 ** attempt)
+                if time.time() + backoff > deadline:
+                    raise
+                self.logger.warning(f"Request to CLOCQ failed ({e}), retrying in {backoff:.2f} seconds.")
+                time.sleep(backoff)
+                attempt += 1
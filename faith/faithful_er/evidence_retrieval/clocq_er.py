@@ -1,15 +1,21 @@
 import os
 import re
-import copy
+import json
+import zlib
 import pickle
 import time
 from pathlib import Path
+from concurrent import futures
 from concurrent.futures import ThreadPoolExecutor
 
 from clocq.CLOCQ import CLOCQ
 from clocq.interface.CLOCQInterfaceClient import CLOCQInterfaceClient
 
 from faith.library.utils import get_logger, get_config
+from faith.library import timing
+from faith.library.kv_store import SqliteStore
+from faith.library.transport import get_transport, persistent_caches_enabled, MissingRecordingError
+from faith.faithful_er.evidence_retrieval.clocq_client import PooledClocqClient
 from faith.faithful_er.evidence_retrieval.wikipedia_retriever.wikipedia_retriever import WikipediaRetriever
 
 ENT_PATTERN = re.compile("^Q[0-9]+$")
@@ -17,28 +23,53 @@ PRE_PATTERN = re.compile("^P[0-9]+$")
 
 KB_ITEM_SEPARATOR = ", "
 
+# increase when the conversion of KB-facts to evidences changes, to invalidate cached evidences
+KB_EVIDENCES_CACHE_VERSION = 3
+
 
 class ClocqRetriever:
-    def __init__(self, config, temporal_value_annotator):
+    def __init__(self, config, temporal_value_annotator, clocq=None, wiki_retriever=None):
+        """
+        Create the retriever. The CLOCQ and Wikipedia backends are created
+        based on the config, unless given (e.g. stubs for running offline).
+        """
         self.config = config
         self.logger = get_logger(__name__, config)
         self.temporal_value_annotator = temporal_value_annotator
         self.library = self.temporal_value_annotator.library
         # load cache
-        self.use_cache = config["er_use_cache"]
+        self.use_cache = config["er_use_cache"] and persistent_caches_enabled(config)
+        # "pickle" (whole cache in memory) or "sqlite" (persistent key-value store)
+        self.cache_backend = config.get("er_cache_backend", "pickle")
+        # additionally cache the converted KB-evidences (not only the CLOCQ results)
+        self.use_evidence_cache = self.use_cache and config.get("er_kb_evidences_cache", False)
+        # assemble search spaces from cached KB-neighborhoods of the linked entities
+        self.use_neighborhood_cache = self.use_cache and config.get("er_entity_neighborhood_cache", False)
+        self.neighborhood_max_facts = config.get("er_neighborhood_max_facts", 1000)
 
         if self.use_cache:
             self.cache_path = os.path.join(config["path_to_data"], config["benchmark"], config["er_cache_path"])
-            self._init_cache()
+            if self.cache_backend == "sqlite":
+                self._init_db_cache()
+            else:
+                self._init_cache()
             self.cache_changed = False
 
-        if config["clocq_use_api"]:
-            self.clocq = CLOCQInterfaceClient(host=config["clocq_host"], port=config["clocq_port"])
-        else:
-            self.clocq = CLOCQ()
+        # transport for recording/replaying requests to CLOCQ
+        self.transport = get_transport(config)
+        if clocq is None:
+            if config["clocq_use_api"]:
+                clocq = CLOCQInterfaceClient(host=config["clocq_host"], port=config["clocq_port"])
+            else:
+                clocq = CLOCQ()
+        # shared by concurrent questions (limit on requests in flight, retries, coalescing)
+        self.clocq = PooledClocqClient(clocq, config)
 
         # initialize wikipedia-retriever
-        self.wiki_retriever = WikipediaRetriever(config, self.temporal_value_annotator)
+        if wiki_retriever is not None:
+            self.wiki_retriever = wiki_retriever
+        else:
+            self.wiki_retriever = WikipediaRetriever(config, self.temporal_value_annotator)
 
     def retrieve_evidences(self, query, sources):
         """
@@ -53,30 +84,95 @@ class ClocqRetriever:
         all evidences for the given TSF (if possible from cache).
         """
         self.logger.info(f"Retrieve evidences for: {query}")
-        # first get question entities (and KB-facts if required)
-        start = time.time()
-        evidences, question_entities = self.retrieve_KB_facts(query)
-        self.logger.info(f"Time taken (retrieve_KB_facts): {time.time() - start} seconds")
-        self.logger.info(f"Number of question entities : {len(question_entities)}")
-
         # wikipedia evidences (only if required)
-        if any(src in sources for src in ["text", "table", "info"]):
-            start = time.time()
-            wiki_evidences = self.retrieve_wikipedia_evidences_multithread(question_entities)
+        if not any(src in sources for src in ["text", "table", "info"]):
+            with timing.span("kb_facts"):
+                kb_evidences, question_entities = self.retrieve_KB_evidences(query)
+            self.logger.info(f"Number of question entities : {len(question_entities)}")
+            return kb_evidences if "kb" in sources else [], question_entities
 
-            for evi in wiki_evidences:
-                evidences += evi
+        # Wikipedia retrieval for the question entities starts as soon as they are known,
+        # and runs while the KB-facts are converted
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            wiki_futures = list()
 
-            self.logger.info(f"Time taken (retrieve_wikipedia_evidences): {time.time() - start} seconds")
+            retrieve_wikipedia_evidences = timing.in_current_span(self._retrieve_wikipedia_evidences)
 
-        # remove duplicated evidences
-        evidences = self.remove_duplicate_evidence(evidences)
+            def _start_wikipedia_retrieval(question_entities):
+                wiki_futures.append(executor.submit(retrieve_wikipedia_evidences, question_entities))
 
+            start = time.time()
+            try:
+                with timing.span("kb_facts"):
+                    kb_evidences, question_entities = self.retrieve_KB_evidences(query, _start_wikipedia_retrieval)
+            finally:
+                # never leave a started Wikipedia retrieval behind (e.g. if the KB retrieval failed)
+                futures.wait(wiki_futures)
+            self.logger.info(f"Time taken (retrieve_KB_facts): {time.time() - start} seconds")
+            self.logger.info(f"Number of question entities : {len(question_entities)}")
+
+        if wiki_futures:
+            wiki_evidences = wiki_futures[0].result()
+        else:
+            # KB retrieval returned before the question entities were passed on
+            wiki_evidences = self._retrieve_wikipedia_evidences(question_entities)
+
+        # evidences are deduplicated per source, so KB-evidences can be processed separately
+        evidences = kb_evidences if "kb" in sources else []
+        # remove duplicated evidences
+        wiki_evidences = self.remove_duplicate_evidence(wiki_evidences)
         # config-based filtering
-        evidences = self.filter_evidences(evidences, sources)
+        evidences += self.filter_evidences(wiki_evidences, sources)
+
         self.logger.info(f"Number of evidences : {len(evidences)}")
         return evidences, question_entities
 
+    def _retrieve_wikipedia_evidences(self, question_entities):
+        """Retrieve the evidences from Wikipedia for all question entities."""
+        start = time.time()
+        with timing.span("wikipedia"):
+            wiki_evidences = self.retrieve_wikipedia_evidences_multithread(question_entities)
+        self.logger.info(f"Time taken (retrieve_wikipedia_evidences): {time.time() - start} seconds")
+        return [evidence for evi in wiki_evidences for evidence in evi]
+
+    def retrieve_KB_evidences(self, query, on_question_entities=None):
+        """
+        Retrieve the deduplicated and filtered KB-evidences, and the question entities
+        for the given query. If enabled, the converted evidences are cached
+        (compressed) per query and CLOCQ parameters, so that a repeated query
+        skips the conversion of the facts as well.
+        Evidences are cached before filtering, so that the filter settings can change.
+        If given, `on_question_entities` is called with the question entities
+        as soon as they are known (before the KB-facts are converted).
+        """
+        if self.use_evidence_cache:
+            key = self._get_kb_evidences_key(query)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.logger.debug(f"Have cache hit: Retrieving KB-evidences for: {query}.")
+                evidences, question_entities = pickle.loads(zlib.decompress(cached))
+                if on_question_entities is not None:
+                    on_question_entities(question_entities)
+                return self.filter_evidences(evidences, ["kb"]), question_entities
+
+        evidences, question_entities = self.retrieve_KB_facts(query, on_question_entities)
+        evidences = self.remove_duplicate_evidence(evidences)
+
+        # empty results (e.g. failed requests) are not cached
+        if self.use_evidence_cache and (evidences or question_entities):
+            self.cache_changed = True
+            self.cache[key] = zlib.compress(pickle.dumps((evidences, question_entities), protocol=pickle.HIGHEST_PROTOCOL))
+        return self.filter_evidences(evidences, ["kb"]), question_entities
+
+    def _get_kb_evidences_key(self, query):
+        """Key of the KB-evidences for the given query in the cache."""
+        clocq_params = json.dumps(self.config["clocq_params"], sort_keys=True)
+        if self.use_neighborhood_cache:
+            search_space = f"neighborhoods|||{self.config['clocq_p']}|||{self.neighborhood_max_facts}"
+        else:
+            search_space = "clocq"
+        return f"kb_evidences|||{KB_EVIDENCES_CACHE_VERSION}|||{search_space}|||{clocq_params}|||{query}"
+
     def retrieve_wikipedia_evidences(self, question_entity):
         """
         Retrieve evidences from Wikipedia for the given question entity.
@@ -91,41 +187,35 @@ class ClocqRetriever:
 
         return evidences
 
-    def _kb_fact_to_evidence_multithread(self, facts, question_items_set):
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            evidences = [
-                future.result()
-                for future in [
-                    executor.submit(self._kb_fact_to_evidence, fact, question_items_set)
-                    for fact in facts
-                ]
-            ]
-            return evidences
-
     def retrieve_wikipedia_evidences_multithread(self, question_entitiess):
+        retrieve = timing.in_current_span(self.retrieve_wikipedia_evidences)
         with ThreadPoolExecutor(max_workers=5) as executor:
             evidences = [
                 future.result()
                 for future in [
-                    executor.submit(self.retrieve_wikipedia_evidences, question_entity)
+                    executor.submit(retrieve, question_entity)
                     for question_entity in question_entitiess
                 ]
             ]
             return evidences
 
-    def retrieve_KB_facts(self, tsf, recursive_calls=0):
+    def retrieve_KB_facts(self, tsf, on_question_entities=None):
         """
         Retrieve KB facts for the given tsf (or other question/text).
         Also returns the question entities, for usage in Wikipedia retriever.
+        If given, `on_question_entities` is called with the question entities
+        as soon as they are known (before the KB-facts are converted).
         """
         # look-up cache for kb fact
-
-        if recursive_calls > 5:
-            return []
-
-        if self.use_cache and tsf in self.cache:
-            clocq_result = copy.deepcopy(self.cache[tsf])
+        key = self._get_search_space_key(tsf)
+        clocq_result = self.cache.get(key) if self.use_cache else None
+        if clocq_result is not None:
             self.logger.debug(f"Have cache hit: Retrieving search space for: {tsf}.")
+            if not isinstance(clocq_result["search_space"], tuple):
+                # entry of a cache populated before search spaces were normalized
+                clocq_result = self._normalize_search_space(clocq_result)
+                self.cache[key] = clocq_result
+                self.cache_changed = True
 
         else:
             self.logger.debug(f"No cache hit: Retrieving search space for: {tsf}.")
@@ -133,20 +223,33 @@ class ClocqRetriever:
             # apply CLOCQ
             start = time.time()
             try:
-                clocq_result = self.clocq.get_search_space(tsf, parameters=self.config["clocq_params"],
-                                                           include_labels=True,
-                                                           include_type=True)
+                with timing.span("clocq"):
+                    if self.use_neighborhood_cache:
+                        clocq_result = self._get_search_space_from_neighborhoods(tsf)
+                    else:
+                        clocq_result = self.transport.call(
+                            "clocq_search_space", [tsf, self.config["clocq_params"]],
+                            self.clocq.get_search_space, tsf, parameters=self.config["clocq_params"],
+                            include_labels=True, include_type=True
+                        )
+                        # normalized search spaces are immutable, and can be shared without copies
+                        clocq_result = self._normalize_search_space(clocq_result)
                 self.logger.info(f"Time taken (clocq.get_search_space): {time.time() - start} seconds")
-                # store result in cache
 
-            except:
-                time.sleep(1)
-                return self.retrieve_KB_facts(tsf, recursive_calls + 1)
+            except MissingRecordingError:
+                raise
+            except Exception as e:
+                # retries until the deadline failed
+                self.logger.error(f"Could not retrieve search space for: {tsf} ({e}).")
+                if on_question_entities is not None:
+                    on_question_entities([])
+                return [], []
 
+            # store result in cache (assembled search spaces are stored under a separate key)
             if self.use_cache:
                 # if self.use_cache and self.config.get("ers_update_clocq_cache", True):
                 self.cache_changed = True
-                self.cache[tsf] = copy.deepcopy(clocq_result)
+                self.cache[key] = clocq_result
 
         # get question entities (predicates dropped)
         question_entities = [
@@ -155,14 +258,92 @@ class ClocqRetriever:
             if not item["item"]["id"] is None and ENT_PATTERN.match(item["item"]["id"])
         ]
 
+        if on_question_entities is not None:
+            on_question_entities(question_entities)
+
         question_items_set = set([item["item"]["id"] for item in clocq_result["kb_item_tuple"]])
 
-        evidences = self._kb_fact_to_evidence_multithread(
-            clocq_result["search_space"], question_items_set
-        )
+        evidences = self._kb_facts_to_evidences(clocq_result["search_space"], question_items_set)
 
         return evidences, question_entities
 
+    def _get_search_space_key(self, tsf):
+        """
+        Key of the search space for the given tsf in the cache.
+        CLOCQ search spaces are stored under the tsf itself (as in existing caches),
+        assembled search spaces depend on the parameters of the neighborhoods as well.
+        """
+        if not self.use_neighborhood_cache:
+            return tsf
+        clocq_params = json.dumps(self.config["clocq_params"], sort_keys=True)
+        return f"neighborhoods|||{clocq_params}|||{self.config['clocq_p']}|||{self.neighborhood_max_facts}|||{tsf}"
+
+    def _get_search_space_from_neighborhoods(self, tsf):
+        """
+        Assemble the (normalized) search space for the given tsf from the KB-neighborhoods
+        of the entities linked by CLOCQ. Neighborhoods are cached per entity, so that
+        CLOCQ is only queried for facts of entities which were not seen before
+        (e.g. for paraphrased TSFs, or intermediate questions on the same entity).
+        """
+        kb_item_tuple = self.transport.call(
+            "clocq_entity_linking", [tsf, self.config["clocq_params"]],
+            self.clocq.entity_linking, tsf, parameters=self.config["clocq_params"]
+        )
+        search_space = list()
+        seen_facts = set()
+        for item in kb_item_tuple:
+            item_id = item["item"]["id"]
+            if item_id is None or not ENT_PATTERN.match(item_id):
+                continue
+            for kb_fact in self._get_neighborhood(item_id):
+                if kb_fact not in seen_facts:
+                    seen_facts.add(kb_fact)
+                    search_space.append(kb_fact)
+        return {"kb_item_tuple": kb_item_tuple, "search_space": tuple(search_space)}
+
+    def _get_neighborhood(self, item_id):
+        """
+        Normalized KB-facts of the given entity (if possible from cache).
+        At most `er_neighborhood_max_facts` facts are kept per entity (e.g. for countries).
+        """
+        key = f"neighborhood|||{self.config['clocq_p']}|||{self.neighborhood_max_facts}|||{item_id}"
+        neighborhood = self.cache.get(key)
+        if neighborhood is None:
+            self.logger.debug(f"No cache hit: Retrieving neighborhood for: {item_id}.")
+            facts = self.transport.call(
+                "clocq_neighborhood", [item_id, self.config["clocq_p"]],
+                self.clocq.get_neighborhood, item_id, p=self.config["clocq_p"], include_labels=True
+            )
+            facts = facts[:self.neighborhood_max_facts]
+            neighborhood = tuple(self._normalize_fact(kb_fact) for kb_fact in facts)
+            self.cache_changed = True
+            self.cache[key] = neighborhood
+        return neighborhood
+
+    def _normalize_search_space(self, clocq_result):
+        """
+        Normalize the search space of the given CLOCQ result:
+        facts become tuples of items, with the timestamps already converted.
+        """
+        return {
+            "kb_item_tuple": clocq_result["kb_item_tuple"],
+            "search_space": tuple(self._normalize_fact(kb_fact) for kb_fact in clocq_result["search_space"]),
+        }
+
+    def _normalize_fact(self, kb_fact):
+        """
+        Normalize the given KB-fact to a tuple of items (tuples of key-value pairs).
+        Timestamps get their date as label, and quotes are removed from their id.
+        """
+        normalized_fact = list()
+        for item in kb_fact:
+            item = dict(item)
+            if self.library.is_timestamp(item["id"]):
+                item["label"] = self.library.convert_timestamp_to_date(item["id"]).replace('"', "")
+                item["id"] = item["id"].replace('"', "")
+            normalized_fact.append(tuple(item.items()))
+        return tuple(normalized_fact)
+
     def remove_duplicate_evidence(self, evidences):
         """
         evidence = {
@@ -176,141 +357,125 @@ class ClocqRetriever:
                 "source": "kb",
         }
         """
-        evi_dic = {}
+        # evidences per (text, source), with the keys of their items for linear-time merging
+        merged_evidences = dict()
         for evidence in evidences:
-            text = evidence["evidence_text"]
-            source = evidence["source"]
-            # keep unique evidence text per source
-            text_source = f"{text}|||{source}"
-            if text_source not in evi_dic:
-                evi_dic[text_source] = {
+            text_source = (evidence["evidence_text"], evidence["source"])
+            if text_source not in merged_evidences:
+                merged_evidence = {
                     "wikidata_entities": [],
                     "disambiguations": [],
                     "retrieved_for_entity": [],
                     "tempinfo": evidence["tempinfo"],
+                    "evidence_text": evidence["evidence_text"],
+                    "source": evidence["source"],
                 }
-
-            for item in evidence["wikidata_entities"]:
-                if item not in evi_dic[text_source]["wikidata_entities"]:
-                    evi_dic[text_source]["wikidata_entities"].append(item)
-
-            for item in evidence["disambiguations"]:
-                if item not in evi_dic[text_source]["disambiguations"]:
-                    evi_dic[text_source]["disambiguations"].append(item)
-
-            for item in evidence["retrieved_for_entity"]:
-                if item not in evi_dic[text_source]["retrieved_for_entity"]:
-                    evi_dic[text_source]["retrieved_for_entity"].append(item)
-
-        for key, value in evi_dic.items():
-            text = key.split("|||")[0]
-            source = key.split("|||")[1]
-            value.update({"evidence_text": text, "source": source})
-
-        return list(evi_dic.values())
-
-    def _kb_fact_to_evidence(self, kb_fact, question_items_set):
-        """Transform the given KB-fact to an evidence."""
-
-        def _format_fact(kb_fact):
-            """Correct format of fact (if necessary)."""
+                merged_evidences[text_source] = (merged_evidence, set(), set(), set())
+            merged_evidence, entity_keys, disambiguation_keys, retrieved_for_keys = merged_evidences[text_source]
+            _merge_items(merged_evidence["wikidata_entities"], entity_keys, evidence["wikidata_entities"])
+            _merge_items(merged_evidence["disambiguations"], disambiguation_keys, evidence["disambiguations"])
+            _merge_items(merged_evidence["retrieved_for_entity"], retrieved_for_keys, evidence["retrieved_for_entity"])
+        return [merged_evidence for merged_evidence, _, _, _ in merged_evidences.values()]
+
+    def _kb_facts_to_evidences(self, kb_facts, question_items_set):
+        """
+        Transform the given normalized KB-facts to evidences in a single pass.
+        Each distinct KB-item is classified once (timestamp, predicate, entity).
+        The facts are not modified: the items of the evidences are new dictionaries.
+        """
+        item_classes = dict()
+        evidences = list()
+        # question items are compared with the normalized items (quotes removed from timestamps)
+        question_items_set = set(
+            item_id.replace('"', "") if isinstance(item_id, str) and self.library.is_timestamp(item_id) else item_id
+            for item_id in question_items_set
+        )
+        for kb_fact in kb_facts:
             start_timestamp = None
             end_timestamp = None
-            timespan = []
-            disambiguation = list()
+            labels = list()
+            wikidata_entities = list()
+            disambiguations = list()
+            temporal_disambiguation = list()
             retrieved_for = list()
-            for item in kb_fact:
-                index = kb_fact.index(item)
-                item_pre = kb_fact[index - 1]
-                if item["id"] in question_items_set:
+            # the item preceding the first item is the last one
+            item_pre_id = dict(kb_fact[-1])["id"] if kb_fact else None
+            for item_tuple in kb_fact:
+                item = dict(item_tuple)
+                item_id = item["id"]
+                item_class = item_classes.get(item_id)
+                if item_class is None:
+                    item_class = self._classify_kb_item(item_id)
+                    item_classes[item_id] = item_class
+                is_timestamp, is_predicate, is_entity, year, year_end = item_class
+
+                labels.append(item["label"])
+                if item_id in question_items_set:
                     retrieved_for.append(item)
-                if self.library.is_timestamp(item["id"]):
-                    item["label"] = self.library.convert_timestamp_to_date(item["id"])
-                    item["label"] = item["label"].replace('"', "")
-                    item["id"] = item["id"].replace('"', "")
-                    if (item["label"], item["id"]) not in disambiguation:
-                        disambiguation.append((item["label"], item["id"]))
-                    if item_pre["id"] == 'P580':
+                if is_entity:
+                    disambiguations.append((item["label"], item_id))
+                if not is_predicate:
+                    wikidata_entities.append(item)
+                if is_timestamp:
+                    # augment candidates with years (for different granularity of answer)
+                    wikidata_entities.append({"id": self.library.convert_year_to_timestamp(year), "label": year})
+                    if (item["label"], item_id) not in temporal_disambiguation:
+                        temporal_disambiguation.append((item["label"], item_id))
+                    if item_pre_id == "P580":
                         # start time
-                        start_timestamp = item["id"]
-                    elif item_pre["id"] == 'P582':
-                        # end time
-                        if "-01-01T00:00:00Z" in item["id"]:
-                            # timestamp is year, end time in timespan is changed to YYYY-12-31
-                            end_timestamp = item["id"].replace("-01-01T00:00:00Z", "-12-31T00:00:00Z")
-                        else:
-                            end_timestamp = item["id"]
+                        start_timestamp = item_id
+                    elif item_pre_id == "P582":
+                        # end time (for a year, end time in timespan is changed to YYYY-12-31)
+                        end_timestamp = year_end
                     else:
                         # point in time or other time
-                        if "-01-01T00:00:00Z" in item["id"]:
-                            start_timestamp = item["id"]
-                            # timestamp is year, end time in timespan is changed to YYYY-12-31
-                            end_timestamp = item["id"].replace("-01-01T00:00:00Z", "-12-31T00:00:00Z")
-                        else:
-                            start_timestamp = item["id"]
-                            end_timestamp = item["id"]
+                        start_timestamp = item_id
+                        end_timestamp = year_end
+                item_pre_id = item_id
 
             # generate timespan with start time and end time
-            if start_timestamp and end_timestamp:
+            timespan = list()
+            if start_timestamp or end_timestamp:
                 timespan.append([start_timestamp, end_timestamp])
-            elif start_timestamp and not end_timestamp:
-                # no end time
-                timespan.append([start_timestamp, None])
-            elif not start_timestamp and end_timestamp:
-                # no start time
-                timespan.append([None, end_timestamp])
-            return kb_fact, timespan, disambiguation, retrieved_for
-
-        def _get_wikidata_entities(kb_fact):
-            """Return wikidata_entities for fact."""
-            items = list()
-            for item in kb_fact:
-                # skip undesired answers
-                if not _is_potential_answer(item["id"]):
-                    continue
-                # append to set
-                items.append(item)
-                # augment candidates with years (for differen granularity of answer)
-                if self.library.is_timestamp(item["id"]):
-                    year = self.library.get_year(item["id"])
-                    new_item = {
-                        "id": self.library.convert_year_to_timestamp(year),
-                        "label": year,
-                    }
-                    items.append(new_item)
-            return items
-
-        def _is_potential_answer(item_id):
-            """Return if item_id could be answer."""
-            # keep all KB-items except for predicates
-            if PRE_PATTERN.match(item_id):
-                return False
-            return True
-
-        # evidence text
-        kb_fact, timespan, disambiguation, retrieved_for = _format_fact(kb_fact)
-        evidence_text = self._kb_fact_to_text(kb_fact)
-        wikidata_entities = _get_wikidata_entities(kb_fact)
-
-        # add tempinfo key to record temporal information of a fact
-        evidence = {
-            "evidence_text": evidence_text,
-            "wikidata_entities": wikidata_entities,
-            "disambiguations": [
-                (item["label"], item["id"]) for item in kb_fact if ENT_PATTERN.match(item["id"])
-            ],
-            "retrieved_for_entity": retrieved_for,
-            "tempinfo": [timespan, disambiguation] if timespan and disambiguation else None,
-            "source": "kb",
-        }
-        return evidence
+
+            # add tempinfo key to record temporal information of a fact
+            evidences.append({
+                "evidence_text": KB_ITEM_SEPARATOR.join(labels),
+                "wikidata_entities": wikidata_entities,
+                "disambiguations": disambiguations,
+                "retrieved_for_entity": retrieved_for,
+                "tempinfo": [timespan, temporal_disambiguation] if timespan and temporal_disambiguation else None,
+                "source": "kb",
+            })
+        return evidences
+
+    def _classify_kb_item(self, item_id):
+        """
+        Classify the KB-item with the given id.
+        Returns whether it is a timestamp, a predicate or an entity,
+        and the year and end of the timespan (for timestamps).
+        """
+        if not self.library.is_timestamp(item_id):
+            return False, bool(PRE_PATTERN.match(item_id)), bool(ENT_PATTERN.match(item_id)), None, None
+        year = self.library.get_year(item_id)
+        if "-01-01T00:00:00Z" in item_id:
+            # timestamp is year
+            year_end = item_id.replace("-01-01T00:00:00Z", "-12-31T00:00:00Z")
+        else:
+            year_end = item_id
+        return True, False, False, year, year_end
+
+    def _kb_fact_to_evidence(self, kb_fact, question_items_set):
+        """Transform the given normalized KB-fact to an evidence."""
+        return self._kb_facts_to_evidences([kb_fact], question_items_set)[0]
 
     def retrieve_evidences_from_kb(self, item):
         """Retrieve evidences from KB for the given item (used in DS)."""
-        facts = self.clocq.get_neighborhood(
-            item["id"], p=self.config["clocq_p"], include_labels=True
+        facts = self.transport.call(
+            "clocq_neighborhood", [item["id"], self.config["clocq_p"]],
+            self.clocq.get_neighborhood, item["id"], p=self.config["clocq_p"], include_labels=True
         )
-        return [self._kb_fact_to_evidence(kb_fact, item) for kb_fact in facts]
+        return [self._kb_fact_to_evidence(self._normalize_fact(kb_fact), item) for kb_fact in facts]
 
     def filter_evidences(self, evidences, sources):
         """
@@ -336,6 +501,12 @@ class ClocqRetriever:
             return
         if not self.cache_changed:  # store only if cache changed
             return
+        if self.cache_backend == "sqlite":
+            # write the new entries only
+            self.logger.info(f"Writing ER cache at path {self.db_cache_path}.")
+            self.cache.flush()
+            self.cache_changed = False
+            return
         # check if the cache was updated by other processes
         if self._read_cache_version() == self.cache_version:
             # no updates: store and update version
@@ -359,6 +530,10 @@ class ClocqRetriever:
 
     def reset_cache(self):
         """Reset the cache for new population."""
+        if self.cache_backend == "sqlite":
+            self.logger.warn(f"Resetting ER cache at path {self.db_cache_path}.")
+            self.cache.clear()
+            return
         self.logger.warn(f"Resetting ER cache at path {self.cache_path}.")
         # with FileLock(f"{self.cache_path}.lock"):
         self.cache = {}
@@ -382,6 +557,21 @@ class ClocqRetriever:
             self._write_cache(self.cache)
             self._write_cache_version()
 
+    def _init_db_cache(self):
+        """
+        Initialize the cache in the key-value store.
+        Entries are looked up on demand, so that startup does not depend on the size of the cache.
+        An existing pickle cache is imported when the store is created.
+        """
+        self.db_cache_path = os.path.join(self.config["path_to_data"], self.config["benchmark"], self.config["er_cache_db_path"])
+        is_new = not os.path.isfile(self.db_cache_path)
+        self.logger.info(f"Opening ER cache at path {self.db_cache_path}.")
+        self.cache = SqliteStore(self.db_cache_path)
+        if is_new and os.path.isfile(self.cache_path):
+            self.logger.info(f"Importing ER cache from path {self.cache_path}.")
+            self.cache.update(self._read_cache())
+            self.logger.info(f"ER cache successfully imported.")
+
     def _read_cache(self):
         """
         Read the current version of the cache.
@@ -417,3 +607,23 @@ class ClocqRetriever:
             version = str(time.time())
             fp.write(version)
         self.cache_version = version
+
+
+def _merge_items(items, item_keys, new_items):
+    """Append the new items which are not in the items yet (item_keys holds the keys of the items)."""
+    for item in new_items:
+        key = _item_key(item)
+        if key not in item_keys:
+            item_keys.add(key)
+            items.append(item)
+
+
+def _item_key(item):
+    """Hashable key of the given item, equal for items that compare equal (e.g. dicts with the same entries)."""
+    if isinstance(item, dict):
+        return dict, frozenset((key, _item_key(value)) for key, value in item.items())
+    if isinstance(item, list):
+        return list, tuple(_item_key(value) for value in item)
+    if isinstance(item, tuple):
+        return tuple, tuple(_item_key(value) for value in item)
+    return item
@@ -0,0 +1,71 @@
+from collections import deque
+
+
+class AnchorMatcher:
+    """
+    Multi-pattern matcher (Aho-Corasick automaton) for the anchor texts of a Wikipedia page.
+    Built once per page, and finds the first occurrence of all anchor texts
+    in an evidence with a single scan over the evidence text.
+    """
+
+    def __init__(self, anchor_tuples):
+        # (anchor_text, anchor_path) in order of priority
+        self.anchor_tuples = [(text, path) for text, path in anchor_tuples if text]
+        self.lengths = [len(text) for text, _ in self.anchor_tuples]
+        # trie: transitions, failure links, anchor ending in node,
+        # and next node on the failure chain in which an anchor ends (0 for none)
+        self.goto = [dict()]
+        self.fail = [0]
+        self.output = [None]
+        self.output_link = [0]
+        for i, (text, _) in enumerate(self.anchor_tuples):
+            self._add(text, i)
+        self._build_links()
+
+    def find(self, text):
+        """
+        Anchors occurring in the given text, in order of priority.
+        Returns tuples of (anchor_text, anchor_path, start of first occurrence).
+        """
+        goto, fail, output, output_link, lengths = self.goto, self.fail, self.output, self.output_link, self.lengths
+        starts = dict()
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if output[node] is not None else output_link[node]
+            while match:
+                i = output[match]
+                if i not in starts:
+                    starts[i] = end - lengths[i]
+                match = output_link[match]
+        return [(*self.anchor_tuples[i], starts[i]) for i in sorted(starts)]
+
+    def _add(self, text, i):
+        node = 0
+        for char in text:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append(dict())
+                self.fail.append(0)
+                self.output.append(None)
+                self.output_link.append(0)
+            node = next_node
+        self.output[node] = i
+
+    def _build_links(self):
+        """Set failure links and output links (breadth-first)."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[child] = fail
+                self.output_link[child] = fail if self.output[fail] is not None else self.output_link[fail]
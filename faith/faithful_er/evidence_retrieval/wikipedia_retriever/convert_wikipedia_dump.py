@@ -0,0 +1,41 @@
+"""
+Convert a Wikipedia dump stored as a single pickle into a sharded dump,
+from which the WikipediaRetriever loads only the evidences of requested entities.
+
+Usage:
+    python faith/faithful_er/evidence_retrieval/wikipedia_retriever/convert_wikipedia_dump.py <PATH_TO_PICKLE_DUMP> <PATH_TO_SHARDED_DUMP> [<NUM_SHARDS>]
+
+Set `er_wikipedia_dump` in the config to the path of the sharded dump (relative to the data of the benchmark).
+"""
+import sys
+import time
+import pickle
+
+from faith.library.kv_store import ShardedStore
+
+
+def convert_wikipedia_dump(input_path, output_path, num_shards=16, batch_size=10000):
+    """Write all entities of the pickled dump to the sharded dump."""
+    with open(input_path, "rb") as fp:
+        wikipedia_dump = pickle.load(fp)
+    sharded_dump = ShardedStore(output_path, num_shards=num_shards, flush_size=batch_size)
+    for i, (entity_id, evidences) in enumerate(wikipedia_dump.items()):
+        sharded_dump[entity_id] = evidences
+        if (i + 1) % batch_size == 0:
+            print(f"Converted {i + 1} of {len(wikipedia_dump)} entities.")
+    sharded_dump.close()
+    return len(wikipedia_dump)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        raise Exception(
+            "Usage: python faith/faithful_er/evidence_retrieval/wikipedia_retriever/convert_wikipedia_dump.py <PATH_TO_PICKLE_DUMP> <PATH_TO_SHARDED_DUMP> [<NUM_SHARDS>]"
+        )
+    input_path = sys.argv[1]
+    output_path = sys.argv[2]
+    num_shards = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    start = time.time()
+    num_entities = convert_wikipedia_dump(input_path, output_path, num_shards)
+    print(f"Converted {num_entities} entities to {output_path} in {time.time() - start} seconds.")
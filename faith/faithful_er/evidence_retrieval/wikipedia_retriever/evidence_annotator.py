@@ -2,10 +2,15 @@ import os
 import json
 import pickle
 import logging
-import requests
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import faith.library.wikipedia_library as wiki
+from faith.library.utils import BackgroundLoader
+from faith.library.string_table import load_mapping
+from faith.library.transport import get_transport, MissingRecordingError
+from faith.faithful_er.evidence_retrieval.wikipedia_retriever.wikipedia_fetcher import get_wikipedia_fetcher
+from faith.faithful_er.evidence_retrieval.wikipedia_retriever.anchor_matcher import AnchorMatcher
 
 MAX_WIKI_PATHS_PER_REQ = 50
 
@@ -20,21 +25,35 @@ class EvidenceAnnotator:
 
     def __init__(self, config, wikidata_mappings, temporal_value_annotator):
         self.config = config
-        self.wikidata_mappings = wikidata_mappings
+        # mappings may still be loaded in the background
+        self._wikidata_mappings = wikidata_mappings
         self.temporal_value_annotator = temporal_value_annotator
         self.string_lib = self.temporal_value_annotator.library
         # reference time can be creation time
         self.reference_time = self.config["reference_time"]
         self.date_tag_method = self.config["evidence_date_tag_method"]
-        # open Wikidata labels
-        with open(config["path_to_labels"], "rb") as fp:
-            self.labels_dict = pickle.load(fp)
+        # open Wikidata labels (in the background)
+        self._labels_dict = BackgroundLoader(load_mapping, config["path_to_labels"])
+        # transport for recording/replaying requests to Wikipedia
+        self.transport = get_transport(config)
+        # pooled requests to Wikipedia
+        self.fetcher = get_wikipedia_fetcher(config)
 
         ## TODO: cache is currently never stored!
         # initialize cache
         self.path = f"cache/cache_wikipedia_to_wikidata.pickle"
         self._init_cache()
 
+    @property
+    def wikidata_mappings(self):
+        if isinstance(self._wikidata_mappings, BackgroundLoader):
+            return self._wikidata_mappings.get()
+        return self._wikidata_mappings
+
+    @property
+    def labels_dict(self):
+        return self._labels_dict.get()
+
     def annotate_wikidata_entities(self, wiki_path, evidences, doc_anchor_dict):
         """
         Add Wikidata entities, dates and potentially other constants to evidences.
@@ -42,6 +61,11 @@ class EvidenceAnnotator:
         # sort anchor-texts by their length
         doc_anchor_tuples = [(key, value) for key, value in doc_anchor_dict.items()]
         doc_anchor_tuples = sorted(doc_anchor_tuples, key=lambda y: len(y[0]), reverse=True)
+        ## do not consider wiki_paths with hashtags
+        # hashtag indicates a paragraph on entity, rather than entity
+        doc_anchor_tuples = [(key, value) for key, value in doc_anchor_tuples if not "#" in value]
+        # matcher for all anchor-texts of the page (built once)
+        anchor_matcher = AnchorMatcher(doc_anchor_tuples)
 
         new_evidences = list()
         # detect wikipedia entities and dates first
@@ -50,7 +74,7 @@ class EvidenceAnnotator:
             # detect wikipedia entities
             if not evidence.get("source") == "info":  # entities for infobox are already done
                 wiki_paths, disambiguations = self._detect_wikipedia_entities(
-                    wiki_path, evidence, doc_anchor_tuples
+                    wiki_path, evidence, anchor_matcher
                 )
                 evidence["wikipedia_paths"] = wiki_paths
                 evidence["wp_disambiguations"] = disambiguations
@@ -122,10 +146,10 @@ class EvidenceAnnotator:
             del evidence["wp_disambiguations"]
         return new_evidences
 
-    def _detect_wikipedia_entities(self, wiki_path, evidence, doc_anchor_tuples):
+    def _detect_wikipedia_entities(self, wiki_path, evidence, anchor_matcher):
         """
         Identify Wikipedia entities in the given evidence using
-        the given anchor dict for the Wikipedia page.
+        the anchor matcher for the Wikipedia page.
         Longer matches would be checked first.
         """
         # remember all anchor texts for prunings
@@ -134,32 +158,25 @@ class EvidenceAnnotator:
         evidence_text = evidence["evidence_text"]
 
         wikipedia_paths = list()
-        for anchor_text, anchor_path in doc_anchor_tuples:
-            if anchor_text in evidence_text:
-                ## do not consider wiki_paths with hashtags
-                # hashtag indicates a paragraph on entity, rather than entity
-                if "#" in anchor_path:
-                    continue
-
-                # search start and end points
-                new_start = evidence_text.find(anchor_text)
-                new_end = new_start + len(anchor_text)
-
-                ## detect duplicate match for substring
-                # positions must be inside range of [_start,_end]
-                # since anchor texts are sorted by length
-                duplicate = False
-                for _start, _end in finds:
-                    if new_start >= _start and new_start <= _end:
-                        duplicate = True
-                    elif new_end >= _start and new_end <= _end:
-                        duplicate = True
-
-                # if no duplicate match found -> new anchor
-                if not duplicate:
-                    finds.append((new_start, new_end))
-                    wikipedia_paths.append(anchor_path)
-                    disambiguations.append((anchor_text, anchor_path))
+        # anchor texts in the evidence (sorted by length), with start of first occurrence
+        for anchor_text, anchor_path, new_start in anchor_matcher.find(evidence_text):
+            new_end = new_start + len(anchor_text)
+
+            ## detect duplicate match for substring
+            # positions must be inside range of [_start,_end]
+            # since anchor texts are sorted by length
+            duplicate = False
+            for _start, _end in finds:
+                if new_start >= _start and new_start <= _end:
+                    duplicate = True
+                elif new_end >= _start and new_end <= _end:
+                    duplicate = True
+
+            # if no duplicate match found -> new anchor
+            if not duplicate:
+                finds.append((new_start, new_end))
+                wikipedia_paths.append(anchor_path)
+                disambiguations.append((anchor_text, anchor_path))
 
         # add path of Wikipedia page entity
         if not wiki_path in wikipedia_paths:
@@ -252,13 +269,19 @@ class EvidenceAnnotator:
 
         # limit for wiki_paths per request is 50
         start_index = 0
-        redirects = dict()
+        wiki_paths_batches = list()
         while start_index < len(wiki_paths):
             end_index = min(start_index + MAX_WIKI_PATHS_PER_REQ, len(wiki_paths) - 1)
-            wiki_paths_batch = wiki_paths[start_index:end_index]
-            new_redirects = self._extract_redirects_for_50(wiki_paths_batch)
-            redirects.update(new_redirects)
+            wiki_paths_batches.append(wiki_paths[start_index:end_index])
             start_index += MAX_WIKI_PATHS_PER_REQ
+
+        # requests for the batches are sent in parallel
+        redirects = dict()
+        if not wiki_paths_batches:
+            return redirects
+        with ThreadPoolExecutor(max_workers=len(wiki_paths_batches)) as executor:
+            for new_redirects in executor.map(self._extract_redirects_for_50, wiki_paths_batches):
+                redirects.update(new_redirects)
         return redirects
 
     def _extract_redirects_for_50(self, wiki_paths):
@@ -278,8 +301,8 @@ class EvidenceAnnotator:
             url = f"https://en.wikipedia.org/w/api.php?action=query&format=json&titles={wiki_paths_string}&redirects"
 
             # retrieve result
-            res = requests.get(url)
-            res_dict = json.loads(res.content)
+            content = self.transport.call("wikipedia_redirects", url, self.fetcher.get_content, url)
+            res_dict = json.loads(content)
 
             ## result has mappings:
             #   normalized: wiki_path -> wiki_title
@@ -307,6 +330,8 @@ class EvidenceAnnotator:
                 # add entry
                 redirects[key] = redirect["to"]
 
+        except MissingRecordingError:
+            raise
         # catch exception and log problem
         except Exception as e:
             print(f"Error catched for url: {url}")
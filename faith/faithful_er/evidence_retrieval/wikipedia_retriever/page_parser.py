@@ -0,0 +1,206 @@
+"""
+Single-pass parser for Wikipedia pages.
+Extracts the anchors (text -> Wikipedia path) and the infobox of the page
+in one streaming pass over the HTML, without building a DOM.
+Navigation bars (div.navbox) are skipped entirely.
+"""
+import re
+from html.parser import HTMLParser
+
+import faith.library.wikipedia_library as wiki
+
+# elements without content (never opened, end tags are ignored)
+VOID_ELEMENTS = frozenset([
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link",
+    "menuitem", "meta", "param", "source", "track", "wbr", "basefont", "bgsound",
+    "command", "frame", "image", "isindex", "nextid", "spacer",
+])
+# elements with raw text content (not part of the text of anchors)
+RAW_TEXT_ELEMENTS = frozenset(["script", "style"])
+# elements in which whitespace is preserved
+PRESERVE_WHITESPACE_ELEMENTS = frozenset(["pre", "textarea"])
+ASCII_SPACES = frozenset(" \n\t\x0c\r")
+# characters which are escaped as entity references in the HTML of the infobox
+ESCAPED_CHARACTERS = re.compile(r"[&<>]")
+
+
+class WikipediaPageParser(HTMLParser):
+    """
+    Extracts the anchors and the infobox of a Wikipedia page.
+    The events of the (first) infobox are recorded, and replayed
+    into an InfoboxParser once the anchors of the whole page are known.
+    Unclosed elements are closed by the end tag of an enclosing element,
+    and end tags without open element are ignored.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        # stack of open elements: (tag, anchor)
+        self._stack = []
+        self._open_anchors = []
+        self._navbox_level = None
+        self._infobox_level = None
+        self._infobox_done = False
+        # text since the last tag
+        self._text = []
+        # text of the infobox since the last recorded event
+        self._infobox_text = []
+
+        # anchors in document order: (href, text fragments)
+        self.anchors = []
+        # events of the infobox: (handler, args)
+        self.infobox_events = []
+
+    def parse(self, page_html):
+        """Parse the given HTML of the page."""
+        self.feed(page_html)
+        self.close()
+        return self
+
+    def close(self):
+        HTMLParser.close(self)
+        # close all open elements
+        self._flush_text()
+        self._pop(0)
+
+    def get_anchor_dict(self):
+        """
+        Dictionary that maps from anchor text to the Wikipedia entity (=path).
+        For duplicate anchor texts, the first anchor is kept
+        -> later ones can be more specific/incorrect
+        """
+        anchor_dict = dict()
+        for href, fragments in self.anchors:
+            text = "".join(fragments).strip()
+            if len(text) < 3:
+                continue
+            if anchor_dict.get(text):
+                continue
+            if not wiki.is_wikipedia_path(href):
+                continue
+            anchor_dict[text] = wiki.format_wiki_path(href)
+        return anchor_dict
+
+    def has_infobox(self):
+        return bool(self.infobox_events)
+
+    def replay_infobox(self, parser):
+        """Feed the events of the infobox into the given parser (e.g. InfoboxParser)."""
+        for handler, args in self.infobox_events:
+            getattr(parser, handler)(*args)
+        return parser
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if self._navbox_level is not None:
+            if tag not in VOID_ELEMENTS:
+                self._stack.append((tag, None))
+            return
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if tag == "div" and "navbox" in classes:
+            self._navbox_level = len(self._stack)
+            self._stack.append((tag, None))
+            return
+
+        if self._infobox_level is None and tag == "table" and "infobox" in classes and not self._infobox_done:
+            self._infobox_level = len(self._stack)
+        if self._infobox_level is not None:
+            self._record("handle_starttag", tag, list(attrs.items()))
+            if tag in VOID_ELEMENTS:
+                self._record("handle_endtag", tag)
+
+        if tag in VOID_ELEMENTS:
+            return
+        anchor = None
+        if tag == "a":
+            anchor = (attrs.get("href"), [])
+            self.anchors.append(anchor)
+            self._open_anchors.append(anchor)
+        self._stack.append((tag, anchor))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag in VOID_ELEMENTS:
+            return
+        # close the innermost open element with this tag (and all elements within)
+        for level in range(len(self._stack) - 1, -1, -1):
+            if self._stack[level][0] == tag:
+                self._pop(level)
+                return
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+        # comments separate the text of the infobox (but are dropped by the InfoboxParser)
+        if self._infobox_level is not None and self._navbox_level is None:
+            self._flush_infobox_text()
+
+    def _pop(self, level):
+        """Close all open elements from the given level on."""
+        for i in range(len(self._stack) - 1, level - 1, -1):
+            tag, anchor = self._stack[i]
+            in_navbox = self._navbox_level is not None and i >= self._navbox_level
+            if self._infobox_level is not None and i >= self._infobox_level and not in_navbox:
+                self._record("handle_endtag", tag)
+            if anchor is not None:
+                self._open_anchors.pop()
+        del self._stack[level:]
+        if self._navbox_level is not None and self._navbox_level >= level:
+            self._navbox_level = None
+        if self._infobox_level is not None and self._infobox_level >= level:
+            self._infobox_level = None
+            self._infobox_done = True
+
+    def _flush_text(self):
+        """
+        Add the text since the last tag to the open anchors and the infobox.
+        Text consisting of whitespace only is collapsed to a single space (or newline).
+        """
+        if not self._text:
+            return
+        text = "".join(self._text)
+        self._text = []
+        if self._navbox_level is not None:
+            return
+        if all(c in ASCII_SPACES for c in text) and not self._preserves_whitespace():
+            text = "\n" if "\n" in text else " "
+        in_raw_text = self._in_raw_text()
+        if not in_raw_text:
+            for _, fragments in self._open_anchors:
+                fragments.append(text)
+        if self._infobox_level is not None:
+            self._infobox_text.append((text, in_raw_text))
+
+    def _record(self, handler, *args):
+        """Record an event of the infobox."""
+        self._flush_infobox_text()
+        self.infobox_events.append((handler, args))
+
+    def _flush_infobox_text(self):
+        """
+        Record the text of the infobox since the last event.
+        In the HTML of the infobox, `&`, `<` and `>` are escaped as entity
+        references, which are separate events (dropped by the InfoboxParser).
+        """
+        if not self._infobox_text:
+            return
+        in_raw_text = self._infobox_text[0][1]
+        text = "".join(text for text, _ in self._infobox_text)
+        self._infobox_text = []
+        fragments = [text] if in_raw_text else ESCAPED_CHARACTERS.split(text)
+        for fragment in fragments:
+            if fragment:
+                self.infobox_events.append(("handle_data", (fragment,)))
+
+    def _in_raw_text(self):
+        return bool(self._stack) and self._stack[-1][0] in RAW_TEXT_ELEMENTS
+
+    def _preserves_whitespace(self):
+        return any(tag in PRESERVE_WHITESPACE_ELEMENTS for tag, _ in self._stack)
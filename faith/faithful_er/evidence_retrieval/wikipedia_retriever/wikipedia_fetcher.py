@@ -0,0 +1,55 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# fetchers shared by all modules of the process (per concurrency limit and timeout)
+_FETCHERS = dict()
+_FETCHERS_LOCK = threading.Lock()
+
+
+class WikipediaFetcher:
+    """
+    Fetch layer for requests to Wikipedia.
+    Requests share a session with keep-alive connections, the number of
+    concurrent requests is limited (across all threads of the process),
+    and each request has a timeout, so that a slow page can not stall retrieval.
+    """
+
+    def __init__(self, max_concurrency=16, timeout=10):
+        self.timeout = timeout
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_text(self, url):
+        """Retrieve the text of the page at the given url."""
+        return self._get(url).text
+
+    def get_json(self, url, params):
+        """Retrieve the JSON result of the API request."""
+        return self._get(url, params=params).json()
+
+    def get_content(self, url):
+        """Retrieve the content of the given url."""
+        return self._get(url).content
+
+    def _get(self, url, params=None):
+        with self.semaphore:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            # read the content while holding the connection
+            response.content
+        return response
+
+
+def get_wikipedia_fetcher(config):
+    """Fetcher for the given config (shared across modules)."""
+    max_concurrency = config.get("wikipedia_max_concurrency", 16)
+    timeout = config.get("wikipedia_timeout", 10)
+    with _FETCHERS_LOCK:
+        key = (max_concurrency, timeout)
+        if key not in _FETCHERS:
+            _FETCHERS[key] = WikipediaFetcher(max_concurrency, timeout)
+        return _FETCHERS[key]
@@ -1,16 +1,21 @@
 import os
 import re
-import requests
 import spacy
 import time
 import pickle
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from filelock import FileLock
-from bs4 import BeautifulSoup
 from urllib.parse import quote, unquote
 
-from faith.library.utils import get_config, get_logger
+from faith.library.utils import get_config, get_logger, BackgroundLoader
+from faith.library.string_table import load_mapping
+from faith.library import timing
+from faith.library.transport import get_transport, persistent_caches_enabled, MissingRecordingError
+from faith.library.kv_store import ShardedStore
+from faith.faithful_er.evidence_retrieval.wikipedia_retriever.wikipedia_fetcher import get_wikipedia_fetcher
+from faith.faithful_er.evidence_retrieval.wikipedia_retriever.page_parser import WikipediaPageParser
 import faith.library.wikipedia_library as wiki
 
 from faith.faithful_er.evidence_retrieval.wikipedia_retriever.text_parser import (
@@ -44,29 +49,59 @@ class WikipediaRetriever:
         self.logger = get_logger(__name__, config)
 
         # whether Wikipedia evidences are retrieved on the fly (i.e. from the Wikipedia API)
-        self.use_cache = config["er_wikipedia_use_cache"]
+        self.use_cache = config["er_wikipedia_use_cache"] and persistent_caches_enabled(config)
+        # transport for recording/replaying requests to Wikipedia
+        self.transport = get_transport(config)
+        # pooled requests to Wikipedia (shared with the evidence annotator)
+        self.fetcher = get_wikipedia_fetcher(config)
         self.on_the_fly = config["er_on_the_fly"]
         # # initialize dump
+        # dump and dicts are loaded in background threads, and awaited on first access
         if self.use_cache:
             self.path_to_dump = os.path.join(config["path_to_data"], config["benchmark"], self.config["er_wikipedia_dump"])
-            self._init_wikipedia_dump()
+            self._wikipedia_dump = BackgroundLoader(self._init_wikipedia_dump)
             self.dump_changed = False
 
         if self.on_the_fly:
-            # open dicts
-            with open(config["path_to_wikidata_mappings"], "rb") as fp:
-                self.wikidata_mappings = pickle.load(fp)
-            with open(config["path_to_wikipedia_mappings"], "rb") as fp:
-                self.wikipedia_mappings = pickle.load(fp)
+            # open dicts (memory-mapped if converted to string tables)
+            self._wikidata_mappings = BackgroundLoader(load_mapping, config["path_to_wikidata_mappings"])
+            self._wikipedia_mappings = BackgroundLoader(load_mapping, config["path_to_wikipedia_mappings"])
 
             # initialize evidence annotator (used for (text)->Wikipedia->Wikidata)
-            self.annotator = EvidenceAnnotator(config, self.wikidata_mappings, temporal_value_annotator)
+            self.annotator = EvidenceAnnotator(config, self._wikidata_mappings, temporal_value_annotator)
 
             # load nlp pipeline
             self.nlp = spacy.blank("en")
             self.nlp.add_pipe("sentencizer")
         self.logger.debug("WikipediaRetriever successfully initialized!")
 
+    def load(self):
+        """Wait until the dump and dicts loaded in the background are available."""
+        if self.use_cache:
+            self.wikipedia_dump
+        if self.on_the_fly:
+            self.wikidata_mappings
+            self.wikipedia_mappings
+            self.annotator.labels_dict
+
+    @property
+    def wikipedia_dump(self):
+        if isinstance(self._wikipedia_dump, BackgroundLoader):
+            self._wikipedia_dump = self._wikipedia_dump.get()
+        return self._wikipedia_dump
+
+    @wikipedia_dump.setter
+    def wikipedia_dump(self, wikipedia_dump):
+        self._wikipedia_dump = wikipedia_dump
+
+    @property
+    def wikidata_mappings(self):
+        return self._wikidata_mappings.get()
+
+    @property
+    def wikipedia_mappings(self):
+        return self._wikipedia_mappings.get()
+
     def retrieve_wp_evidences(self, question_entity):
         """
         Retrieve evidences from Wikipedia for the given Wikipedia title.
@@ -74,9 +109,11 @@ class WikipediaRetriever:
         Filtering is done via filter_evidences function.
         """
         question_entity_id = question_entity["id"]
-        if self.use_cache and question_entity_id in self.wikipedia_dump:
-            self.logger.debug(f"Found Wikipedia evidences in dump!")
-            return self.wikipedia_dump.get(question_entity_id)
+        if self.use_cache:
+            evidences = self.wikipedia_dump.get(question_entity_id)
+            if evidences is not None:
+                self.logger.debug(f"Found Wikipedia evidences in dump!")
+                return evidences
 
         if not self.on_the_fly:
             self.logger.debug(
@@ -97,24 +134,28 @@ class WikipediaRetriever:
         self.logger.debug(f"Retrieving Wikipedia evidences for: {wiki_path}.")
         self.dump_changed = True
 
-        # retrieve Wikipedia soup
+        # retrieve Wikipedia title
         wiki_title = wiki._wiki_path_to_title(wiki_path)
 
-        soup = self._retrieve_soup(wiki_title)
+        # retrieve Wikipedia html and markdown concurrently
+        with timing.span("wikipedia_fetch"):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                wiki_md_future = executor.submit(self._retrieve_markdown, wiki_title)
+                page_html = self._retrieve_html(wiki_title)
+                wiki_md = wiki_md_future.result()
 
-        if soup is None:
+        if page_html is None:
             if self.use_cache:
                 self.wikipedia_dump[question_entity_id] = []  # remember
             return []
 
-        # retrieve Wikipedia markdown
-        wiki_md = self._retrieve_markdown(wiki_title)
-
-        # extract anchors
-        doc_anchor_dict = self._build_document_anchor_dict(soup)
+        # extract anchors and infobox (single pass over the html)
+        with timing.span("wikipedia_parse"):
+            page = WikipediaPageParser().parse(page_html)
+        doc_anchor_dict = page.get_anchor_dict()
 
         # retrieve evidences
-        infobox_evidences = self._retrieve_infobox_entries(wiki_title, soup, doc_anchor_dict)
+        infobox_evidences = self._retrieve_infobox_entries(wiki_title, page, doc_anchor_dict)
         table_records = self._retrieve_table_records(wiki_title, wiki_md)
         text_snippets = self._retrieve_text_snippets(wiki_title, wiki_md)
 
@@ -127,7 +168,8 @@ class WikipediaRetriever:
 
         ## add wikidata entities (for table and text)
         # evidences with no wikidata entities (except for the wiki_path) are dropped
-        evidences = self.annotator.annotate_wikidata_entities(wiki_path, evidences, doc_anchor_dict)
+        with timing.span("wikipedia_annotation"):
+            evidences = self.annotator.annotate_wikidata_entities(wiki_path, evidences, doc_anchor_dict)
         evidences = self.filter_and_clean_evidences(evidences)
 
         # store result in dump
@@ -173,22 +215,17 @@ class WikipediaRetriever:
         evidence_text = re.sub(r"\[[0-9]*\]", "", evidence_text)
         return evidence_text
 
-    def _retrieve_infobox_entries(self, wiki_title, soup, doc_anchor_dict):
+    def _retrieve_infobox_entries(self, wiki_title, page, doc_anchor_dict):
         """
         Retrieve infobox entries for the given Wikipedia entity.
         """
         # get infobox (only one infobox possible)
-
-        infoboxes = soup.find_all("table", {"class": "infobox"})
-        if not infoboxes:
+        if not page.has_infobox():
             return []
-        infobox = infoboxes[0]
 
-        # print (infobox)
         # parse infobox content
         p = InfoboxParser(doc_anchor_dict)
-        infobox_html = str(infobox)
-        p.feed(infobox_html)
+        page.replay_infobox(p)
 
         # transform parsed infobox to evidences
         infobox_parsed = p.tables[0]
@@ -215,38 +252,6 @@ class WikipediaRetriever:
         evidences = extract_text_snippets(wiki_md, wiki_title, self.nlp)
         return evidences
 
-    def _build_document_anchor_dict(self, soup):
-        """
-        Establishes a dictionary that maps from Wikipedia text
-        to the Wikipedia entity (=link). Is used to map to
-        Wikidata entities (via Wikipedia) later.
-        Format: text -> Wikidata entity.
-        """
-        # prune navigation bar
-        for div in soup.find_all("div", {"class": "navbox"}):
-            div.decompose()
-
-        # go through links
-        anchor_dict = dict()
-        for tag in soup.find_all("a"):
-            # anchor text
-            text = tag.text.strip()
-            if len(text) < 3:
-                continue
-            # duplicate anchor text (keep first)
-            # -> later ones can be more specific/incorrect
-            if anchor_dict.get(text):
-                continue
-
-            # wiki title (=entity)
-            href = tag.attrs.get("href")
-            if not wiki.is_wikipedia_path(href):
-                continue
-            wiki_path = wiki.format_wiki_path(href)
-
-            anchor_dict[text] = wiki_path
-        return anchor_dict
-
     def safequote(self, string):
         """
         Try to UTF-8 encode and percent-quote string
@@ -270,7 +275,7 @@ class WikipediaRetriever:
 
         return qry
 
-    def _retrieve_soup(self, wiki_title):
+    def _retrieve_html(self, wiki_title):
         """
         Retrieve Wikipedia html for the given Wikipedia Title.
         """
@@ -278,11 +283,13 @@ class WikipediaRetriever:
         link = f"https://en.wikipedia.org/wiki/{wiki_path}"
 
         try:
-            page = requests.get(link)
-            soup = BeautifulSoup(page.text, features="html.parser")
+            page_html = self.transport.call("wikipedia_html", link, self.fetcher.get_text, link)
+        except MissingRecordingError:
+            # incomplete archive: the page must not be remembered as missing
+            raise
         except:
             return None
-        return soup
+        return page_html
 
     def _retrieve_markdown(self, wiki_title):
         """
@@ -292,10 +299,11 @@ class WikipediaRetriever:
         params["titles"] = wiki_title
         try:
             # make request
-            r = requests.get(API_URL, params=params)
-            res = r.json()
+            res = self.transport.call("wikipedia_api", params, self.fetcher.get_json, API_URL, params)
             pages = res["query"]["pages"]
             page = list(pages.values())[0]
+        except MissingRecordingError:
+            raise
         except:
             return None
         return page
@@ -304,23 +312,30 @@ class WikipediaRetriever:
         """
         Initialize the Wikipedia dump. The consists of a mapping
         from Wikidata IDs to Wikipedia evidences in the expected format.
+        Dumps in a ".pickle" file are loaded as a whole, other paths are
+        sharded dumps (directories), from which evidences are loaded on demand.
+        Returns the dump.
         """
+        if self._is_sharded_dump():
+            self.logger.info(f"Opening sharded Wikipedia dump at path {self.path_to_dump}.")
+            return ShardedStore(self.path_to_dump, num_shards=self.config.get("er_wikipedia_dump_shards", 16))
         if os.path.isfile(self.path_to_dump):
             # remember version read initially
             self.logger.info(f"Loading Wikipedia dump from path {self.path_to_dump}.")
             with FileLock(f"{self.path_to_dump}.lock"):
                 self.dump_version = self._read_dump_version()
                 self.logger.debug(self.dump_version)
-                self.wikipedia_dump = self._read_dump()
+                wikipedia_dump = self._read_dump()
             self.logger.info(f"Wikipedia dump successfully loaded.")
         else:
             self.logger.info(
                 f"Could not find an existing Wikipedia dump at path {self.path_to_dump}."
             )
             self.logger.info("Populating Wikipedia dump from scratch!")
-            self.wikipedia_dump = {}
-            self._write_dump(self.wikipedia_dump)
+            wikipedia_dump = {}
+            self._write_dump(wikipedia_dump)
             self._write_dump_version()
+        return wikipedia_dump
 
     def store_dump(self):
         """Store the Wikipedia dumo to disk."""
@@ -328,6 +343,12 @@ class WikipediaRetriever:
             return
         if not self.dump_changed:  # store only if Wikipedia dump  changed
             return
+        if self._is_sharded_dump():
+            # write the new entities only
+            self.logger.info(f"Writing Wikipedia dump at path {self.path_to_dump}.")
+            self.wikipedia_dump.flush()
+            self.dump_changed = False
+            return
         # check if the Wikipedia dump  was updated by other processes
         if self._read_dump_version() == self.dump_version:
             # no updates: store and update version
@@ -347,6 +368,10 @@ class WikipediaRetriever:
                 self._write_dump(updated_dump)
                 self._write_dump_version()
 
+    def _is_sharded_dump(self):
+        """Whether the Wikipedia dump is sharded (or a single pickle file)."""
+        return not self.path_to_dump.endswith(".pickle")
+
     def _read_dump(self):
         """
         Read the current version of the dump.
@@ -8,6 +8,7 @@ import csv
 import numpy as np
 import os
 from faith.library.utils import get_logger
+from faith.library import timing
 from sentence_transformers.cross_encoder import CrossEncoder
 from sentence_transformers.cross_encoder.evaluation import CEBinaryClassificationEvaluator
 from sentence_transformers.readers import InputExample
@@ -101,32 +102,51 @@ class ESModel(torch.nn.Module):
         Retrieve the top-100 evidences among the retrieved ones,
         for the given AR.
         """
-        start = time.time()
-        if not evidences:
-            return evidences
-        mapping = {}
+        return self.inference_top_k_batch([query], [evidences], max_evidence)[0]
 
+    def inference_top_k_batch(self, queries, evidences_list, max_evidence):
+        """
+        Retrieve the top-100 evidences among the retrieved ones,
+        for each of the given ARs. The (query, evidence) pairs of all
+        ARs are scored in a single call of the cross-encoder.
+        """
+        start = time.time()
+        mappings = list()
         query_evidence_pairs = list()
         # query = truecase.get_true_case(query)
-        for evidence in evidences:
-            # remove noise in evidence texts
-            evidence_text = evidence["evidence_text"].replace("\n", " ").replace("\t", " ")
-            if evidence_text not in mapping:
-                mapping[evidence_text] = list()
-            mapping[evidence_text].append(evidence)
-        # Compute embedding for both lists
-        evidence_texts = list(mapping.keys())
-        top_evidences = list()
-        for evidence_text in evidence_texts:
-            query_evidence_pairs.append([query, evidence_text])
-
-        similarity_scores = self.model.predict(query_evidence_pairs)
-        sim_scores_argsort = reversed(np.argsort(similarity_scores))
-        scored_evidences = [query_evidence_pairs[idx] for idx in sim_scores_argsort][
-            : max_evidence
-        ]
-        for query, evidence_text in scored_evidences:
-            top_evidences += mapping[evidence_text]
+        for query, evidences in zip(queries, evidences_list):
+            mapping = {}
+            for evidence in evidences:
+                # remove noise in evidence texts
+                evidence_text = evidence["evidence_text"].replace("\n", " ").replace("\t", " ")
+                if evidence_text not in mapping:
+                    mapping[evidence_text] = list()
+                mapping[evidence_text].append(evidence)
+            mappings.append(mapping)
+            for evidence_text in mapping.keys():
+                query_evidence_pairs.append([query, evidence_text])
+        if not query_evidence_pairs:
+            return evidences_list
+
+        with timing.span("cross_encoder"):
+            similarity_scores = self.model.predict(query_evidence_pairs)
+        top_evidences_list = list()
+        offset = 0
+        for evidences, mapping in zip(evidences_list, mappings):
+            if not evidences:
+                top_evidences_list.append(evidences)
+                continue
+            pairs = query_evidence_pairs[offset:offset + len(mapping)]
+            scores = similarity_scores[offset:offset + len(mapping)]
+            offset += len(mapping)
+            sim_scores_argsort = reversed(np.argsort(scores))
+            scored_evidences = [pairs[idx] for idx in sim_scores_argsort][
+                : max_evidence
+            ]
+            top_evidences = list()
+            for query, evidence_text in scored_evidences:
+                top_evidences += mapping[evidence_text]
+            top_evidences_list.append(top_evidences)
         self.logger.info(f"Total time for inference: {time.time() - start} seconds")
 
-        return top_evidences
+        return top_evidences_list
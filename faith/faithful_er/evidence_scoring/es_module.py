@@ -42,6 +42,12 @@ class ESModule(FaithfulEvidenceRetrieval):
         top_evidences = self.bert_model.inference_top_k(query, evidences, max_evidence)
         return top_evidences
 
+    def get_top_evidences_batch(self, queries, evidences_list, max_evidence):
+        """Run inference on a batch of questions, scoring all evidences at once."""
+        # load Bert model (if required)
+        self._load()
+        return self.bert_model.inference_top_k_batch(queries, evidences_list, max_evidence)
+
     def _load(self):
         """Load the bert_model."""
         # only load if not already done so
@@ -3,7 +3,8 @@ import json
 import time
 from pathlib import Path
 from tqdm import tqdm
-from faith.library.utils import get_config, get_logger
+from concurrent.futures import ThreadPoolExecutor
+from faith.library.utils import get_config, get_logger, read_instances
 from faith.library.string_library import StringLibrary
 from faith.evaluation import answer_presence
 
@@ -75,23 +76,27 @@ class FaithfulEvidenceRetrieval:
                 print(len(retrieved_ids))
                 print(retrieved_ids[-1])
 
-        with open(output_path, "a") as fp:
-            for instance in tqdm(data):
-                ques_id = instance["Id"]
-                if ques_id in retrieved_ids:
-                    print(f"{ques_id}already retrieved")
-                    continue
-                print(f"Start retrieve {ques_id}")
-                evidences = self.er_inference_on_instance(instance, sources)
-                # answer presence
-                if "answers" not in instance:
-                    instance["answers"] = self.string_lib.format_answers(instance)
-                hit, answering_evidences = answer_presence(evidences, instance["answers"])
-                instance["answer_presence"] = hit
-                instance["answer_presence_per_src"] = {
-                    evidence["source"]: 1 for evidence in answering_evidences
-                }
+        # skip instances retrieved in a previous run
+        retrieved_ids = set(retrieved_ids)
+        data = [instance for instance in data if instance["Id"] not in retrieved_ids]
+
+        def _retrieve(instance):
+            print(f"Start retrieve {instance['Id']}")
+            evidences = self.er_inference_on_instance(instance, sources)
+            # answer presence
+            if "answers" not in instance:
+                instance["answers"] = self.string_lib.format_answers(instance)
+            hit, answering_evidences = answer_presence(evidences, instance["answers"])
+            instance["answer_presence"] = hit
+            instance["answer_presence_per_src"] = {
+                evidence["source"]: 1 for evidence in answering_evidences
+            }
+            return instance
 
+        # keep multiple CLOCQ requests in flight (instances are written in input order)
+        max_workers = self.config.get("clocq_max_in_flight", 8)
+        with open(output_path, "a") as fp, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for instance in tqdm(executor.map(_retrieve, data), total=len(data)):
                 # write instance to file
                 fp.write(json.dumps(instance))
                 fp.write("\n")
@@ -245,32 +250,30 @@ class FaithfulEvidenceRetrieval:
         total_source_num = {source: [] for source in sources}
         total_source_num.update({"all": []})
 
-        with open(results_path, "r") as fp:
-            data = json.load(fp)
-            for instance in tqdm(data):
-                source_to_evidence_num = {source: 0 for source in sources}
-                category_slot = [item.lower() for item in instance["Temporal question type"]]
+        for instance in tqdm(read_instances(results_path)):
+            source_to_evidence_num = {source: 0 for source in sources}
+            category_slot = [item.lower() for item in instance["Temporal question type"]]
 
-                for source in sources:
-                    total_source_num[source].append(source_to_evidence_num[source])
-                    total_source_num["all"].append(source_to_evidence_num[source])
+            for source in sources:
+                total_source_num[source].append(source_to_evidence_num[source])
+                total_source_num["all"].append(source_to_evidence_num[source])
 
-                hit = instance[f"answer_presence_{stage}"]
-                answer_presence_per_src = instance[f"answer_presence_per_src_{stage}"]
+            hit = instance[f"answer_presence_{stage}"]
+            answer_presence_per_src = instance[f"answer_presence_per_src_{stage}"]
 
-                category_to_ans_pres["all"] += [hit]
+            category_to_ans_pres["all"] += [hit]
 
-                for category in category_to_ans_pres.keys():
-                    if category in category_slot:
-                        category_to_ans_pres[category] += [hit]
+            for category in category_to_ans_pres.keys():
+                if category in category_slot:
+                    category_to_ans_pres[category] += [hit]
 
-                answer_presences += [hit]
+            answer_presences += [hit]
 
-                for src, ans_presence in answer_presence_per_src.items():
-                    source_to_ans_pres[src] += ans_presence
-                # aggregate overall answer presence for validation
-                if len(answer_presence_per_src.items()):
-                    source_to_ans_pres["all"] += 1
+            for src, ans_presence in answer_presence_per_src.items():
+                source_to_ans_pres[src] += ans_presence
+            # aggregate overall answer presence for validation
+            if len(answer_presence_per_src.items()):
+                source_to_ans_pres["all"] += 1
 
         # print results
         res_path = results_path.replace(".jsonl", f"-retrieval_{stage}.res")
@@ -402,42 +405,40 @@ class FaithfulEvidenceRetrieval:
         total_source_num = {source: [] for source in sources}
         total_source_num.update({"all": []})
 
-        with open(results_path, "r") as fp:
-            data = json.load(fp)
-            for instance in tqdm(data):
-                candidate_evidences = instance["candidate_evidences"]
-                source_to_evidence_num = {source: 0 for source in sources}
-                if type(instance["Temporal question type"]) != list:
-                    instance["Temporal question type"] = [instance["Temporal question type"]]
-                category_slot = [item.lower() for item in instance["Temporal question type"]]
-                # if "ordinal" in category_slot: continue
-                for evidence in candidate_evidences:
-                    source_to_evidence_num[evidence["source"]] += 1
+        for instance in tqdm(read_instances(results_path)):
+            candidate_evidences = instance["candidate_evidences"]
+            source_to_evidence_num = {source: 0 for source in sources}
+            if type(instance["Temporal question type"]) != list:
+                instance["Temporal question type"] = [instance["Temporal question type"]]
+            category_slot = [item.lower() for item in instance["Temporal question type"]]
+            # if "ordinal" in category_slot: continue
+            for evidence in candidate_evidences:
+                source_to_evidence_num[evidence["source"]] += 1
 
-                for source in sources:
-                    total_source_num[source].append(source_to_evidence_num[source])
-                    total_source_num["all"].append(source_to_evidence_num[source])
+            for source in sources:
+                total_source_num[source].append(source_to_evidence_num[source])
+                total_source_num["all"].append(source_to_evidence_num[source])
 
-                hit, answering_evidences = answer_presence(candidate_evidences, instance["answers"])
+            hit, answering_evidences = answer_presence(candidate_evidences, instance["answers"])
 
-                answer_presence_per_src = {
-                    evidence["source"]: 1 for evidence in answering_evidences
-                }
+            answer_presence_per_src = {
+                evidence["source"]: 1 for evidence in answering_evidences
+            }
 
-                category_to_ans_pres["all"] += [hit]
-                category_to_evi_num["all"] += [len(candidate_evidences)]
-                for category in category_to_ans_pres.keys():
-                    if category in category_slot:
-                        category_to_evi_num[category] += [len(candidate_evidences)]
-                        category_to_ans_pres[category] += [hit]
+            category_to_ans_pres["all"] += [hit]
+            category_to_evi_num["all"] += [len(candidate_evidences)]
+            for category in category_to_ans_pres.keys():
+                if category in category_slot:
+                    category_to_evi_num[category] += [len(candidate_evidences)]
+                    category_to_ans_pres[category] += [hit]
 
-                answer_presences += [hit]
+            answer_presences += [hit]
 
-                for src, ans_presence in answer_presence_per_src.items():
-                    source_to_ans_pres[src] += ans_presence
-                # aggregate overall answer presence for validation
-                if len(answer_presence_per_src.items()):
-                    source_to_ans_pres["all"] += 1
+            for src, ans_presence in answer_presence_per_src.items():
+                source_to_ans_pres[src] += ans_presence
+            # aggregate overall answer presence for validation
+            if len(answer_presence_per_src.items()):
+                source_to_ans_pres["all"] += 1
 
         # print results
         res_path = results_path.replace(".jsonl", "-retrieval.res")
@@ -1,5 +1,9 @@
+import copy
 import time
+from concurrent.futures import ThreadPoolExecutor
+
 from faith.library.utils import get_logger
+from faith.library import timing
 from faith.library.string_library import StringLibrary
 from faith.faithful_er.evidence_retrieval.clocq_er import ClocqRetriever
 from faith.faithful_er.evidence_pruning.pruning import EvidencePruning
@@ -14,57 +18,106 @@ class FER(FaithfulEvidenceRetrieval):
     Variant of the FER, which prunes and scores.
     """
 
-    def __init__(self, config):
+    def __init__(self, config, clocq=None, wiki_retriever=None):
         self.config = config
         self.logger = get_logger(__name__, config)
         self.string_lib = StringLibrary(config)
         self.temporal_value_annotator = TemporalValueAnnotator(config, self.string_lib)
-        self.evr = ClocqRetriever(config, self.temporal_value_annotator)
+        self.evr = ClocqRetriever(config, self.temporal_value_annotator, clocq, wiki_retriever)
         self.evp = EvidencePruning(config)
         self.evs = ESModule(config)
         self.faith_or_unfaith = self.config["faith_or_unfaith"]
         self.max_evidence = self.config["evs_max_evidences"]
+        # number of instances of a batch for which evidences are retrieved concurrently
+        self.er_batch_concurrency = self.config.get("er_batch_concurrency", 4)
+
+    def load(self):
+        """Load the evidence scoring model, and wait for the resources of the Wikipedia retriever."""
+        self.evs._load()
+        self.evr.wiki_retriever.load()
 
     def inference_on_instance(self, instance, sources=["kb", "text", "table", "info"]):
         """Retrieve candidate and prune for generating faithful evidences for TSF."""
+        self.retrieve_on_instance(instance, sources)
+        self.prune_and_score_on_instance(instance, sources)
+
+    def retrieve_on_instance(self, instance, sources=["kb", "text", "table", "info"]):
+        """Retrieve the initial candidate evidences for the TSF of the given instance."""
         start = time.time()
         self.logger.debug(f"Running ER")
-        tsf = instance["structured_temporal_form"]
-        # tsf is a dictionary
-        if isinstance(tsf, dict):
-            if "entity" in tsf and "relation" in tsf and "answer_type" in tsf:
-                entity = tsf["entity"].strip()
-                relation = tsf["relation"].strip()
-                answer_type = tsf["answer_type"].strip()
-                # for keeping the consistency with the paper, we add answer type for retrieval
-                query = f"{entity}{' '}{relation}{' '}{answer_type}"
-        else:
-            # when without TQU, the input is question itself
-            query = tsf
-
-        initial_evidences, question_entities = self.evr.retrieve_evidences(query, sources)
+        query = self._get_query(instance["structured_temporal_form"])
+        with timing.span("er"):
+            initial_evidences, question_entities = self.evr.retrieve_evidences(query, sources)
         instance["candidate_evidences"] = initial_evidences
         instance["question_entities"] = question_entities
         self.logger.debug(f"Time taken (ER): {time.time() - start} seconds")
         if "answers" not in instance:
             instance["answers"] = self.string_lib.format_answers(instance)
-        initial_hit, initial_answering_evidences = answer_presence(initial_evidences, instance["answers"])
-        instance["answer_presence_initial"] = initial_hit
-        instance["answer_presence_per_src_initial"] = {
-            evidence["source"]: 1 for evidence in initial_answering_evidences
-        }
+        self._set_initial_answer_presence(instance)
+
+    def restrict_to_sources(self, instance, sources):
+        """
+        Restrict the initial candidate evidences of the given instance to the given sources.
+        Returns a copy of the instance, with the same initial evidences as retrieving
+        with the given sources directly (evidences are deduplicated per source).
+        """
+        instance = copy.deepcopy(instance)
+        instance["candidate_evidences"] = [
+            evidence for evidence in instance["candidate_evidences"] if evidence["source"] in sources
+        ]
+        self._set_initial_answer_presence(instance)
+        return instance
 
+    def inference_on_instances(self, instances, sources=["kb", "text", "table", "info"]):
+        """
+        Retrieve candidate and prune for a batch of instances.
+        Evidences are retrieved concurrently (retrieval is I/O-bound),
+        and the evidences of all instances are scored in a single batch.
+        """
+        if len(instances) > 1 and self.er_batch_concurrency > 1:
+            max_workers = min(len(instances), self.er_batch_concurrency)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                retrieve = timing.in_current_span(lambda instance: self.retrieve_on_instance(instance, sources))
+                list(executor.map(retrieve, instances))
+        else:
+            for instance in instances:
+                self.retrieve_on_instance(instance, sources)
+        for instance in instances:
+            self._prune_on_instance(instance, sources)
+        queries = [self._get_query(instance["structured_temporal_form"]) for instance in instances]
+        evidences_list = [instance["candidate_evidences"] for instance in instances]
+        with timing.span("scoring"):
+            top_evidences_list = self.evs.get_top_evidences_batch(queries, evidences_list, self.max_evidence)
+        for instance, top_evidences in zip(instances, top_evidences_list):
+            self._set_top_evidences(instance, top_evidences)
+        return instances
+
+    def prune_and_score_on_instance(self, instance, sources=["kb", "text", "table", "info"]):
+        """Prune (if faith) and score the initial candidate evidences of the given instance."""
+        self._prune_on_instance(instance, sources)
+        query = self._get_query(instance["structured_temporal_form"])
+        # store the evidences with faithful tag
+        with timing.span("scoring"):
+            top_evidences = self.evs.get_top_evidences(query, instance["candidate_evidences"], self.max_evidence)
+        self._set_top_evidences(instance, top_evidences)
+
+    def _prune_on_instance(self, instance, sources):
+        """Prune the candidate evidences of the given instance (if faith)."""
+        start = time.time()
+        tsf = instance["structured_temporal_form"]
         if self.faith_or_unfaith == "faith":
-            pruned_evidences = self.evp.pruning_evidences(tsf, initial_evidences, sources)
+            with timing.span("pruning"):
+                pruned_evidences = self.evp.pruning_evidences(tsf, instance["candidate_evidences"], sources)
             pruned_hit, pruned_answering_evidences = answer_presence(pruned_evidences, instance["answers"])
             instance["answer_presence_pruning"] = pruned_hit
             instance["answer_presence_per_src_pruning"] = {
                 evidence["source"]: 1 for evidence in pruned_answering_evidences
             }
             instance["candidate_evidences"] = pruned_evidences
-        self.logger.debug(f"Time taken (ER, EP): {time.time() - start} seconds")
-        # store the evidences with faithful tag
-        top_evidences = self.evs.get_top_evidences(query, instance["candidate_evidences"], self.max_evidence)
+        self.logger.debug(f"Time taken (EP): {time.time() - start} seconds")
+
+    def _set_top_evidences(self, instance, top_evidences):
+        """Store the top evidences and their answer presence."""
         instance["candidate_evidences"] = top_evidences
         hit, answering_evidences = answer_presence(top_evidences, instance["answers"])
         instance["answer_presence"] = hit
@@ -72,6 +125,26 @@ class FER(FaithfulEvidenceRetrieval):
             evidence["source"]: 1 for evidence in answering_evidences
         }
 
+    def _set_initial_answer_presence(self, instance):
+        """Store the answer presence in the initial candidate evidences."""
+        initial_hit, initial_answering_evidences = answer_presence(instance["candidate_evidences"], instance["answers"])
+        instance["answer_presence_initial"] = initial_hit
+        instance["answer_presence_per_src_initial"] = {
+            evidence["source"]: 1 for evidence in initial_answering_evidences
+        }
+
+    def _get_query(self, tsf):
+        """Construct the retrieval query for the given TSF."""
+        # tsf is a dictionary
+        if isinstance(tsf, dict):
+            entity = tsf["entity"].strip()
+            relation = tsf["relation"].strip()
+            answer_type = tsf["answer_type"].strip()
+            # for keeping the consistency with the paper, we add answer type for retrieval
+            return f"{entity}{' '}{relation}{' '}{answer_type}"
+        # when without TQU, the input is question itself
+        return tsf
+
     def train(self, sources=["kb", "text", "table", "info"]):
         self.evs.train(sources=["kb", "text", "table", "info"])
 
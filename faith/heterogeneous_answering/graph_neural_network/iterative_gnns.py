@@ -10,6 +10,7 @@ import random
 from faith.heterogeneous_answering.graph_neural_network.graph_neural_network import GNNModule
 from faith.heterogeneous_answering.heterogeneous_answering import HeterogeneousAnswering
 from faith.library.utils import get_config, get_logger, store_json_with_mkdir
+from faith.library import timing
 
 SEED = 7
 START_DATE = time.strftime("%y-%m-%d_%H-%M", time.localtime())
@@ -144,7 +145,8 @@ class IterativeGNNs(HeterogeneousAnswering):
             res_str = f"Inference - Ans. pres. ({num_questions}): {answer_presence}"
             self.logger.info(res_str)
 
-            self.gnns[i].inference_on_instances(data)
+            with timing.span(f"gnn_iteration_{i + 1}"):
+                self.gnns[i].inference_on_instances(data)
 
         # remember top evidences
         # for turn_idx, instance in enumerate(turns):
@@ -158,6 +160,14 @@ class IterativeGNNs(HeterogeneousAnswering):
         self._log_results(data, sources)
         return data
 
+    def inference_on_instances(self, instances, sources=("kb", "text", "table", "info"), train=False):
+        """Run inference on the given instances, with batched forward passes in each iteration."""
+        self.load()
+        for i in range(len(self.config["gnn_inference"])):
+            with timing.span(f"gnn_iteration_{i + 1}"):
+                self.gnns[i].inference_on_instances(instances)
+        return instances
+
     def inference_on_instance(self, instance, sources=("kb", "text", "table", "info"), train=False):
 
         if not self.model_loaded:
@@ -165,7 +175,8 @@ class IterativeGNNs(HeterogeneousAnswering):
 
         """Run inference on a single instance."""
         for i in range(len(self.config["gnn_inference"])):
-            self.gnns[i].inference_on_instance(instance)
+            with timing.span(f"gnn_iteration_{i + 1}"):
+                self.gnns[i].inference_on_instance(instance)
         return instance
 
     def dev(self, sources=("kb", "text", "table", "info")):
@@ -5,7 +5,8 @@ import json
 from tqdm import tqdm
 from Levenshtein import distance as levenshtein_distance
 
-from faith.library.utils import store_json_with_mkdir, store_jsonl_with_mkdir, get_logger, get_result_logger, get_config
+from faith.library.utils import store_json_with_mkdir, store_jsonl_with_mkdir, get_logger, get_result_logger, get_config, \
+    read_instances
 
 class HeterogeneousAnswering:
     def __init__(self, config):
@@ -126,7 +127,17 @@ class HeterogeneousAnswering:
         self._log_results(input_data, sources)
        
 
-    def inference_on_instance(self, instance):
+    def load(self):
+        """Load the models of the HA (can be done upfront, e.g. before forking worker processes)."""
+        pass
+
+    def inference_on_instances(self, instances, sources=["kb", "text", "table", "info"]):
+        """Run HA on the given instances (without logging aggregated results)."""
+        for instance in instances:
+            self.inference_on_instance(instance, sources)
+        return instances
+
+    def inference_on_instance(self, instance, sources=["kb", "text", "table", "info"]):
         raise Exception(
             "This is an abstract function which should be overwritten in a derived class!"
         )
@@ -424,90 +435,49 @@ class HeterogeneousAnswering:
         category_to_h5 = {"ordinal": 0, "explicit": 0, "implicit": 0, "temp.ans": 0, "all": 0}
         category_to_mrr = {"ordinal": 0, "explicit": 0, "implicit": 0, "temp.ans": 0, "all": 0}
 
-        instance_remove_ordinal = []
-        # process data
-        with open(results_path, "r") as fp:
-            input_data = json.load(fp)
-
-            for instance in input_data:
-                # if "Ordinal" in instance["Temporal question type"]: continue
-                if type(instance["Temporal question type"]) != list:
-                    instance["Temporal question type"] = [instance["Temporal question type"]]
-                instance_remove_ordinal.append(instance)
+        # accumulate the metrics per category (the instances are streamed, not kept in memory)
+        metric_sums = {metric: {category: 0 for category in category_to_p1} for metric in ["p_at_1", "mrr", "h_at_5"]}
+        category_counts = {category: 0 for category in category_to_p1}
+        for instance in read_instances(results_path):
+            question_types = instance["Temporal question type"]
+            if type(question_types) != list:
+                question_types = [question_types]
+            question_types = [item.lower() for item in question_types]
+            for category in category_to_p1:
+                if category == "all" or category in question_types:
+                    category_counts[category] += 1
+                    for metric, sums in metric_sums.items():
+                        sums[category] += instance[metric]
 
         # compute results
+        num_questions = 0
         for category in category_to_p1:
-            if category == "all":
-                # drop ordinal type
-                p_at_1_list = [
-                    instance["p_at_1"]
-                    for instance in instance_remove_ordinal
-                ]
-                # p_at_1_list = [instance["p_at_1"] for instance in input_data]
-            else:
-
-                p_at_1_list = [
-                    instance["p_at_1"]
-                    for instance in instance_remove_ordinal
-                    if category in [item.lower() for item in instance["Temporal question type"]]
-                ]
-
-            if len(p_at_1_list) == 0: continue
-            p_at_1 = sum(p_at_1_list) / len(p_at_1_list)
-            p_at_1 = round(p_at_1, 3)
-            num_questions = len(p_at_1_list)
+            if category_counts[category] == 0: continue
+            num_questions = category_counts[category]
+            p_at_1 = round(metric_sums["p_at_1"][category] / num_questions, 3)
             # log result
             category_to_p1[category] = p_at_1
             res_str = f"Gold answers - {category} - {sources_str} - P@1 ({num_questions}): {p_at_1}"
             self.logger.info(res_str)
 
         for category in category_to_mrr:
-            # compute results
-            if category == "all":
-                mrr_list = [
-                    instance["mrr"]
-                    for instance in instance_remove_ordinal
-                ]
-            else:
-                mrr_list = [
-                    instance["mrr"]
-                    for instance in instance_remove_ordinal
-                    if category in [item.lower() for item in instance["Temporal question type"]]
-                ]
-
-            if len(mrr_list) == 0: continue
-            mrr = sum(mrr_list) / len(mrr_list)
-            mrr = round(mrr, 3)
+            if category_counts[category] == 0: continue
+            mrr = round(metric_sums["mrr"][category] / category_counts[category], 3)
             category_to_mrr[category] = mrr
             # log result
             res_str = f"Gold answers - {category} - {sources_str} - MRR ({num_questions}): {mrr}"
             self.logger.info(res_str)
 
         for category in category_to_h5:
-            if category == "all":
-                # compute results
-                hit_at_5_list = [
-                    instance["h_at_5"]
-                    for instance in instance_remove_ordinal
-
-                ]
-            else:
-                hit_at_5_list = [
-                    instance["h_at_5"]
-                    for instance in instance_remove_ordinal
-                    if category in [item.lower() for item in instance["Temporal question type"]]
-                ]
-
-            if len(hit_at_5_list) == 0: continue
-            hit_at_5 = sum(hit_at_5_list) / len(hit_at_5_list)
-            hit_at_5 = round(hit_at_5, 3)
+            if category_counts[category] == 0: continue
+            hit_at_5 = round(metric_sums["h_at_5"][category] / category_counts[category], 3)
             category_to_h5[category] = hit_at_5
             # log result
             res_str = f"Gold answers - {category} - {sources_str} - H@5 ({num_questions}): {hit_at_5}"
             self.logger.info(res_str)
 
         # print results
-        res_path = results_path.replace(".json", ".res")
+        res_path = f"{os.path.splitext(results_path)[0]}.res"
 
         with open(res_path, "w") as fp:
             fp.write(f"ha evaluation result:\n")
@@ -89,6 +89,10 @@ class Seq2SeqAnsweringModule(HeterogeneousAnswering):
                 del instance["question_entities"]
             return instance
 
+    def load(self):
+        """Load the HA model."""
+        self._load()
+
     def _load(self):
         """Load the HA model."""
         # only load if not already done so
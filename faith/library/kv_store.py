@@ -0,0 +1,194 @@
+import os
+import json
+import zlib
+import pickle
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class SqliteStore:
+    """
+    Persistent key-value store on top of sqlite3, with pickled values.
+    Supports point lookups without loading the whole store, and incremental
+    writes of new entries. The database runs in WAL mode, so that multiple
+    processes can read while another process writes.
+    New entries are buffered, and written in one transaction on `flush`
+    (or as soon as `flush_size` entries are pending), and on `close`.
+    With `raw=True`, values are bytes and stored as they are (without pickling).
+    """
+
+    def __init__(self, path, flush_size=100, timeout=60, raw=False):
+        self.path = path
+        self.flush_size = flush_size
+        self.timeout = timeout
+        self.raw = raw
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pending = dict()
+        Path(os.path.dirname(path) or ".").mkdir(parents=True, exist_ok=True)
+        connection = self._get_connection()
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+
+    def get(self, key, default=None):
+        """Return the value for the given key (or the default if not available)."""
+        with self.lock:
+            if key in self.pending:
+                return self.pending[key]
+        row = self._get_connection().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        if self.raw:
+            return bytes(row[0])
+        return pickle.loads(row[0])
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        with self.lock:
+            if key in self.pending:
+                return True
+        row = self._get_connection().execute("SELECT 1 FROM kv WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.pending[key] = value
+            flush = len(self.pending) >= self.flush_size
+        if flush:
+            self.flush()
+
+    def __len__(self):
+        self.flush()
+        return self._get_connection().execute("SELECT COUNT(*) FROM kv").fetchone()[0]
+
+    def update(self, entries):
+        """Add all entries of the given dictionary."""
+        with self.lock:
+            self.pending.update(entries)
+        self.flush()
+
+    def keys(self, prefix=""):
+        """Return the keys starting with the given prefix."""
+        self.flush()
+        rows = self._get_connection().execute(
+            "SELECT key FROM kv WHERE substr(key, 1, ?) = ? ORDER BY key", (len(prefix), prefix)
+        )
+        return [row[0] for row in rows]
+
+    def flush(self):
+        """Write the pending entries in a single transaction."""
+        with self.lock:
+            if not self.pending:
+                return
+            entries = [
+                (key, value if self.raw else pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+                for key, value in self.pending.items()
+            ]
+            self.pending = dict()
+        connection = self._get_connection()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", entries)
+
+    def close(self):
+        """Write the pending entries, and close the connection of the current thread."""
+        self.flush()
+        if getattr(self.local, "pid", None) == os.getpid():
+            self.local.connection.close()
+            self.local.pid = None
+
+    def clear(self):
+        """Drop all entries."""
+        with self.lock:
+            self.pending = dict()
+        connection = self._get_connection()
+        with connection:
+            connection.execute("DELETE FROM kv")
+
+    def _get_connection(self):
+        """Connection of the current thread (connections can not be shared across threads or forked processes)."""
+        pid = os.getpid()
+        if getattr(self.local, "pid", None) != pid:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            self.local.pid = pid
+        return self.local.connection
+
+
+# marks keys without entry in the store
+_MISSING = object()
+
+
+class ShardedStore:
+    """
+    Persistent key-value store, sharded over multiple sqlite databases in a directory.
+    Values are stored as compressed pickles (raw blobs), and only loaded when looked up.
+    The number of shards is fixed when the store is created (stored in `shards.json`).
+    """
+
+    def __init__(self, path, num_shards=16, flush_size=100):
+        self.path = path
+        Path(path).mkdir(parents=True, exist_ok=True)
+        metadata_path = os.path.join(path, "shards.json")
+        if os.path.isfile(metadata_path):
+            with open(metadata_path, "r") as fp:
+                metadata = json.load(fp)
+        else:
+            metadata = {"num_shards": num_shards, "raw": True}
+            with open(metadata_path, "w") as fp:
+                json.dump(metadata, fp)
+        # stores created before raw blobs were supported have pickled blobs
+        raw = metadata.get("raw", False)
+        self.shards = [
+            SqliteStore(os.path.join(path, f"shard_{i:03d}.db"), flush_size=flush_size, raw=raw)
+            for i in range(metadata["num_shards"])
+        ]
+
+    def get(self, key, default=None):
+        """Return the value for the given key (or the default if not available)."""
+        value = self._get_shard(key).get(key)
+        if value is None:
+            return default
+        return pickle.loads(zlib.decompress(value))
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self._get_shard(key)
+
+    def __setitem__(self, key, value):
+        self._get_shard(key)[key] = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def update(self, entries):
+        """Add all entries of the given dictionary."""
+        for key, value in entries.items():
+            self[key] = value
+        self.flush()
+
+    def flush(self):
+        """Write the pending entries of all shards."""
+        for shard in self.shards:
+            shard.flush()
+
+    def close(self):
+        """Write the pending entries, and close the connections of all shards."""
+        for shard in self.shards:
+            shard.close()
+
+    def _get_shard(self, key):
+        """Shard of the given key (stable across processes, unlike `hash`)."""
+        return self.shards[zlib.crc32(key.encode("utf-8")) % len(self.shards)]
@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+# config keys which do not affect the outputs of a run (logging, throughput, and caches)
+IGNORED_CONFIG_KEYS = {
+    # logging and bookkeeping
+    "log_level", "verbose", "run_manifest", "run_manifest_dir",
+    # streaming, batching and concurrency
+    "evaluate_stream", "evaluate_stream_window", "evaluate_async", "evaluate_async_concurrency",
+    "evaluate_async_queue_size", "evaluate_async_max_in_flight", "er_batch_concurrency", "clocq_max_in_flight",
+    "clocq_retry_backoff", "clocq_deadline", "wikipedia_max_concurrency", "wikipedia_timeout",
+    # recorded and replayed responses are identical to live ones (stubbed backends are not, see below)
+    "transport_mode", "transport_archive_path", "transport_replay_latency",
+    # pipeline server
+    "server_host", "server_port", "server_unix_socket", "server_max_batch_size", "server_max_wait",
+    "server_store_cache_every",
+    # caches (results are identical with and without cache)
+    "er_cache_backend", "er_cache_db_path", "er_kb_evidences_cache", "er_wikipedia_dump_shards",
+    "tvr_use_cache", "tvr_cache_path",
+}
+
+
+def config_fingerprint(config):
+    """Hash of the config keys which affect the outputs of the pipeline."""
+    relevant_config = {key: value for key, value in config.items() if key not in IGNORED_CONFIG_KEYS}
+    if config.get("transport_mode") == "stub":
+        # stubbed CLOCQ and Wikipedia change the outputs
+        relevant_config["transport_mode"] = "stub"
+    return hashlib.sha1(json.dumps(relevant_config, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class RunManifest:
+    """
+    Append-only manifest of a pipeline run, for resuming runs after a crash.
+    The manifest is identified by a hash of the (relevant) config,
+    the given run parameters, and the contents of the input files.
+    It records finished stages, and the question Ids finished within a stage,
+    together with the sizes of the stage outputs at that point.
+    """
+
+    def __init__(self, config, run_name, input_paths=(), **params):
+        self.config = config
+        self.run_name = run_name
+        self.run_key = self._compute_run_key(input_paths, params)
+        manifest_dir = config.get("run_manifest_dir", "_intermediate_representations/manifests")
+        self.manifest_path = os.path.join(manifest_dir, f"{run_name}_{self.run_key}.jsonl")
+        Path(manifest_dir).mkdir(parents=True, exist_ok=True)
+        # load the state of previous runs
+        self.finished_stages = set()
+        self.finished_ids = dict()
+        self.output_sizes = dict()
+        self._load()
+
+    def is_stage_done(self, stage):
+        """Check if the given stage was finished in a previous run."""
+        return stage in self.finished_stages
+
+    def mark_stage_done(self, stage):
+        """Record that the given stage is finished."""
+        self.finished_stages.add(stage)
+        self._append({"event": "stage_done", "stage": stage})
+
+    def prepare_outputs(self, stage, output_paths):
+        """
+        Prepare the (appended) outputs of the given stage for resuming.
+        Outputs are truncated to their size at the last recorded question,
+        which drops partially written instances. Returns the set of finished question Ids.
+        """
+        output_sizes = self.output_sizes.get(stage, dict())
+        for output_path in output_paths:
+            output_size = output_sizes.get(output_path, 0)
+            Path(os.path.dirname(output_path)).mkdir(parents=True, exist_ok=True)
+            if not os.path.exists(output_path) or os.path.getsize(output_path) < output_size:
+                # outputs were removed in the meantime: start from scratch
+                return self._reset_stage(stage, output_paths)
+            with open(output_path, "a") as fp:
+                fp.truncate(output_size)
+        return set(self.finished_ids.get(stage, set()))
+
+    def mark_questions_done(self, stage, ques_ids, output_paths):
+        """Record that the given questions are finished, and the current sizes of the outputs."""
+        output_sizes = {output_path: os.path.getsize(output_path) for output_path in output_paths}
+        self.finished_ids.setdefault(stage, set()).update(ques_ids)
+        self.output_sizes[stage] = output_sizes
+        self._append({"event": "questions_done", "stage": stage, "ids": list(ques_ids), "sizes": output_sizes})
+
+    def _reset_stage(self, stage, output_paths):
+        """Start the given stage from scratch."""
+        for output_path in output_paths:
+            open(output_path, "w").close()
+        self.finished_stages.discard(stage)
+        self.finished_ids[stage] = set()
+        self.output_sizes[stage] = dict()
+        self._append({"event": "stage_reset", "stage": stage})
+        return set()
+
+    def _load(self):
+        """Replay the events recorded in the manifest."""
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, "r") as fp:
+            for line in fp:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # last event was not written completely
+                    continue
+                stage = event["stage"]
+                if event["event"] == "stage_done":
+                    self.finished_stages.add(stage)
+                elif event["event"] == "questions_done":
+                    self.finished_ids.setdefault(stage, set()).update(event["ids"])
+                    self.output_sizes[stage] = event["sizes"]
+                elif event["event"] == "stage_reset":
+                    self.finished_stages.discard(stage)
+                    self.finished_ids[stage] = set()
+                    self.output_sizes[stage] = dict()
+
+    def _append(self, event):
+        """Append the event to the manifest."""
+        with open(self.manifest_path, "a") as fp:
+            fp.write(json.dumps(event))
+            fp.write("\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def _compute_run_key(self, input_paths, params):
+        """Hash of the relevant config, the run parameters and the input files."""
+        run_hash = hashlib.sha1()
+        run_hash.update(config_fingerprint(self.config).encode("utf-8"))
+        run_hash.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+        for input_path in input_paths:
+            with open(input_path, "rb") as fp:
+                for chunk in iter(lambda: fp.read(1 << 20), b""):
+                    run_hash.update(chunk)
+        return run_hash.hexdigest()[:16]
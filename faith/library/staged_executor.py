@@ -0,0 +1,109 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# marks the end of the input of a stage
+_END = object()
+
+
+class Stage:
+    """
+    A stage of the staged executor: a function applied to each item, with a limit on concurrent calls.
+    Functions which are not thread-safe (e.g. using models shared with other stages) are marked
+    as `exclusive`: all exclusive stages run on a single shared thread, one item at a time.
+    """
+
+    def __init__(self, name, function, concurrency=1, exclusive=False):
+        self.name = name
+        self.function = function
+        self.exclusive = exclusive
+        self.concurrency = 1 if exclusive else concurrency
+
+
+class StagedExecutor:
+    """
+    Run items through a sequence of stages, which are connected by bounded queues.
+    Each stage processes up to `concurrency` items at a time in its own thread pool,
+    so that different stages work on different items simultaneously (e.g. I/O-bound
+    retrieval for one question while another question is decoded). Bounded queues
+    provide backpressure, so that a slow stage does not accumulate unbounded input.
+    Results are passed to `on_done` in the order of the input items. At most `max_in_flight`
+    items are between input and `on_done`, so that results waiting for a slow earlier item
+    are bounded as well. Exclusive stages share a single thread.
+    """
+
+    def __init__(self, stages, queue_size=8, max_in_flight=None):
+        self.stages = stages
+        self.queue_size = queue_size
+        # by default, enough items to fill all queues and workers
+        if max_in_flight is None:
+            max_in_flight = queue_size * (len(stages) + 1) + sum(stage.concurrency for stage in stages)
+        self.max_in_flight = max_in_flight
+
+    def run(self, items, on_done):
+        """Run all items through the stages, and call `on_done` for each item in input order."""
+        asyncio.run(self._run(items, on_done))
+
+    async def _run(self, items, on_done):
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        # released when the result of an item is passed to `on_done`
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        exclusive_executor = ThreadPoolExecutor(max_workers=1)
+        executors = [
+            exclusive_executor if stage.exclusive else ThreadPoolExecutor(max_workers=stage.concurrency)
+            for stage in self.stages
+        ]
+        tasks = [asyncio.ensure_future(self._produce(items, queues[0], in_flight))]
+        for i, stage in enumerate(self.stages):
+            tasks.append(asyncio.ensure_future(self._run_stage(stage, executors[i], queues[i], queues[i + 1])))
+        tasks.append(asyncio.ensure_future(self._consume(queues[-1], on_done, in_flight)))
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # stop all other stages on failure
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            for executor in set(executors) | {exclusive_executor}:
+                executor.shutdown(wait=True)
+
+    async def _produce(self, items, output_queue, in_flight):
+        """Put the items (with their position) into the first queue."""
+        for index, item in enumerate(items):
+            await in_flight.acquire()
+            await output_queue.put((index, item))
+        await output_queue.put(_END)
+
+    async def _run_stage(self, stage, executor, input_queue, output_queue):
+        """Run `stage.concurrency` workers of the stage, and signal the end to the next stage."""
+        workers = [self._run_worker(stage, executor, input_queue, output_queue) for _ in range(stage.concurrency)]
+        await asyncio.gather(*workers)
+        await output_queue.put(_END)
+
+    async def _run_worker(self, stage, executor, input_queue, output_queue):
+        """Process items of the input queue until its end."""
+        loop = asyncio.get_running_loop()
+        while True:
+            entry = await input_queue.get()
+            if entry is _END:
+                # let the other workers of the stage know about the end as well
+                await input_queue.put(_END)
+                return
+            index, item = entry
+            result = await loop.run_in_executor(executor, stage.function, item)
+            await output_queue.put((index, result))
+
+    async def _consume(self, input_queue, on_done, in_flight):
+        """Pass the results to `on_done` in the order of the input items."""
+        pending = dict()
+        next_index = 0
+        while True:
+            entry = await input_queue.get()
+            if entry is _END:
+                break
+            index, result = entry
+            pending[index] = result
+            while next_index in pending:
+                on_done(pending.pop(next_index))
+                next_index += 1
+                in_flight.release()
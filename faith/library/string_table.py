@@ -0,0 +1,134 @@
+"""
+Read-only mapping from strings to values in a memory-mapped sorted string table.
+Used as a drop-in replacement for the large dicts of Wikidata/Wikipedia mappings and labels:
+opening takes milliseconds, and the pages are shared across processes via the page cache.
+
+Convert a pickled dict once:
+    python faith/library/string_table.py <PATH_TO_PICKLE> <PATH_TO_SST>
+
+File layout (little endian):
+    header: magic (8 bytes), version (uint32), value type (uint32), number of entries (uint64)
+    index:  offset of each record (uint64), sorted by the UTF-8 encoded keys
+    records: key length (uint32), value length (uint32), key, value
+"""
+import os
+import sys
+import mmap
+import time
+import pickle
+import struct
+
+from faith.library.utils import load_pickle
+
+MAGIC = b"FAITHSST"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQ")
+OFFSET = struct.Struct("<Q")
+RECORD = struct.Struct("<II")
+
+# values are UTF-8 encoded strings, or pickled objects
+VALUE_STR = 0
+VALUE_PICKLE = 1
+
+
+class StringTable:
+    """Read-only mapping backed by a memory-mapped sorted string table (supports `.get()` like a dict)."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fp:
+            self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.value_type, self.count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a string table (version {VERSION}): {path}")
+
+    def get(self, key, default=None):
+        """Return the value for the given key (or the default if not available)."""
+        offset = self._find(key)
+        if offset is None:
+            return default
+        key_length, value_length = RECORD.unpack_from(self.mm, offset)
+        start = offset + RECORD.size + key_length
+        value = self.mm[start:start + value_length]
+        if self.value_type == VALUE_STR:
+            return value.decode("utf-8")
+        return pickle.loads(value)
+
+    def __getitem__(self, key):
+        offset = self._find(key)
+        if offset is None:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, key):
+        """Offset of the record of the given key (binary search in the index), or None."""
+        if not isinstance(key, str):
+            return None
+        key = key.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = OFFSET.unpack_from(self.mm, HEADER.size + middle * OFFSET.size)[0]
+            key_length = RECORD.unpack_from(self.mm, offset)[0]
+            start = offset + RECORD.size
+            middle_key = self.mm[start:start + key_length]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return offset
+        return None
+
+
+def write_string_table(mapping, path):
+    """Write the given dict (with string keys) as sorted string table."""
+    keys = sorted((key.encode("utf-8"), key) for key in mapping)
+    value_type = VALUE_STR if all(isinstance(value, str) for value in mapping.values()) else VALUE_PICKLE
+
+    def _encode(value):
+        if value_type == VALUE_STR:
+            return value.encode("utf-8")
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(HEADER.pack(MAGIC, VERSION, value_type, len(keys)))
+        # index (records start after the index)
+        offset = HEADER.size + len(keys) * OFFSET.size
+        for encoded_key, key in keys:
+            fp.write(OFFSET.pack(offset))
+            offset += RECORD.size + len(encoded_key) + len(_encode(mapping[key]))
+        # records (values are encoded again, to not keep all of them in memory)
+        for encoded_key, key in keys:
+            value = _encode(mapping[key])
+            fp.write(RECORD.pack(len(encoded_key), len(value)))
+            fp.write(encoded_key)
+            fp.write(value)
+    # replace atomically, so that readers never see a partial table
+    os.replace(tmp_path, path)
+    return len(keys)
+
+
+def load_mapping(path):
+    """Load the mapping from the given path: string tables (".sst") are memory-mapped, other files unpickled."""
+    if path.endswith(".sst"):
+        return StringTable(path)
+    return load_pickle(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        raise Exception("Usage: python faith/library/string_table.py <PATH_TO_PICKLE> <PATH_TO_SST>")
+    input_path = sys.argv[1]
+    output_path = sys.argv[2]
+
+    start = time.time()
+    num_entries = write_string_table(load_pickle(input_path), output_path)
+    print(f"Converted {num_entries} entries to {output_path} in {time.time() - start} seconds.")
@@ -2,10 +2,12 @@ import json
 import requests
 
 class SutimeClient:
-	def __init__(self, host="localhost", port="7779"):
+	def __init__(self, host="localhost", port="7779", transport=None):
 		self.host = host
 		self.port = port
 		self.req = requests.Session()
+		# transport for recording/replaying requests (if given)
+		self.transport = transport
 
 	def sutime_annotation_normalization(self, string, reference_time = "2023-01-01"):
 		params = {"string": string, "reference_time": reference_time}
@@ -22,6 +24,8 @@ class SutimeClient:
 		return annotations
 
 	def _req(self, action, json):
+		if self.transport is not None:
+			return self.transport.call("sutime", [action, json], self.req.post, self.host + ":" + self.port + action, json=json)
 		return self.req.post(self.host + ":" + self.port + action, json=json)
 
 
@@ -3,6 +3,7 @@ from faith.library.temporal_annotator.regex_date_annotator import RegexpAnnotato
 from faith.library.temporal_annotator.ordinal_annotator import ordinal_annotation
 from faith.library.temporal_annotator.spacy_tokenizer import SpacyTokenizer
 from faith.library.utils import get_logger
+from faith.library.transport import get_transport
 from faith.library.temporal_annotator.sutime_date_annotator_client import SutimeClient
 
 class TemporalValueAnnotator:
@@ -10,7 +11,7 @@ class TemporalValueAnnotator:
         self.logger = get_logger(__name__, config)
         self.library = library
         # You could replace the server hostname and port according to your configuration
-        self.sutime = SutimeClient(host="http://localhost", port="7779")
+        self.sutime = SutimeClient(host="http://localhost", port="7779", transport=get_transport(config))
         self.regex = RegexpAnnotator(config, library)
         self.reference_time = config["reference_time"]
         self.tokenizer = SpacyTokenizer(config)
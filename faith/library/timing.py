@@ -0,0 +1,143 @@
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+from faith.library.utils import store_json_with_mkdir
+
+
+class TimingRegistry:
+    """
+    Central registry of the time taken in the individual steps of the pipeline.
+    Spans can be nested, and are identified by the names of all enclosing
+    spans (e.g. "tqu/tvr/fer/er"). Functions running in other threads are
+    wrapped with `in_current_span`, to be nested in the spans of the caller.
+    Only running aggregates and a bounded sample of the durations are kept
+    per span, so that the registry does not grow in long-running processes.
+    """
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stats = dict()
+        self.random = random.Random(0)
+
+    @contextmanager
+    def span(self, name):
+        """Measure the time taken within the context."""
+        stack = self._get_stack()
+        stack.append(name)
+        span_name = "/".join(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            self.record(span_name, duration)
+
+    def record(self, span_name, duration):
+        """Record the duration (in seconds) for the given span."""
+        with self.lock:
+            stats = self.stats.get(span_name)
+            if stats is None:
+                stats = self.stats[span_name] = {"count": 0, "total": 0.0, "max": 0.0, "samples": list()}
+            stats["count"] += 1
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+            # reservoir sampling: each duration is kept with the same probability
+            if len(stats["samples"]) < self.max_samples:
+                stats["samples"].append(duration)
+            else:
+                index = self.random.randrange(stats["count"])
+                if index < self.max_samples:
+                    stats["samples"][index] = duration
+
+    def report(self):
+        """
+        Statistics (count, total, mean, max, p50, p95, p99 in seconds) per span.
+        Percentiles are estimated from the sample, if there were more than `max_samples` calls.
+        """
+        with self.lock:
+            stats = {
+                span_name: (span_stats["count"], span_stats["total"], span_stats["max"], sorted(span_stats["samples"]))
+                for span_name, span_stats in self.stats.items()
+            }
+        report = dict()
+        for span_name in sorted(stats):
+            count, total, max_duration, samples = stats[span_name]
+            report[span_name] = {
+                "count": count,
+                "total": total,
+                "mean": total / count,
+                "max": max_duration,
+                "p50": _percentile(samples, 50),
+                "p95": _percentile(samples, 95),
+                "p99": _percentile(samples, 99),
+            }
+        return report
+
+    def dump(self, output_path):
+        """Store the report as JSON in the given path."""
+        report = self.report()
+        store_json_with_mkdir(report, output_path)
+        return report
+
+    def reset(self):
+        """Drop all recorded durations."""
+        with self.lock:
+            self.stats = dict()
+
+    def reset_after_fork(self):
+        """Start with an empty registry in a forked child process (spans of the parent are reported there)."""
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stats = dict()
+
+    def in_current_span(self, function):
+        """Wrap the function, to run it within the spans of the calling thread (e.g. in a thread pool)."""
+        stack = list(self._get_stack())
+
+        def run(*args, **kwargs):
+            previous_stack = getattr(self.local, "stack", None)
+            self.local.stack = list(stack)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.stack = previous_stack if previous_stack is not None else list()
+
+        return run
+
+    def _get_stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = list()
+        return self.local.stack
+
+
+def _percentile(sorted_values, percentile):
+    """Percentile of the sorted values (nearest-rank method)."""
+    index = max(0, -(-len(sorted_values) * percentile // 100) - 1)
+    return sorted_values[int(index)]
+
+
+# registry shared by all modules of the process
+TIMINGS = TimingRegistry()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=TIMINGS.reset_after_fork)
+
+
+def span(name):
+    """Measure the time taken within the context in the shared registry."""
+    return TIMINGS.span(name)
+
+
+def in_current_span(function):
+    """Wrap the function, to run it within the current spans of the shared registry."""
+    return TIMINGS.in_current_span(function)
+
+
+def dump_report(output_path):
+    """Store the report of the shared registry as JSON in the given path."""
+    return TIMINGS.dump(output_path)
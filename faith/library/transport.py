@@ -0,0 +1,121 @@
+import os
+import copy
+import json
+import time
+import zlib
+import pickle
+import threading
+
+from faith.library.kv_store import SqliteStore
+from faith.library.utils import get_logger
+
+# transports shared by all modules of the process (per mode and archive)
+_TRANSPORTS = dict()
+_TRANSPORTS_LOCK = threading.Lock()
+
+# responses of the stubbed CLOCQ and Wikipedia backends (nothing found)
+STUB_RESPONSES = {
+    "clocq_search_space": {"kb_item_tuple": [], "search_space": []},
+    "clocq_entity_linking": [],
+    "clocq_neighborhood": [],
+    "wikipedia_html": None,
+    "wikipedia_api": None,
+    "wikipedia_redirects": json.dumps({"query": {}}),
+}
+
+
+class MissingRecordingError(Exception):
+    """No response was recorded for a request (in replay mode)."""
+
+
+class RecordedError(Exception):
+    """A request which failed when it was recorded (raised again on replay)."""
+
+
+class Transport:
+    """
+    Transport for requests to external services (CLOCQ, Wikipedia, SUTime).
+    - "live": requests are sent to the services.
+    - "record": requests are sent to the services, and the responses (or failures) are stored in the archive.
+    - "replay": responses are served from the archive (with optional latency), without network access.
+      Requests without recorded response raise a MissingRecordingError.
+    - "stub": CLOCQ and Wikipedia are stubbed (nothing is found), e.g. to run the server or tests offline.
+      Persistent caches are not used in this mode (see `persistent_caches_enabled`).
+    The archive is a sqlite database with the compressed responses, indexed by service and request.
+    """
+
+    def __init__(self, config):
+        self.logger = get_logger(__name__, config)
+        self.mode = config.get("transport_mode", "live")
+        if self.mode not in ["live", "record", "replay", "stub"]:
+            raise ValueError(f"Unknown transport mode: {self.mode}")
+        # latency in seconds injected on replay (single value, or per service)
+        self.latency = config.get("transport_replay_latency", 0)
+        if self.mode in ["record", "replay"]:
+            archive_path = _get_archive_path(config)
+            self.logger.info(f"Using transport archive at {archive_path} in {self.mode} mode.")
+            # responses are written right away, so that the archive is complete if the run is interrupted
+            self.archive = SqliteStore(archive_path, flush_size=1)
+
+    def call(self, service, request, function, *args, **kwargs):
+        """
+        Return the response of the given service for the request,
+        by calling `function(*args, **kwargs)` (live/record) or from the archive (replay).
+        """
+        if self.mode == "live":
+            return function(*args, **kwargs)
+        if self.mode == "stub":
+            # other services (e.g. the local SUTime service) are not stubbed
+            if service not in STUB_RESPONSES:
+                return function(*args, **kwargs)
+            return copy.deepcopy(STUB_RESPONSES[service])
+        key = f"{service}|||{_request_key(request)}"
+        if self.mode == "record":
+            try:
+                response = function(*args, **kwargs)
+            except Exception as e:
+                # failed requests (e.g. missing Wikipedia pages) fail on replay as well
+                self.archive[key] = zlib.compress(pickle.dumps(RecordedError(repr(e)), protocol=pickle.HIGHEST_PROTOCOL))
+                raise
+            self.archive[key] = zlib.compress(pickle.dumps(response, protocol=pickle.HIGHEST_PROTOCOL))
+            return response
+        # replay
+        recorded = self.archive.get(key)
+        if recorded is None:
+            # never mistaken for a failed request (e.g. stored as empty result in caches)
+            self.logger.error(f"No recorded response for {service}: {request}")
+            raise MissingRecordingError(f"No recorded response for {service}: {request}")
+        latency = self.latency.get(service, 0) if isinstance(self.latency, dict) else self.latency
+        if latency:
+            time.sleep(latency)
+        response = pickle.loads(zlib.decompress(recorded))
+        if isinstance(response, RecordedError):
+            raise response
+        return response
+
+
+def persistent_caches_enabled(config):
+    """
+    Whether the persistent caches (ER cache, Wikipedia dump, TVR memo) are used.
+    Not with stubbed backends: their (empty) responses must not end up in the caches.
+    """
+    return config.get("transport_mode", "live") != "stub"
+
+
+def get_transport(config):
+    """Transport for the given config (shared across modules using the same archive)."""
+    mode = config.get("transport_mode", "live")
+    key = (mode, _get_archive_path(config) if mode in ["record", "replay"] else None)
+    with _TRANSPORTS_LOCK:
+        if key not in _TRANSPORTS:
+            _TRANSPORTS[key] = Transport(config)
+        return _TRANSPORTS[key]
+
+
+def _get_archive_path(config):
+    return os.path.join(config["path_to_data"], config["benchmark"], config["transport_archive_path"])
+
+
+def _request_key(request):
+    """Deterministic string representation of the given request."""
+    return json.dumps(request, sort_keys=True, default=str)
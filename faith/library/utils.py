@@ -2,8 +2,11 @@ import os
 import sys
 import yaml
 import json
+import pickle
 import logging
+import threading
 from pathlib import Path
+from concurrent.futures import Future
 
 def get_config(path):
     """Load the config dict from the given .yml file."""
@@ -31,6 +34,98 @@ def store_jsonl_with_mkdir(data, output_path, indent=False):
             fp.write("\n")
 
 
+def append_jsonl_with_mkdir(data, output_path):
+    """Append the JSON data to the given path, one instance per line."""
+    # create path if not exists
+    output_dir = os.path.dirname(output_path)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with open(output_path, "a") as fp:
+        for inst in data:
+            fp.write(json.dumps(inst))
+            fp.write("\n")
+
+
+def read_instances(input_path):
+    """
+    Iterate over the instances stored in the given path.
+    Supports both JSON files (a single list of instances)
+    and JSONL files (one instance per line).
+    """
+    with open(input_path, "r") as fp:
+        first_char = fp.read(1)
+        while first_char and first_char.isspace():
+            first_char = fp.read(1)
+        if first_char == "[":
+            for instance in _iterate_json_array(fp):
+                yield instance
+        else:
+            fp.seek(0)
+            for line in fp:
+                if not line.strip():
+                    continue
+                yield json.loads(line)
+
+
+def _iterate_json_array(fp, chunk_size=1 << 16):
+    """
+    Iterate over the elements of the JSON list in the given file, after the opening bracket.
+    The file is parsed incrementally, so that only one element is kept in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    end_of_file = False
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(","):
+            buffer = buffer[1:]
+            continue
+        if buffer.startswith("]"):
+            return
+        try:
+            instance, end = decoder.raw_decode(buffer)
+            # a value at the end of the buffer might be incomplete
+            complete = end < len(buffer) or end_of_file
+        except json.JSONDecodeError:
+            if end_of_file:
+                raise
+            complete = False
+        if complete:
+            yield instance
+            buffer = buffer[end:]
+            continue
+        chunk = fp.read(chunk_size)
+        end_of_file = not chunk
+        buffer += chunk
+
+
+def load_pickle(path):
+    """Load the pickled object from the given path."""
+    with open(path, "rb") as fp:
+        return pickle.load(fp)
+
+
+class BackgroundLoader:
+    """
+    Load a resource in a background thread.
+    `get` blocks until the resource is loaded, and raises any
+    exception that occurred while loading.
+    """
+
+    def __init__(self, function, *args):
+        self.future = Future()
+        thread = threading.Thread(target=self._load, args=(function, args), daemon=True)
+        thread.start()
+
+    def _load(self, function, args):
+        try:
+            self.future.set_result(function(*args))
+        except BaseException as e:
+            self.future.set_exception(e)
+
+    def get(self):
+        return self.future.result()
+
+
 def tsf_dic_to_string(tsf):
     if isinstance(tsf, dict):
         entity = tsf["entity"]
@@ -4,7 +4,16 @@ import json
 import time
 import copy
 import logging
-from faith.library.utils import get_config, get_logger, get_result_logger, store_json_with_mkdir
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from faith.library.utils import get_config, get_logger, get_result_logger, store_json_with_mkdir, store_jsonl_with_mkdir, \
+    append_jsonl_with_mkdir, read_instances
+from faith.library.run_manifest import RunManifest
+from faith.library.staged_executor import Stage, StagedExecutor
+from faith.library import timing
+from faith.pipeline_server import PipelineServer
 # tqu
 from faith.temporal_qu.seq2seq_tqu_iques import Seq2SeqIQUESTQU
 # fer
@@ -13,18 +22,25 @@ from faith.faithful_er.fer import FER
 from faith.heterogeneous_answering.graph_neural_network.iterative_gnns import IterativeGNNs
 from faith.heterogeneous_answering.seq2seq_answering.seq2seq_answering_module import Seq2SeqAnsweringModule
 
+
 class Pipeline:
-    def __init__(self, config):
-        """Create the pipeline based on the config."""
+    def __init__(self, config, clocq=None, wiki_retriever=None):
+        """
+        Create the pipeline based on the config.
+        CLOCQ and Wikipedia backends can be given to replace the ones
+        created from the config (e.g. stubs for running offline).
+        """
         # load config
         self.config = config
+        self.clocq = clocq
+        self.wiki_retriever = wiki_retriever
         self.logger = get_logger(__name__, config)
         self.result_logger = get_result_logger(config)
 
-        # load individual modules
-        self.fer = self._load_fer()
-        self.ha = self._load_ha()
-        self.tqu = self._load_tqu()
+        # individual modules are loaded on first use
+        self._fer = None
+        self._ha = None
+        self._tqu = None
         self.name = self.config["name"]
         self.benchmark = self.config["benchmark"]
         self.faith = self.config["faith_or_unfaith"]
@@ -32,12 +48,49 @@ class Pipeline:
         loggers = [logging.getLogger(name) for name in logging.root.manager.loggerDict]
         print("Loggers", loggers)
 
+    @property
+    def fer(self):
+        if self._fer is None:
+            self._fer = self._load_fer()
+        return self._fer
+
+    @fer.setter
+    def fer(self, fer):
+        self._fer = fer
+
+    @property
+    def ha(self):
+        if self._ha is None:
+            self._ha = self._load_ha()
+        return self._ha
+
+    @ha.setter
+    def ha(self, ha):
+        self._ha = ha
+
+    @property
+    def tqu(self):
+        if self._tqu is None:
+            self._tqu = self._load_tqu()
+        return self._tqu
+
+    @tqu.setter
+    def tqu(self, tqu):
+        self._tqu = tqu
+
     def train(self, sources_str, modules_to_train=("tqu", "fer", "ha")):
         """
         Please set run_tvr as False when training the models
         Train the given pipeline in the standard manner.
         """
         sources = sources_str.split("_")
+        # finished steps are skipped when resuming a run
+        input_dir = os.path.join(self.config["benchmark_path"], self.benchmark)
+        input_paths = [
+            os.path.join(input_dir, self.config["train_input_path"]),
+            os.path.join(input_dir, self.config["dev_input_path"]),
+        ]
+        manifest = self._get_manifest("train", input_paths, sources_str=sources_str)
 
         # Temporal Question Understanding (TQU)
         if "tqu" in modules_to_train:
@@ -45,25 +98,26 @@ class Pipeline:
             # Before fine-tuning Seq2seq model, please firstly generate annotated TSFs via distant supervision.
             step1_start = time.time()
             self.logger.info(f"Step1: Start training TQU seq2seq model for generating TSFs")
-            self.tqu.train()
+            self._run_stage(manifest, "tqu_train", lambda: self.tqu.train())
             self.logger.info(f"Time taken (Training TQU Model): {time.time() - step1_start} seconds")
 
             # Step2: Inference TSFs for train and dev sets using the fine-tuned Seq2seq model
             #        This step is required in both seq2seq and without TQU settings
             step2_start = time.time()
             self.logger.info(f"Step2: Start inference TSFs for train and dev sets")
-            self.tqu.inference()
+            self._run_stage(manifest, "tqu_inference", lambda: self.tqu.inference())
             self.logger.info(f"Time taken (Inference TSFs): {time.time() - step2_start} seconds")
             self.tqu = None  # free up memory
 
         # Faithful Evidence Retrieval and Scoring (ERS)
         if "fer" in modules_to_train:
             # Step3: Evidence Retrieval
+            # (resumes within the step, based on the questions already in the output)
             step3_start = time.time()
             self.logger.info(f"Step3: Start retrieving evidences of TSFs for train and dev sets")
-            self.fer.er_inference(sources)
+            self._run_stage(manifest, "fer_er", lambda: self.fer.er_inference(sources))
             # # store results in cache
-            self.fer.store_cache()
+            self.store_cache()
             self.logger.info(f"Time taken (Evidence Retrieval): {time.time() - step3_start} seconds")
             #
             # # Step4: Evidence Pruning
@@ -71,20 +125,20 @@ class Pipeline:
                  step4_start = time.time()
                  self.logger.info(
                      f"Step4: Start pruning evidences for train and dev sets")
-                 self.prune()
+                 self._run_stage(manifest, "fer_pruning", self.prune)
                  self.logger.info(f"Time taken (Evidence Pruning): {time.time() - step4_start} seconds")
 
             # Step5: Train evidence scoring model based on SBERT
             step5_start = time.time()
             self.logger.info(f"Step5: Start training evidence scoring model")
-            self.fer.train()
+            self._run_stage(manifest, "fer_es_train", lambda: self.fer.train())
             self.logger.info(f"Time taken (Train Evidence Scoring Model): {time.time() - step5_start} seconds")
 
             # Step6: Scoring evidence and select top-100 evidence as the input for training HA model
             step6_start = time.time()
             self.logger.info(
                 f"Step6: Start scoring evidence")
-            self.fer.evs_inference()
+            self._run_stage(manifest, "fer_es_inference", lambda: self.fer.evs_inference())
             self.logger.info(f"Time taken (Scoring Evidence): {time.time() - step6_start} seconds")
             self.fer = None  # free up memory
 
@@ -93,7 +147,7 @@ class Pipeline:
             # Step7: Train HA model
             step7_start = time.time()
             self.logger.info(f"Step7: Start train HA model")
-            self.ha.train(sources)
+            self._run_stage(manifest, "ha_train", lambda: self.ha.train(sources))
             self.logger.info(f"Time taken (Training HA model): {time.time() - step7_start} seconds")
 
     def source_combinations(self, dev=False):
@@ -113,7 +167,82 @@ class Pipeline:
             "text_info",
             "table_info",
         ]
-        self.evaluate(dev=dev, clean_up=False, sources_str=source_combinations)
+        if self.config.get("source_combinations_sweep"):
+            # retrieve once with all sources, and derive the source combinations
+            self.evaluate_sweep(dev=dev, source_combinations=source_combinations)
+        else:
+            self.evaluate(dev=dev, clean_up=False, sources_str=source_combinations)
+
+    def evaluate_sweep(self, dev=False, source_combinations=["kb_text_table_info"], tvr_top_answer=None):
+        """
+        Evaluate the pipeline for several source combinations at once.
+        TQU and ER are run only once with all sources, and the evidences for
+        each source combination are derived by filtering on the source of evidences,
+        before running pruning, scoring and HA for the combination.
+        Note that the TVR (for implicit questions) always makes use of all sources.
+        """
+        if tvr_top_answer is None:
+            tvr_top_answer = self.config.get("tvr_topk_answer", 1)
+        all_sources = ["kb", "text", "table", "info"]
+        window_size = self.config.get("evaluate_stream_window", 10)
+        input_path = self._get_input_path(dev)
+
+        # define output paths: TQU results are shared by all combinations
+        tqu_output_path = self._get_stream_output_paths(self._get_output_prefix("kb_text_table_info", dev, tvr_top_answer))[0]
+        output_paths = [tqu_output_path]
+        combination_output_paths = dict()
+        for sources_str in source_combinations:
+            output_prefix = self._get_output_prefix(sources_str, dev, tvr_top_answer)
+            _, fer_output_path, ha_output_path = self._get_stream_output_paths(output_prefix)
+            output_paths += [fer_output_path, ha_output_path]
+            combination_output_paths[sources_str] = (fer_output_path, ha_output_path)
+
+        manifest = self._get_manifest("evaluate_sweep", [input_path], dev=dev, source_combinations=source_combinations,
+                                      tvr_top_answer=tvr_top_answer)
+        instances = read_instances(input_path)
+        if manifest is None:
+            # outputs are appended: start from empty files
+            for output_path in output_paths:
+                store_jsonl_with_mkdir([], output_path)
+        elif manifest.is_stage_done("evaluate"):
+            self.logger.info(f"Skipping sweep: outputs already complete")
+            instances = []
+        else:
+            finished_ids = manifest.prepare_outputs("evaluate", output_paths)
+            instances = (instance for instance in instances if instance["Id"] not in finished_ids)
+
+        start = time.time()
+        num_questions = 0
+        for window in self._stream_windows(instances, window_size):
+            # run TQU and ER once with all sources
+            self.tqu.inference_on_instances(window, tvr_top_answer, all_sources)
+            append_jsonl_with_mkdir(window, tqu_output_path)
+            for instance in window:
+                self.fer.retrieve_on_instance(instance, all_sources)
+
+            # prune, score and answer per source combination
+            for sources_str in source_combinations:
+                sources = sources_str.split("_")
+                fer_output_path, ha_output_path = combination_output_paths[sources_str]
+                combination_window = [self.fer.restrict_to_sources(instance, sources) for instance in window]
+                for instance in combination_window:
+                    self.fer.prune_and_score_on_instance(instance, sources)
+                append_jsonl_with_mkdir(combination_window, fer_output_path)
+                self.ha.inference_on_instances(combination_window, sources)
+                append_jsonl_with_mkdir(combination_window, ha_output_path)
+
+            if manifest is not None:
+                manifest.mark_questions_done("evaluate", [instance["Id"] for instance in window], output_paths)
+            num_questions += len(window)
+            self.logger.info(f"Processed {num_questions} questions in {time.time() - start} seconds")
+        self.store_cache()
+        if manifest is not None:
+            manifest.mark_stage_done("evaluate")
+
+        # compute metrics per source combination
+        for sources_str in source_combinations:
+            fer_output_path, ha_output_path = combination_output_paths[sources_str]
+            self._compute_stream_metrics((tqu_output_path, fer_output_path, ha_output_path), sources_str)
 
     def top_answer_for_tvr(self, top_answers, dev=False):
         """
@@ -122,55 +251,28 @@ class Pipeline:
         self.evaluate_tvr(dev=dev, clean_up=False, top_answers=top_answers)
 
     def evaluate_tvr(self, dev=False, clean_up=False, top_answers=[1], sources_str="kb_text_table_info"):
-        # data path
-        benchmark_path = self.config["benchmark_path"]
-        input_dir = os.path.join(benchmark_path, self.benchmark)
-        evs_max_evidences = self.config["evs_max_evidences"]
-        # either use given option, or from config
-        ha = self.config["ha"]
-        tqu_oracle_temporal_category = "no-oracle-category"
-        tqu_oracle_temporal_value = "no-oracle-value"
-        if "tqu_oracle_temporal_category" in self.config and self.config["tqu_oracle_temporal_category"]:
-            tqu_oracle_temporal_category = "oracle-category"
-        if "tqu_oracle_temporal_value" in self.config and self.config["tqu_oracle_temporal_value"]:
-            tqu_oracle_temporal_value = "oracle-value"
-
-        run_tvr = "tvr"
-        if not self.config["run_tvr"]:
-            run_tvr = "no_tvr"
-        # either use given option, or from config
-        ha = self.config["ha"]
-        if ha == "seq2seq_ha":
-            gnn_max_evidences = ''
-        else:
-            gnn_max_evidences = []
-            for i in range(len(self.config["gnn_inference"])):
-                gnn_max_evidences.append(str(self.config["gnn_inference"][i]["gnn_max_evidences"]))
-
-            gnn_max_evidences = '_'.join(gnn_max_evidences)
-
+        if self.config.get("evaluate_stream") or self.config.get("run_manifest"):
+            # evaluate the pipeline question by question (required for resuming runs)
+            for tvr_top_answer in top_answers:
+                self.evaluate_stream(dev=dev, sources_str=sources_str, tvr_top_answer=tvr_top_answer,
+                                     fer_metrics=False)
+            return
+
+        input_path = self._get_input_path(dev)
         for tvr_top_answer in top_answers:
-            if dev:
-                input_path = os.path.join(input_dir, self.config["dev_input_path"])
-            else:
-                input_path = os.path.join(input_dir, self.config["test_input_path"])
-
             with open(input_path, "r") as fp:
                 data = json.load(fp)
 
             # run inference on data
             sources = sources_str.split("_")
             # define output path
-            output_dir = self.set_output_dir(sources_str)
+            output_prefix = self._get_output_prefix(sources_str, dev, tvr_top_answer)
             # tqu inference
             self.tqu.inference_on_data(data, tvr_top_answer, sources)
 
             if clean_up:
                 self.tqu = None  # free up memory
-            if dev:
-                output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_dev_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_tqu.json"
-            else:
-                output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_test_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_tqu.json"
+            output_path = f"{output_prefix}_tqu.json"
             store_json_with_mkdir(data, output_path)
 
             with open(output_path, "r") as fp:
@@ -180,27 +282,19 @@ class Pipeline:
 
             self.fer.inference_on_data(input_data, sources)
 
-            if dev:
-                fer_output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_dev_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_ers.jsonl"
-            else:
-                fer_output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_test_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_ers.jsonl"
-
+            fer_output_path = f"{output_prefix}_ers.jsonl"
             store_json_with_mkdir(input_data, fer_output_path)
 
             with open(fer_output_path, "r") as fp:
                 input_data = json.load(fp)
             self.ha.inference_on_data(input_data, sources)
-            if dev:
-                ha_output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_dev_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_gold_answers.json"
-            else:
-                ha_output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_test_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_gold_answers.json"
-
+            ha_output_path = f"{output_prefix}_gold_answers.json"
             store_json_with_mkdir(input_data, ha_output_path)
 
             # evaluate performance of ha results
             self.compute_ha_metrics(ha_output_path, sources_str)
         # store the cache
-        self.fer.store_cache()
+        self.store_cache()
 
     def compute_ha_metrics(self, ha_output_path, sources_str="kb_text_table_info"):
         # compute results
@@ -210,45 +304,21 @@ class Pipeline:
         self.fer.evaluate_retrieval_results_res_stage(fer_output_path, stage=stage)
 
     def evaluate(self, dev=False, clean_up=False, sources_str="kb_text_table_info"):
+        if self.config.get("evaluate_stream") or self.config.get("run_manifest"):
+            # evaluate the pipeline question by question (required for resuming runs)
+            return self.evaluate_stream(dev=dev, sources_str=sources_str)
+
         # define output path
         if not isinstance(sources_str, list):
             source_combinations = [sources_str]
         else:
             source_combinations = sources_str
 
-        # data path
-        benchmark_path = self.config["benchmark_path"]
-        input_dir = os.path.join(benchmark_path, self.benchmark)
-        evs_max_evidences = self.config["evs_max_evidences"]
-        # either use given option, or from config
-        tqu_oracle_temporal_category = "no-oracle-category"
-        tqu_oracle_temporal_value = "no-oracle-value"
-        if "tqu_oracle_temporal_category" in self.config and self.config["tqu_oracle_temporal_category"]:
-            tqu_oracle_temporal_category = "oracle-category"
-        if "tqu_oracle_temporal_value" in self.config and self.config["tqu_oracle_temporal_value"]:
-            tqu_oracle_temporal_value = "oracle-value"
-        run_tvr = "tvr"
-        if not self.config["run_tvr"]:
-            run_tvr = "no_tvr"
-        # either use given option, or from config
-        ha = self.config["ha"]
-        if ha == "seq2seq_ha":
-            gnn_max_evidences = ''
-        else:
-            gnn_max_evidences = []
-            for i in range(len(self.config["gnn_inference"])):
-                gnn_max_evidences.append(str(self.config["gnn_inference"][i]["gnn_max_evidences"]))
-
-            gnn_max_evidences = '_'.join(gnn_max_evidences)
-
         if "tvr_topk_answer" in self.config:
             tvr_top_answer = self.config["tvr_topk_answer"]
         else:
             tvr_top_answer = 1
-        if dev:
-            input_path = os.path.join(input_dir, self.config["dev_input_path"])
-        else:
-            input_path = os.path.join(input_dir, self.config["test_input_path"])
+        input_path = self._get_input_path(dev)
 
         with open(input_path, "r") as fp:
             data = json.load(fp)
@@ -257,16 +327,13 @@ class Pipeline:
         for sources_str in source_combinations:
             sources = sources_str.split("_")
             # define output path
-            output_dir = self.set_output_dir(sources_str)
+            output_prefix = self._get_output_prefix(sources_str, dev, tvr_top_answer)
             # tqu inference
             self.tqu.inference_on_data(data, tvr_top_answer, sources)
 
             if clean_up:
                 self.tqu = None  # free up memory
-            if dev:
-                output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_dev_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_tqu.json"
-            else:
-                output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_test_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_tqu.json"
+            output_path = f"{output_prefix}_tqu.json"
             store_json_with_mkdir(data, output_path)
 
             with open(output_path, "r") as fp:
@@ -276,25 +343,17 @@ class Pipeline:
 
             self.fer.inference_on_data(input_data, sources)
 
-            if dev:
-                fer_output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_dev_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_ers.jsonl"
-            else:
-                fer_output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_test_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_ers.jsonl"
-
+            fer_output_path = f"{output_prefix}_ers.jsonl"
             store_json_with_mkdir(input_data, fer_output_path)
 
-            self.fer.store_cache()
+            self.store_cache()
             if clean_up:
                 self.fer = None  # free up memory
 
             with open(fer_output_path, "r") as fp:
                 input_data = json.load(fp)
             self.ha.inference_on_data(input_data, sources)
-            if dev:
-                ha_output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_dev_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_gold_answers.json"
-            else:
-                ha_output_path = f"{output_dir}/{ha}_{gnn_max_evidences}_res_test_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}_gold_answers.json"
-
+            ha_output_path = f"{output_prefix}_gold_answers.json"
             store_json_with_mkdir(input_data, ha_output_path)
 
             # compute answer presence of fer results
@@ -304,6 +363,304 @@ class Pipeline:
             # evaluate performance of ha results
             self.compute_ha_metrics(ha_output_path, sources_str)
 
+    def evaluate_stream(self, dev=False, sources_str="kb_text_table_info", tvr_top_answer=None, fer_metrics=True):
+        """
+        Run the pipeline on the benchmark as a stream of questions.
+        Questions are passed through TQU, FER and HA in windows of
+        `evaluate_stream_window` questions, and the outputs of each stage are
+        appended to JSONL files. Only the current window is kept in memory.
+        """
+        if not isinstance(sources_str, list):
+            source_combinations = [sources_str]
+        else:
+            source_combinations = sources_str
+
+        if tvr_top_answer is None:
+            tvr_top_answer = self.config.get("tvr_topk_answer", 1)
+        input_path = self._get_input_path(dev)
+
+        for sources_str in source_combinations:
+            sources = sources_str.split("_")
+            # define output paths
+            output_prefix = self._get_output_prefix(sources_str, dev, tvr_top_answer)
+            output_paths = self._get_stream_output_paths(output_prefix)
+            manifest = self._get_manifest("evaluate", [input_path], dev=dev, sources_str=sources_str,
+                                          tvr_top_answer=tvr_top_answer)
+            self._evaluate_stream_split(read_instances(input_path), output_paths, tvr_top_answer, sources, manifest)
+            self.store_cache()
+            self._compute_stream_metrics(output_paths, sources_str, fer_metrics)
+
+    def evaluate_shard(self, shard_index, shard_count, dev=False, sources_str="kb_text_table_info",
+                       tvr_top_answer=None):
+        """
+        Run the streaming evaluation on one shard of the benchmark.
+        The benchmark is split into `shard_count` contiguous slices of questions,
+        and the outputs of the given slice are written to shard-specific files.
+        Use `merge_shards` to assemble the outputs of all shards.
+        """
+        if tvr_top_answer is None:
+            tvr_top_answer = self.config.get("tvr_topk_answer", 1)
+        sources = sources_str.split("_")
+        input_path = self._get_input_path(dev)
+        # stream the slice of the shard, instead of loading the whole benchmark
+        num_questions = sum(1 for _ in read_instances(input_path))
+        start_index = num_questions * shard_index // shard_count
+        end_index = num_questions * (shard_index + 1) // shard_count
+        shard_data = itertools.islice(read_instances(input_path), start_index, end_index)
+        self.logger.info(f"Evaluating shard {shard_index}/{shard_count} with {end_index - start_index} questions")
+
+        output_prefix = self._get_output_prefix(sources_str, dev, tvr_top_answer)
+        output_paths = self._get_stream_output_paths(output_prefix, shard_index, shard_count)
+        manifest = self._get_manifest("evaluate_shard", [input_path], dev=dev, sources_str=sources_str,
+                                      tvr_top_answer=tvr_top_answer, shard_index=shard_index, shard_count=shard_count)
+        self._evaluate_stream_split(shard_data, output_paths, tvr_top_answer, sources, manifest)
+        self.store_cache()
+
+    def evaluate_parallel(self, workers, dev=False, sources_str="kb_text_table_info", tvr_top_answer=None):
+        """
+        Run the streaming evaluation with a pool of `workers` processes.
+        Each worker evaluates one shard of the benchmark with its own pipeline,
+        and the shards are merged in the original order of questions afterwards.
+        Workers are spawned (not forked), since loading the pipeline starts
+        threads and opens connections, which must not be shared with a child process.
+        """
+        tasks = [(self.config, shard_index, workers, dev, sources_str, tvr_top_answer) for shard_index in range(workers)]
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            pool.map(_evaluate_shard_worker, tasks)
+        self.merge_shards(workers, dev=dev, sources_str=sources_str, tvr_top_answer=tvr_top_answer)
+
+    def merge_shards(self, shard_count, dev=False, sources_str="kb_text_table_info", tvr_top_answer=None):
+        """
+        Merge the outputs of the shards into one file per stage, in the
+        order of the questions in the benchmark, and compute the metrics.
+        """
+        if tvr_top_answer is None:
+            tvr_top_answer = self.config.get("tvr_topk_answer", 1)
+        question_ids = [instance["Id"] for instance in read_instances(self._get_input_path(dev))]
+        output_prefix = self._get_output_prefix(sources_str, dev, tvr_top_answer)
+        output_paths = self._get_stream_output_paths(output_prefix)
+        shard_paths = [
+            self._get_stream_output_paths(output_prefix, shard_index, shard_count)
+            for shard_index in range(shard_count)
+        ]
+        for stage_index, output_path in enumerate(output_paths):
+            stage_shard_paths = [paths[stage_index] for paths in shard_paths]
+            self._merge_shard_files(stage_shard_paths, output_path, question_ids)
+        self._compute_stream_metrics(output_paths, sources_str)
+
+    def _merge_shard_files(self, shard_paths, output_path, question_ids):
+        """Write the instances in the given shard files to the output path, in the given order of question Ids."""
+        # remember the position of each question in the shard files
+        positions = dict()
+        for shard_path in shard_paths:
+            with open(shard_path, "r") as fp:
+                offset = fp.tell()
+                line = fp.readline()
+                while line:
+                    if line.strip():
+                        # later outputs for the same question (e.g. reruns) overwrite previous ones
+                        positions[json.loads(line)["Id"]] = (shard_path, offset)
+                    offset = fp.tell()
+                    line = fp.readline()
+
+        missing_ids = [ques_id for ques_id in question_ids if ques_id not in positions]
+        if missing_ids:
+            self.logger.warning(f"Missing {len(missing_ids)} questions when merging into {output_path}: {missing_ids[:10]}")
+
+        shard_files = {shard_path: open(shard_path, "r") for shard_path in shard_paths}
+        try:
+            with open(output_path, "w") as fp_out:
+                for ques_id in question_ids:
+                    if ques_id not in positions:
+                        continue
+                    shard_path, offset = positions[ques_id]
+                    fp_in = shard_files[shard_path]
+                    fp_in.seek(offset)
+                    fp_out.write(fp_in.readline())
+        finally:
+            for fp in shard_files.values():
+                fp.close()
+        self.logger.info(f"Merged {len(shard_paths)} shards into {output_path}")
+
+    def _evaluate_stream_split(self, instances, output_paths, tvr_top_answer, sources, manifest=None):
+        """
+        Run the pipeline on the given stream of instances, appending the outputs of each stage.
+        If a run manifest is given, questions finished in a previous run are skipped.
+        """
+        window_size = self.config.get("evaluate_stream_window", 10)
+        if manifest is None:
+            # outputs of each stage are appended: start from empty files
+            for output_path in output_paths:
+                store_jsonl_with_mkdir([], output_path)
+            finished_ids = set()
+        elif manifest.is_stage_done("evaluate"):
+            self.logger.info(f"Skipping evaluation: outputs in {output_paths} already complete")
+            return
+        else:
+            finished_ids = manifest.prepare_outputs("evaluate", output_paths)
+            if finished_ids:
+                self.logger.info(f"Resuming evaluation after {len(finished_ids)} finished questions")
+
+        start = time.time()
+        num_questions = 0
+        instances = (instance for instance in instances if instance["Id"] not in finished_ids)
+        if self.config.get("evaluate_async"):
+            # overlap the stages of consecutive questions
+            self._evaluate_staged(instances, output_paths, tvr_top_answer, sources, manifest)
+        else:
+            for window in self._stream_windows(instances, window_size):
+                self._evaluate_window(window, tvr_top_answer, sources, output_paths)
+                if manifest is not None:
+                    manifest.mark_questions_done("evaluate", [instance["Id"] for instance in window], output_paths)
+                num_questions += len(window)
+                self.logger.info(f"Processed {num_questions} questions in {time.time() - start} seconds")
+        if manifest is not None:
+            manifest.mark_stage_done("evaluate")
+
+    def _evaluate_staged(self, instances, output_paths, tvr_top_answer, sources, manifest=None):
+        """
+        Run the pipeline on the given stream of instances with overlapping stages.
+        TQU, ER, pruning and scoring, and HA are connected by bounded queues, and each
+        stage works on a different question at the same time (with per-stage concurrency
+        limits from `evaluate_async_concurrency`). Outputs are appended in input order.
+        The models are shared by the stages (the TVR runs FER and HA within TQU) and are
+        not thread-safe: TQU, pruning and scoring, and HA run on a single shared thread,
+        and only ER (network-bound) runs concurrently.
+        """
+        window_size = self.config.get("evaluate_stream_window", 10)
+        concurrency = self.config.get("evaluate_async_concurrency", dict())
+
+        # each item is an instance with the outputs of the stages so far
+        def tqu_stage(instance):
+            with timing.span("tqu"):
+                self.tqu.inference_on_instance(instance, tvr_top_answer, sources)
+            return instance, [json.dumps(instance)]
+
+        def er_stage(item):
+            instance, _ = item
+            with timing.span("fer"):
+                self.fer.retrieve_on_instance(instance, sources)
+            return item
+
+        def ers_stage(item):
+            instance, outputs = item
+            with timing.span("fer"):
+                self.fer.prune_and_score_on_instance(instance, sources)
+            outputs.append(json.dumps(instance))
+            return item
+
+        def ha_stage(item):
+            instance, outputs = item
+            with timing.span("ha"):
+                self.ha.inference_on_instance(instance, sources)
+            outputs.append(json.dumps(instance))
+            return item
+
+        stages = [
+            Stage("tqu", tqu_stage, exclusive=True),
+            Stage("er", er_stage, concurrency.get("er", 4)),
+            Stage("ers", ers_stage, exclusive=True),
+            Stage("ha", ha_stage, exclusive=True),
+        ]
+        for stage in stages:
+            if stage.exclusive and concurrency.get(stage.name, 1) > 1:
+                self.logger.warning(f"Ignoring concurrency for {stage.name}: models are not thread-safe.")
+        executor = StagedExecutor(
+            stages,
+            queue_size=self.config.get("evaluate_async_queue_size", 8),
+            max_in_flight=self.config.get("evaluate_async_max_in_flight"),
+        )
+
+        start = time.time()
+        finished = list()
+        num_questions = 0
+
+        def store_finished():
+            nonlocal num_questions
+            for output_path, lines in zip(output_paths, zip(*[outputs for _, outputs in finished])):
+                with open(output_path, "a") as fp:
+                    for line in lines:
+                        fp.write(line)
+                        fp.write("\n")
+            if manifest is not None:
+                manifest.mark_questions_done("evaluate", [instance["Id"] for instance, _ in finished], output_paths)
+            num_questions += len(finished)
+            self.logger.info(f"Processed {num_questions} questions in {time.time() - start} seconds")
+            finished.clear()
+
+        def on_done(item):
+            finished.append(item)
+            if len(finished) == window_size:
+                store_finished()
+
+        executor.run(instances, on_done)
+        if finished:
+            store_finished()
+
+    def _get_manifest(self, run_name, input_paths=(), **params):
+        """Manifest for resuming the given run (None if disabled in the config)."""
+        if not self.config.get("run_manifest"):
+            return None
+        return RunManifest(self.config, run_name, input_paths, **params)
+
+    def _run_stage(self, manifest, stage, function):
+        """
+        Run the given stage of the training, unless it was finished in a previous run.
+        The stage is given as function without arguments (e.g. a lambda), so that
+        modules are only loaded if the stage runs.
+        """
+        if manifest is not None and manifest.is_stage_done(stage):
+            self.logger.info(f"Skipping {stage}: already finished in a previous run")
+            return
+        function()
+        if manifest is not None:
+            manifest.mark_stage_done(stage)
+
+    def _compute_stream_metrics(self, output_paths, sources_str, fer_metrics=True):
+        """Compute the metrics on the outputs of a streaming evaluation."""
+        _, fer_output_path, ha_output_path = output_paths
+        # compute answer presence of fer results
+        if fer_metrics:
+            self.compute_fer_metrics(fer_output_path, "initial")
+            self.compute_fer_metrics(fer_output_path, "pruning")
+            self.compute_fer_metrics(fer_output_path, "scoring")
+        # evaluate performance of ha results
+        self.compute_ha_metrics(ha_output_path, sources_str)
+
+    def _get_stream_output_paths(self, output_prefix, shard_index=None, shard_count=None):
+        """Output paths of TQU, FER and HA in a streaming evaluation (of the given shard)."""
+        if shard_count is not None:
+            output_prefix = f"{output_prefix}_shard{shard_index}of{shard_count}"
+        return (
+            f"{output_prefix}_tqu.jsonl",
+            f"{output_prefix}_ers.jsonl",
+            f"{output_prefix}_gold_answers.jsonl",
+        )
+
+    def _evaluate_window(self, window, tvr_top_answer, sources, output_paths):
+        """Run TQU, FER and HA on the given window of questions, and append the outputs of each stage."""
+        tqu_output_path, fer_output_path, ha_output_path = output_paths
+        with timing.span("tqu"):
+            self.tqu.inference_on_instances(window, tvr_top_answer, sources)
+        append_jsonl_with_mkdir(window, tqu_output_path)
+        with timing.span("fer"):
+            self.fer.inference_on_instances(window, sources)
+        append_jsonl_with_mkdir(window, fer_output_path)
+        with timing.span("ha"):
+            self.ha.inference_on_instances(window, sources)
+        append_jsonl_with_mkdir(window, ha_output_path)
+
+    def _stream_windows(self, instances, window_size):
+        """Group the given stream of instances into windows of (at most) the given size."""
+        window = list()
+        for instance in instances:
+            window.append(instance)
+            if len(window) == window_size:
+                yield window
+                window = list()
+        if window:
+            yield window
+
     def compute_metrics(self, input_data, sources_str):
         # compute results
         p_at_1_list = [instance["p_at_1"] for instance in input_data]
@@ -379,19 +736,44 @@ class Pipeline:
     def inference_on_instance(self, instance, topk_answers, sources=["kb", "text", "table", "info"]):
         """Run pipeline on given instance."""
         start = time.time()
-        self.tqu.inference_on_instance(instance, topk_answers, sources)
+        with timing.span("tqu"):
+            self.tqu.inference_on_instance(instance, topk_answers, sources)
         self.logger.info(instance)
         self.logger.info(f"Time taken (TQU): {time.time() - start} seconds")
         self.logger.info(f"Running FER")
-        self.fer.inference_on_instance(instance, sources)
+        with timing.span("fer"):
+            self.fer.inference_on_instance(instance, sources)
         self.logger.info(instance)
         self.logger.info(f"Time taken (TQU, FER): {time.time() - start} seconds")
         self.logger.info(f"Running HA")
-        self.ha.inference_on_instance(instance, sources)
+        with timing.span("ha"):
+            self.ha.inference_on_instance(instance, sources)
         self.logger.info(instance)
         self.logger.info(f"Time taken (ALL): {time.time() - start} seconds")
         return instance
 
+    def inference_on_batch(self, instances, topk_answers, sources=["kb", "text", "table", "info"]):
+        """
+        Run pipeline on a micro-batch of instances.
+        Each stage processes all instances at once: TSFs are generated in a batch,
+        evidences of all questions are scored in one call of the cross-encoder,
+        and the GNNs run batched forward passes. Intermediate questions of implicit
+        questions are answered as the next micro-batch.
+        """
+        start = time.time()
+        with timing.span("tqu"):
+            self.tqu.inference_on_instances(instances, topk_answers, sources)
+        self.logger.info(f"Time taken (TQU): {time.time() - start} seconds")
+        self.logger.info(f"Running FER")
+        with timing.span("fer"):
+            self.fer.inference_on_instances(instances, sources)
+        self.logger.info(f"Time taken (TQU, FER): {time.time() - start} seconds")
+        self.logger.info(f"Running HA")
+        with timing.span("ha"):
+            self.ha.inference_on_instances(instances, sources)
+        self.logger.info(f"Time taken (ALL) for {len(instances)} instances: {time.time() - start} seconds")
+        return instances
+
     def set_output_dir(self, sources_str):
         """Define path for outputs."""
         tqu = self.config["tqu"]
@@ -401,6 +783,58 @@ class Pipeline:
         output_dir = os.path.join(path_to_intermediate_results, self.benchmark, tqu, fer, sources_str, ha)
         return output_dir
 
+    def _get_input_path(self, dev=False):
+        """Path to the benchmark split to evaluate on."""
+        benchmark_path = self.config["benchmark_path"]
+        input_dir = os.path.join(benchmark_path, self.benchmark)
+        if dev:
+            return os.path.join(input_dir, self.config["dev_input_path"])
+        return os.path.join(input_dir, self.config["test_input_path"])
+
+    def _get_output_prefix(self, sources_str, dev=False, tvr_top_answer=1):
+        """Define the prefix of the output paths of each stage, based on the config."""
+        output_dir = self.set_output_dir(sources_str)
+        evs_max_evidences = self.config["evs_max_evidences"]
+        tqu_oracle_temporal_category = "no-oracle-category"
+        tqu_oracle_temporal_value = "no-oracle-value"
+        if "tqu_oracle_temporal_category" in self.config and self.config["tqu_oracle_temporal_category"]:
+            tqu_oracle_temporal_category = "oracle-category"
+        if "tqu_oracle_temporal_value" in self.config and self.config["tqu_oracle_temporal_value"]:
+            tqu_oracle_temporal_value = "oracle-value"
+        run_tvr = "tvr"
+        if not self.config["run_tvr"]:
+            run_tvr = "no_tvr"
+        # either use given option, or from config
+        ha = self.config["ha"]
+        if ha == "seq2seq_ha":
+            gnn_max_evidences = ''
+        else:
+            gnn_max_evidences = []
+            for i in range(len(self.config["gnn_inference"])):
+                gnn_max_evidences.append(str(self.config["gnn_inference"][i]["gnn_max_evidences"]))
+
+            gnn_max_evidences = '_'.join(gnn_max_evidences)
+        split = "dev" if dev else "test"
+        return f"{output_dir}/{ha}_{gnn_max_evidences}_res_{split}_{self.faith}_{tqu_oracle_temporal_category}_{tqu_oracle_temporal_value}_{run_tvr}_e{evs_max_evidences}_t{tvr_top_answer}"
+
+    def store_cache(self):
+        """Store the caches of the FER and of the TQU, if they were used."""
+        if self._fer is not None:
+            self.fer.store_cache()
+        if self._tqu is not None:
+            self.tqu.store_cache()
+
+    def load(self):
+        """
+        Load the models of all stages upfront (e.g. before serving questions).
+        The checkpoints of the stages are loaded concurrently.
+        """
+        stages = [self.tqu, self.fer, self.ha]
+        with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+            futures = [executor.submit(stage.load) for stage in stages]
+            for future in futures:
+                future.result()
+
     def _load_tqu(self):
         """Instantiate TQU stage of FAITH pipeline."""
         tqu = self.config["tqu"]
@@ -417,7 +851,7 @@ class Pipeline:
         fer = self.config["fer"]
         self.logger.info("Loading FER module")
         if fer == "fer":
-            return FER(self.config)
+            return FER(self.config, self.clocq, self.wiki_retriever)
         else:
             raise ValueError(
                 f"There is no available module for instantiating the ERS phase called {fer}."
@@ -437,6 +871,58 @@ class Pipeline:
             )
 
 
+def _evaluate_shard_worker(task):
+    """Evaluate one shard of the benchmark in a spawned worker process."""
+    config, shard_index, shard_count, dev, sources_str, tvr_top_answer = task
+    pipeline = Pipeline(config)
+    pipeline.evaluate_shard(shard_index, shard_count, dev=dev, sources_str=sources_str, tvr_top_answer=tvr_top_answer)
+    # timings of the worker process are reported separately
+    dump_timing_report(config, f"shard{shard_index}of{shard_count}")
+
+
+def dump_timing_report(config, run_name):
+    """Store the timings of the pipeline run, and log a summary."""
+    path_to_results = config["path_to_results"]
+    timestamp = time.strftime("%Y%m%d-%H%M%S", time.localtime())
+    output_path = os.path.join(path_to_results, config["benchmark"], "timing", f"{run_name}-{timestamp}.json")
+    report = timing.dump_report(output_path)
+    logger = get_logger(__name__, config)
+    for span_name, stats in report.items():
+        logger.info(f"Timing {span_name}: {stats['count']} calls, {round(stats['total'], 3)} seconds in total, "
+                    f"p50={round(stats['p50'], 3)}, p95={round(stats['p95'], 3)}, p99={round(stats['p99'], 3)}")
+    logger.info(f"Timing report stored at {output_path}")
+
+
+def parse_evaluate_options(function, args):
+    """
+    Parse the options of the (sharded) evaluation:
+    [<SOURCES_STRING>] [--shard-index <INDEX> --shard-count <COUNT> | --workers <NUM_WORKERS>],
+    and [<SOURCES_STRING>] --shard-count <COUNT> for merging the shards.
+    """
+    parser = argparse.ArgumentParser(prog=f"python faith/pipeline.py {function} <PATH_TO_CONFIG>")
+    parser.add_argument("sources_str", nargs="?", default="kb_text_table_info")
+    merge = function.startswith("--merge-shards")
+    parser.add_argument("--shard-count", type=int, required=merge)
+    if not merge:
+        parser.add_argument("--shard-index", type=int)
+        parser.add_argument("--workers", type=int)
+    options = parser.parse_args(args)
+    if options.shard_count is not None and options.shard_count < 1:
+        parser.error("--shard-count must be positive")
+    if merge:
+        return options
+    if (options.shard_index is None) != (options.shard_count is None):
+        parser.error("--shard-index and --shard-count must be given together")
+    if options.shard_index is not None:
+        if options.workers is not None:
+            parser.error("--workers cannot be combined with --shard-index and --shard-count")
+        if not 0 <= options.shard_index < options.shard_count:
+            parser.error("--shard-index must be between 0 and --shard-count - 1")
+    if options.workers is not None and options.workers < 1:
+        parser.error("--workers must be positive")
+    return options
+
+
 #######################################################################################################################
 #######################################################################################################################
 def main():
@@ -467,6 +953,16 @@ def main():
         pipeline = Pipeline(config)
         pipeline.source_combinations(dev=True)
 
+    elif function == "--source-combinations-sweep-test":
+        config["source_combinations_sweep"] = True
+        pipeline = Pipeline(config)
+        pipeline.source_combinations()
+
+    elif function == "--source-combinations-sweep-dev":
+        config["source_combinations_sweep"] = True
+        pipeline = Pipeline(config)
+        pipeline.source_combinations(dev=True)
+
     elif function == "--top-answer-dev-3-5":
         pipeline = Pipeline(config)
         top_answers = [3,5]
@@ -477,15 +973,30 @@ def main():
         top_answers = [3, 5]
         pipeline.top_answer_for_tvr(top_answers)
 
-    elif function == "--evaluate":
-        sources_str = sys.argv[3] if len(sys.argv) > 3 else "kb_text_table_info"
+    elif function in ("--evaluate", "--evaluate-dev"):
+        options = parse_evaluate_options(function, sys.argv[3:])
+        dev = function == "--evaluate-dev"
         pipeline = Pipeline(config)
-        pipeline.evaluate(sources_str=sources_str)
+        if options.workers is not None:
+            pipeline.evaluate_parallel(options.workers, dev=dev, sources_str=options.sources_str)
+        elif options.shard_count is not None:
+            pipeline.evaluate_shard(options.shard_index, options.shard_count, dev=dev,
+                                    sources_str=options.sources_str)
+        else:
+            pipeline.evaluate(dev=dev, sources_str=options.sources_str)
 
-    elif function == "--evaluate-dev":
-        sources_str = sys.argv[3] if len(sys.argv) > 3 else "kb_text_table_info"
+    elif function in ("--merge-shards", "--merge-shards-dev"):
+        options = parse_evaluate_options(function, sys.argv[3:])
+        dev = function == "--merge-shards-dev"
         pipeline = Pipeline(config)
-        pipeline.evaluate(dev=True, sources_str=sources_str)
+        pipeline.merge_shards(options.shard_count, dev=dev, sources_str=options.sources_str)
+
+    elif function == "--server":
+        # keep models and caches loaded, and answer questions via HTTP
+        pipeline = Pipeline(config)
+        pipeline.load()
+        server = PipelineServer(pipeline, config)
+        server.serve()
 
     elif function == "--example":
         sources_str = sys.argv[3] if len(sys.argv) > 3 else "kb_text_table_info"
@@ -495,6 +1006,9 @@ def main():
     else:
         raise Exception(f"Unknown function {function}!")
 
+    # report time taken per step of the pipeline
+    dump_timing_report(config, function.strip("-"))
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import signal
+import queue
+import itertools
+import threading
+import socketserver
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from faith.library.utils import get_logger
+
+# sources which can be combined in the `sources` of a request (e.g. "kb_text")
+SOURCES = ["kb", "text", "table", "info"]
+
+
+class MicroBatcher:
+    """
+    Collect concurrent requests into micro-batches.
+    A batch is processed as soon as `max_batch_size` requests are collected,
+    or `max_wait` seconds after the first request of the batch arrived.
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait=0.05):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, instance):
+        """Submit the instance for processing, and return a future for the result."""
+        future = Future()
+        self.requests.put((instance, future))
+        return future
+
+    def _run(self):
+        """Process batches of requests until the process terminates."""
+        while True:
+            # wait for the first request of the batch
+            batch = [self.requests.get()]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            instances = [instance for instance, _ in batch]
+            try:
+                results = self.process_batch(instances)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+class PipelineServer:
+    """
+    Long-lived server answering questions with a loaded pipeline.
+    Models and caches stay in memory, and concurrent requests
+    are answered in micro-batches via `Pipeline.inference_on_batch`.
+
+    Request (POST /answer):
+        {"question": "...", "question_creation_date": "2023-07-15", "sources": "kb_text_table_info"}
+    Response:
+        {"question": "...", "structured_temporal_form": {...}, "ranked_answers": [...], "supporting_evidences": [...]}
+    """
+
+    def __init__(self, pipeline, config):
+        self.pipeline = pipeline
+        self.config = config
+        self.logger = get_logger(__name__, config)
+        self.topk_answers = config.get("tvr_topk_answer", 1)
+        self.max_supporting_evidences = config.get("ha_max_supporting_evidences", 5)
+        self.question_ids = itertools.count()
+        # caches are stored every n batches (0: only on shutdown)
+        self.store_cache_every = config.get("server_store_cache_every", 100)
+        self.num_batches = 0
+        # serializes the pipeline runs and storing the caches
+        self.pipeline_lock = threading.Lock()
+        self.batcher = MicroBatcher(
+            self._process_batch,
+            max_batch_size=config.get("server_max_batch_size", 8),
+            max_wait=config.get("server_max_wait", 0.05),
+        )
+
+    def answer(self, question, question_creation_date=None, sources_str="kb_text_table_info"):
+        """Answer the given question (blocks until the micro-batch of the question is processed)."""
+        check_sources(sources_str)
+        instance = {
+            "Id": f"server-{next(self.question_ids)}",
+            "Question": question,
+            "Question creation date": question_creation_date or time.strftime("%Y-%m-%d"),
+            "answers": [],
+            "sources_str": sources_str,
+        }
+        instance = self.batcher.submit(instance).result()
+        return {
+            "question": question,
+            "structured_temporal_form": instance["structured_temporal_form"],
+            "ranked_answers": instance["ranked_answers"],
+            "supporting_evidences": [
+                {
+                    "evidence_text": evidence["evidence_text"],
+                    "source": evidence["source"],
+                    "wikidata_entities": evidence["wikidata_entities"],
+                }
+                for evidence in instance.get("candidate_evidences", [])[:self.max_supporting_evidences]
+            ],
+        }
+
+    def serve(self):
+        """Serve requests via HTTP (or a Unix socket, if configured) until interrupted."""
+        handler = self._get_request_handler()
+        unix_socket = self.config.get("server_unix_socket")
+        if unix_socket:
+            # remove socket of previous server
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            server = ThreadingUnixHTTPServer(unix_socket, handler)
+            self.logger.info(f"Serving pipeline at {unix_socket}")
+        else:
+            address = (self.config.get("server_host", "localhost"), self.config.get("server_port", 7777))
+            server = ThreadingHTTPServer(address, handler)
+            self.logger.info(f"Serving pipeline at http://{address[0]}:{address[1]}")
+        # shut down cleanly (and store the caches) when the process is terminated
+        signal.signal(signal.SIGTERM, _exit_on_signal)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.logger.info("Shutting down: storing caches.")
+            with self.pipeline_lock:
+                self.pipeline.store_cache()
+
+    def _process_batch(self, instances):
+        """Run the pipeline on the batch, grouping instances by their sources."""
+        instances_per_sources = dict()
+        for instance in instances:
+            instances_per_sources.setdefault(instance.pop("sources_str"), []).append(instance)
+        with self.pipeline_lock:
+            for sources_str, sources_instances in instances_per_sources.items():
+                self.pipeline.inference_on_batch(sources_instances, self.topk_answers, sources_str.split("_"))
+            # store caches regularly, so that they survive a crash of the server
+            self.num_batches += 1
+            if self.store_cache_every and self.num_batches % self.store_cache_every == 0:
+                self.pipeline.store_cache()
+        return instances
+
+    def _get_request_handler(self):
+        """Create the request handler class for this server."""
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/health":
+                    self._send(200, {"status": "ok"})
+                else:
+                    self._send(404, {"error": f"Unknown path {self.path}"})
+
+            def do_POST(self):
+                if self.path != "/answer":
+                    self._send(404, {"error": f"Unknown path {self.path}"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = json.loads(self.rfile.read(length))
+                    question = request["question"]
+                    check_sources(request.get("sources", "kb_text_table_info"))
+                except (ValueError, KeyError) as e:
+                    self._send(400, {"error": f"Invalid request: {e}"})
+                    return
+                try:
+                    result = server.answer(
+                        question,
+                        request.get("question_creation_date"),
+                        request.get("sources", "kb_text_table_info"),
+                    )
+                except Exception as e:
+                    server.logger.exception(f"Failed to answer {question}")
+                    self._send(500, {"error": str(e)})
+                    return
+                self._send(200, result)
+
+            def _send(self, status, content):
+                body = json.dumps(content).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def address_string(self):
+                # client address is empty for Unix sockets
+                return str(self.client_address[0]) if self.client_address else "unix"
+
+            def log_message(self, format, *args):
+                server.logger.debug(format % args)
+
+        return RequestHandler
+
+
+def check_sources(sources_str):
+    """Raise a ValueError if the given sources string (e.g. "kb_text") contains unknown sources."""
+    sources = sources_str.split("_") if isinstance(sources_str, str) else []
+    if not sources or any(source not in SOURCES for source in sources):
+        raise ValueError(f"Unknown sources {sources_str!r}, expected a combination of {'_'.join(SOURCES)}")
+
+
+def _exit_on_signal(signum, frame):
+    """Exit the process (running `finally` blocks, e.g. to store the caches)."""
+    sys.exit(0)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP server on a Unix socket, handling each request in a thread."""
+    daemon_threads = True
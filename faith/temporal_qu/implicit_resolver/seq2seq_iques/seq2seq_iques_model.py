@@ -143,7 +143,11 @@ class Seq2SeqIQUESModel(torch.nn.Module):
         return iquess
 
     def inference_on_batch(self, inputs):
-        """Run the model on the given inputs (batch)."""
+        """
+        Run the model on the given inputs (batch).
+        Inputs are padded to the longest input in the batch,
+        and decoded in the same way as in `inference_top_1`.
+        """
         # encode inputs
         input_encodings = self.tokenizer(
             inputs,
@@ -152,21 +156,23 @@ class Seq2SeqIQUESModel(torch.nn.Module):
             max_length=self.config["iques_max_input_length"],
             return_tensors="pt",
         )
+        if torch.cuda.is_available():
+            input_encodings = input_encodings.to(torch.device("cuda"))
+
         # generation
-        summary_ids = self.model.generate(
+        output = self.model.generate(
             input_ids=input_encodings["input_ids"],
             attention_mask=input_encodings["attention_mask"],
             no_repeat_ngram_size=self.config["iques_no_repeat_ngram_size"],
             num_beams=self.config["iques_num_beams"],
             early_stopping=self.config["iques_early_stopping"],
+            max_length=self.config["iques_max_length"],
         )
+
         # decoding
-        output = [
-            self.tokenizer.decode(
-                g,
-                skip_special_tokens=True,
-                clean_up_tokenization_spaces=False,
-            )
-            for g in summary_ids
-        ]
-        return output
+        outputs = self.tokenizer.batch_decode(
+            output,
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=True,
+        )
+        return outputs
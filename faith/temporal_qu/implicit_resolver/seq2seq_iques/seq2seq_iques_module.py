@@ -50,6 +50,26 @@ class Seq2SeqIQUESModule:
                 self.logger.info(f"Fail to generate question for: {question}")
         return instance
 
+    def inference_on_instances(self, instances):
+        """Run inference on a batch of questions, with padded batched generation."""
+        # load iques model (if required)
+        self._load()
+        if not instances:
+            return instances
+        with torch.no_grad():
+            questions = [instance["Question"] for instance in instances]
+            try:
+                results = self.iques_model.inference_on_batch(questions)
+            except RuntimeError as e:
+                # generation failed for the padded batch (e.g. out of GPU memory): fall back to individual questions
+                self.logger.warning(f"Fail to generate questions for batch of {len(questions)} questions ({e}), "
+                                    f"generating them individually.")
+                return [self.inference_on_instance(instance) for instance in instances]
+            for question, instance, result in zip(questions, instances, results):
+                instance["generated_iquestion"] = result
+                self.logger.info(f"Generate question for {question} and the result is: {result}")
+        return instances
+
     def inference_on_question(self, question):
         """Run inference on a single question."""
         return self.inference_on_instance({"Question": question})["generated_iquestion"]
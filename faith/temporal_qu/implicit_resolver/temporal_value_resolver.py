@@ -1,7 +1,22 @@
+import os
+import copy
+import json
+import time
+import pickle
+from pathlib import Path
+
 from faith.library.utils import get_logger
+from faith.library.run_manifest import config_fingerprint
+from faith.library.transport import persistent_caches_enabled
 from faith.temporal_qu.implicit_resolver.seq2seq_iques.seq2seq_iques_module import Seq2SeqIQUESModule
 
 
+# keys describing the intermediate question: all other keys of an answered intermediate question
+# are written by the QA pipeline (e.g. answers, evidences, answer presence), and memoized
+QUESTION_KEYS = ["Id", "answers", "Question creation date", "generated_q", "question", "Question",
+                 "intermediate_q_answer_type", "iques_answer_type"]
+
+
 class TemporalValueResolver:
     def __init__(self, config, pipeline):
         self.config = config
@@ -14,77 +29,262 @@ class TemporalValueResolver:
         self.pipeline = pipeline
         # library for annotating date based on regular expression
         self.string_lib = self.pipeline.fer.string_lib
+        # memo of answered intermediate questions
+        self.use_cache = config.get("tvr_use_cache", False) and persistent_caches_enabled(config)
+        self.cache = dict()
+        if self.use_cache:
+            # answers depend on the config and models of the pipeline -> one cache per config
+            cache_path, ext = os.path.splitext(config["tvr_cache_path"])
+            cache_path = f"{cache_path}-{config_fingerprint(config)}{ext}"
+            self.cache_path = os.path.join(config["path_to_data"], config["benchmark"], cache_path)
+            self._init_cache()
+            self.cache_changed = False
 
     def resolve_implicit_temporal_value(self, instance, topk_answers, sources=["kb", "text", "table", "info"]):
-        iques_answers = []
-        temporal_values = []
+        """
+        Resolve the implicit temporal value for the given instance.
+        All intermediate questions (e.g. start and end date of a time interval)
+        are answered by the QA pipeline as one batch.
+        """
         # inference_on_instance function generates intermediate question using the fine-tuned BART model
         # inference_on_instance function takes an instance which is a dictionary as input and output the intermediate question with its answer type saved in the instance
         self.iques_generation.inference_on_instance(instance)
+        intermediate_questions = self.create_intermediate_questions(instance)
+        iques_instances = [iques_instance for _, iques_instance in intermediate_questions]
+        # call the QA pipeline to answer the intermediate questions
+        self.answer_intermediate_questions(iques_instances, topk_answers, sources)
+        return self.collect_temporal_values(intermediate_questions, topk_answers)
+
+    def resolve_implicit_temporal_values(self, instances, topk_answers, sources=["kb", "text", "table", "info"]):
+        """
+        Resolve the implicit temporal values for a batch of instances.
+        The intermediate questions of all instances are answered
+        by the QA pipeline as the next batch.
+        """
+        self.iques_generation.inference_on_instances(instances)
+        intermediate_questions = [self.create_intermediate_questions(instance) for instance in instances]
+        iques_instances = [
+            iques_instance for questions in intermediate_questions for _, iques_instance in questions
+        ]
+        # call the QA pipeline to answer the intermediate questions
+        self.answer_intermediate_questions(iques_instances, topk_answers, sources)
+        return [self.collect_temporal_values(questions, topk_answers) for questions in intermediate_questions]
+
+    def answer_intermediate_questions(self, iques_instances, topk_answers, sources):
+        """
+        Answer the intermediate questions with the QA pipeline as one batch.
+        Answers of intermediate questions are memoized by (question, creation date, sources, gold answers),
+        and each distinct intermediate question is only answered once.
+        """
+        questions_to_answer = dict()
+        for iques_instance in iques_instances:
+            if self._lookup(iques_instance, topk_answers, sources):
+                continue
+            key = self._memo_key(iques_instance, sources)
+            questions_to_answer.setdefault(key, list()).append(iques_instance)
+        if not questions_to_answer:
+            return
+
+        instances_to_answer = [iques_group[0] for iques_group in questions_to_answer.values()]
+        self.pipeline.inference_on_batch(instances_to_answer, topk_answers, sources)
+
+        for iques_group in questions_to_answer.values():
+            self._remember(iques_group[0], topk_answers, sources)
+            # copy results for repeated questions
+            for iques_instance in iques_group[1:]:
+                self._lookup(iques_instance, topk_answers, sources)
+
+    def create_intermediate_questions(self, instance):
+        """
+        Create the intermediate questions for the generated intermediate question of the instance.
+        Returns a list of (suffix, intermediate question instance) pairs, with the suffix being
+        "start date" or "end date" for time intervals, and None for dates.
+        """
         result = instance["generated_iquestion"]
         self.logger.info(f"Generate question: {result}")
+        if self.delimiter not in result:
+            return []
+        generated_q = result.split(self.delimiter)[0].strip()
+        answer_type = result.split(self.delimiter)[1].strip()
+        # if the generated question is same as original question, the system will be in endless loop to call system itself
+        if generated_q.lower() == instance["Question"].lower():
+            return []
+
+        intermediate_questions = list()
+        # generate timespans
+        if answer_type == "time interval":
+            for item in ["start date", "end date"]:
+                # construct intermediate question with start date or end date as suffix
+                question_suffix = f"{generated_q} {item}"
+                iques_instance = {}
+                iques_instance.update({"answers": instance["answers"]})
+                iques_instance.update({"Id": instance["Id"]})
+                iques_instance.update({"Question creation date": instance["Question creation date"]})
+                iques_instance.update(
+                    {"generated_q": generated_q, "question": question_suffix, "Question": question_suffix,
+                     "intermediate_q_answer_type": answer_type})
+                intermediate_questions.append((item, iques_instance))
+        else:
+            iques_instance = {}
+            iques_instance.update({"answers": instance["answers"]})
+            iques_instance.update({"Id": instance["Id"]})
+            iques_instance.update({"Question creation date": instance["Question creation date"]})
+            iques_instance.update({"generated_q": generated_q, "question": generated_q, "Question": generated_q,
+                                   "iques_answer_type": answer_type})
+            intermediate_questions.append((None, iques_instance))
+        return intermediate_questions
+
+    def collect_temporal_values(self, intermediate_questions, topk_answers):
+        """Derive the temporal values from the answers to the intermediate questions."""
+        iques_answers = []
+        temporal_values = []
+        if not intermediate_questions:
+            return temporal_values, iques_answers
 
-        if self.delimiter in result:
-            generated_q = result.split(self.delimiter)[0].strip()
-            answer_type = result.split(self.delimiter)[1].strip()
-            # if the generated question is same as original question, the system will be in endless loop to call system itself
-            if generated_q.lower() != instance["Question"].lower():
-                # generate timespans
-                if answer_type == "time interval":
-                    suffix = ["start date", "end date"]
-                    timestamps = {suffix[0]: [], suffix[1]: []}
-                    for item in suffix:
-                        # construct intermediate question with start date or end date as suffix
-                        question_suffix = f"{generated_q} {item}"
-                        iques_instance = {}
-                        iques_instance.update({"answers": instance["answers"]})
-                        iques_instance.update({"Id": instance["Id"]})
-                        iques_instance.update({"Question creation date": instance["Question creation date"]})
-                        iques_instance.update(
-                            {"generated_q": generated_q, "question": question_suffix, "Question": question_suffix,
-                             "intermediate_q_answer_type": answer_type})
-                        # call the QA pipeline to answer the intermediate question
-                        iques_instance = self.pipeline.inference_on_instance(iques_instance, topk_answers, sources)
-                        ranked_answers = iques_instance["ranked_answers"]
-                        # obtain the top-k answer of temporal value
-                        temporal_value = self.extract_temporal_value(topk_answers, ranked_answers)  # extract temporal value from answer
-                        # remember results
-                        iques_instance["temporal_value"] = temporal_value
-                        iques_answers.append(iques_instance)
-                        if temporal_value:
-                            timestamps[item] += temporal_value
-                    # generate exhaustive set of possible timespan(s) from timestamp candidates
-                    temporal_values += self._generate_timespans(timestamps)
-                    self.logger.info(f"temporal value: {temporal_values}")
-
-                else:
-                    iques_instance = {}
-                    iques_instance.update({"answers": instance["answers"]})
-                    iques_instance.update({"Id": instance["Id"]})
-                    iques_instance.update({"Question creation date": instance["Question creation date"]})
-                    iques_instance.update({"generated_q": generated_q, "question": generated_q, "Question": generated_q,
-                                           "iques_answer_type": answer_type})
-                    # call the QA pipeline to answer the intermediate question
-                    iques_instance = self.pipeline.inference_on_instance(iques_instance, topk_answers, sources)
-                    ranked_answers = iques_instance["ranked_answers"]
-                    # call the QA pipeline to answer the intermediate question
-                    temporal_value = self.extract_temporal_value(topk_answers, ranked_answers)  # extract temporal value from answer
-                    iques_instance["temporal_value"] = temporal_value
-                    iques_answers.append(iques_instance)
-                    if temporal_value:
-                        for timestamp in temporal_value:
-                            if "-01-01" in timestamp:
-                                # when the timestamp is a year, we extend the timestamp as a time span for a year
-                                timespan = [timestamp, timestamp.replace("-01-01", "-12-31")]
-                                temporal_values.append(timespan)
-                            else:
-                                # when the timestamp is a date, we keep the timestamp as the start date and end date of a timespan
-                                timespan = [timestamp, timestamp]
-                                temporal_values.append(timespan)
-                        self.logger.info(f"temporal value: {temporal_values}")
+        timestamps = {"start date": [], "end date": []}
+        for suffix, iques_instance in intermediate_questions:
+            ranked_answers = iques_instance["ranked_answers"]
+            # obtain the top-k answer of temporal value
+            temporal_value = self.extract_temporal_value(topk_answers, ranked_answers)  # extract temporal value from answer
+            # remember results
+            iques_instance["temporal_value"] = temporal_value
+            iques_answers.append(iques_instance)
+            if not temporal_value:
+                continue
+            if suffix:
+                timestamps[suffix] += temporal_value
+            else:
+                for timestamp in temporal_value:
+                    if "-01-01" in timestamp:
+                        # when the timestamp is a year, we extend the timestamp as a time span for a year
+                        timespan = [timestamp, timestamp.replace("-01-01", "-12-31")]
+                        temporal_values.append(timespan)
+                    else:
+                        # when the timestamp is a date, we keep the timestamp as the start date and end date of a timespan
+                        timespan = [timestamp, timestamp]
+                        temporal_values.append(timespan)
+                self.logger.info(f"temporal value: {temporal_values}")
 
+        if intermediate_questions[0][0]:
+            # generate exhaustive set of possible timespan(s) from timestamp candidates
+            temporal_values += self._generate_timespans(timestamps)
+            self.logger.info(f"temporal value: {temporal_values}")
         return temporal_values, iques_answers
 
+    def _memo_key(self, iques_instance, sources, topk_answers=None):
+        """
+        Key of the intermediate question in the memo.
+        The gold answers are part of the key, since the metrics of the result depend on them.
+        The top-k answers are only part of the key, if the result depends on them
+        (i.e. if the TVR was run for the intermediate question itself).
+        """
+        answers = json.dumps(iques_instance["answers"], sort_keys=True)
+        key = (iques_instance["Question"], iques_instance["Question creation date"], tuple(sources), answers)
+        if topk_answers is not None:
+            key += (topk_answers,)
+        return key
+
+    def _lookup(self, iques_instance, topk_answers, sources):
+        """Add the memoized results to the intermediate question, if available."""
+        result = self.cache.get(self._memo_key(iques_instance, sources))
+        if result is None:
+            result = self.cache.get(self._memo_key(iques_instance, sources, topk_answers))
+        if result is None:
+            return False
+        iques_instance.update(copy.deepcopy(result))
+        return True
+
+    def _remember(self, iques_instance, topk_answers, sources):
+        """Memoize the results for the answered intermediate question."""
+        result = {key: copy.deepcopy(value) for key, value in iques_instance.items() if key not in QUESTION_KEYS}
+        if self._tvr_attempted(iques_instance):
+            key = self._memo_key(iques_instance, sources, topk_answers)
+        else:
+            key = self._memo_key(iques_instance, sources)
+        self.cache[key] = result
+        if self.use_cache:
+            self.cache_changed = True
+
+    def _tvr_attempted(self, iques_instance):
+        """Check if the TVR was run for the answered intermediate question (whether it found a value or not)."""
+        if iques_instance.get("intermediate_question_pipeline_result"):
+            return True
+        tsf = iques_instance.get("structured_temporal_form")
+        if not tsf or tsf["category"] != "implicit":
+            return False
+        if self.config.get("tqu_oracle_temporal_value"):
+            # gold temporal values are used
+            return False
+        return self.config["run_tvr"]
+
+    def store_cache(self):
+        """Store the memo of intermediate questions to disk."""
+        if not self.use_cache:  # store only if cache in use
+            return
+        if not self.cache_changed:  # store only if cache changed
+            return
+        # check if the cache was updated by other processes
+        if self._read_cache_version() == self.cache_version:
+            # no updates: store and update version
+            self.logger.info(f"Writing TVR cache at path {self.cache_path}.")
+            self._write_cache(self.cache)
+            self._write_cache_version()
+        else:
+            # update! read updated version and merge the caches
+            self.logger.info(f"Merging TVR cache at path {self.cache_path}.")
+            # read updated version
+            updated_cache = self._read_cache()
+            # overwrite with changes in current process (most recent)
+            updated_cache.update(self.cache)
+            # store
+            self._write_cache(updated_cache)
+            self._write_cache_version()
+        self.cache_changed = False
+
+    def _init_cache(self):
+        """Initialize the cache."""
+        if os.path.isfile(self.cache_path):
+            # remember version read initially
+            self.logger.info(f"Loading TVR cache from path {self.cache_path}.")
+            self.cache_version = self._read_cache_version()
+            self.cache = self._read_cache()
+            self.logger.info(f"TVR cache successfully loaded.")
+        else:
+            self.logger.info(f"Could not find an existing TVR cache at path {self.cache_path}.")
+            self.logger.info("Populating TVR cache from scratch!")
+            self.cache = {}
+            self._write_cache(self.cache)
+            self._write_cache_version()
+
+    def _read_cache(self):
+        """Read the current version of the cache."""
+        with open(self.cache_path, "rb") as fp:
+            cache = pickle.load(fp)
+        return cache
+
+    def _write_cache(self, cache):
+        """Write to the cache."""
+        cache_dir = os.path.dirname(self.cache_path)
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        with open(self.cache_path, "wb") as fp:
+            pickle.dump(cache, fp)
+        return cache
+
+    def _read_cache_version(self):
+        """Read the cache version (hashed timestamp of last update) from a dedicated file."""
+        if not os.path.isfile(f"{self.cache_path}.version"):
+            self._write_cache_version()
+        with open(f"{self.cache_path}.version", "r") as fp:
+            cache_version = fp.readline().strip()
+        return cache_version
+
+    def _write_cache_version(self):
+        """Write the current cache version (hashed timestamp of current update)."""
+        with open(f"{self.cache_path}.version", "w") as fp:
+            version = str(time.time())
+            fp.write(version)
+        self.cache_version = version
+
     def extract_temporal_value(self, topk_answers, ranked_answers):
         timestamps_for_implicitquestion = list()
         pred_answers = [{"id": ans["answer"]["id"], "label": ans["answer"]["label"], "rank": ans["rank"]} for ans in
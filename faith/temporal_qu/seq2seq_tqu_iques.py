@@ -3,6 +3,7 @@ from faith.temporal_qu.seq2seq_tsf.seq2seq_tsf_module import Seq2SeqTSFModule
 from faith.temporal_qu.implicit_resolver.seq2seq_iques.seq2seq_iques_module import Seq2SeqIQUESModule
 from faith.temporal_qu.implicit_resolver.temporal_value_resolver import TemporalValueResolver
 from faith.library.utils import get_logger, get_config
+from faith.library import timing
 
 
 class Seq2SeqIQUESTQU(TemporalQuestionUnderstanding):
@@ -30,25 +31,80 @@ class Seq2SeqIQUESTQU(TemporalQuestionUnderstanding):
             self.tvr = TemporalValueResolver(config, pipeline)
         self.string_lib = self.pipeline.fer.string_lib
 
+    def load(self):
+        """Load the TSF model, and the intermediate question model if TVR is enabled."""
+        self.seq2seq_tsf._load()
+        if self.run_tvr:
+            self.tvr.iques_generation._load()
+
+    def store_cache(self):
+        """Store the memo of intermediate questions answered by the TVR."""
+        if self.run_tvr:
+            self.tvr.store_cache()
+
     def inference_on_instance(self, instance, topk_answers, sources=["kb", "text", "table", "info"]):
         """
 		Implement TQU for the given instance.
 		The TSF will be stored in the key `structured_temporal_form`.
 		"""
+        self._prepare_instance(instance)
+        # Some slots in TSF are generated from seq2seq model, including the question entity, question relation, answer type, temporal signal, and temporal category
+        with timing.span("tsf_decode"):
+            tsf = self.seq2seq_tsf.inference_on_question(instance["question"])
+        tsf = self._initial_tsf(instance, tsf)
+
+        # translate implicit constraint into temporal value when there is no other constraint
+        if self._requires_tvr(tsf):
+            # implicit resolver
+            with timing.span("tvr"):
+                temporal_value, iques_instance = self.tvr.resolve_implicit_temporal_value(instance, topk_answers, sources)
+            self._add_implicit_temporal_value(instance, tsf, temporal_value, iques_instance)
+
+        instance["structured_temporal_form"] = tsf
+        return instance
+
+    def inference_on_instances(self, instances, topk_answers, sources=["kb", "text", "table", "info"]):
+        """
+        Implement TQU for a batch of instances.
+        TSFs are generated in a single batch, and the intermediate questions
+        of implicit questions are answered by the pipeline as the next batch.
+        """
+        for instance in instances:
+            self._prepare_instance(instance)
+        with timing.span("tsf_decode"):
+            tsfs = self.seq2seq_tsf.inference_on_questions([instance["question"] for instance in instances])
+        tsfs = [self._initial_tsf(instance, tsf) for instance, tsf in zip(instances, tsfs)]
+
+        # translate implicit constraint into temporal value when there is no other constraint
+        implicit_indices = [i for i, tsf in enumerate(tsfs) if self._requires_tvr(tsf)]
+        if implicit_indices:
+            implicit_instances = [instances[i] for i in implicit_indices]
+            with timing.span("tvr"):
+                results = self.tvr.resolve_implicit_temporal_values(implicit_instances, topk_answers, sources)
+            for i, (temporal_value, iques_instance) in zip(implicit_indices, results):
+                self._add_implicit_temporal_value(instances[i], tsfs[i], temporal_value, iques_instance)
+
+        for instance, tsf in zip(instances, tsfs):
+            instance["structured_temporal_form"] = tsf
+        return instances
+
+    def _prepare_instance(self, instance):
+        """Initialize the keys of the instance used in TQU."""
         question = instance["Question"]
         # change the key of "Question" into "question" for consistency
         instance["question"] = question
         # reformat answer and store in `instance["answers"]`
         if "answers" not in instance:
             instance["answers"] = self.string_lib.format_answers(instance)
-        question_create_date = instance["Question creation date"]
         # initial TSF is None
         instance["structured_temporal_form"] = None
         # initial temporal resolver is None
         instance["intermediate_question_pipeline_result"] = None
 
-        # Some slots in TSF are generated from seq2seq model, including the question entity, question relation, answer type, temporal signal, and temporal category
-        tsf = self.seq2seq_tsf.inference_on_question(question)
+    def _initial_tsf(self, instance, tsf):
+        """Construct the TSF from the generated TSF string and the explicit temporal values in the question."""
+        question = instance["question"]
+        question_create_date = instance["Question creation date"]
 
         # tsf is a string with the format f"{entities}{tsf_delimiter}{relation}{tsf_delimiter}{ans_type}{tsf_delimiter}{temp_signal}{tsf_delimiter}{temp_category}"
         slots = tsf.split(self.tsf_delimiter)
@@ -70,8 +126,10 @@ class Seq2SeqIQUESTQU(TemporalQuestionUnderstanding):
         qtemporal_values = list()
 
         # annotate any ordinals, explicit temporal values
-        temporal_annotations = self.temporal_value_annotator.date_ordinal_annotator(question, question_create_date,
-                                                                                    self.date_tag_method)
+        with timing.span("date_annotation"):
+            temporal_annotations = self.temporal_value_annotator.date_ordinal_annotator(
+                question, question_create_date, self.date_tag_method
+            )
         # record date and ordinal annotation result for each question
         instance["temporal_annotations"] = temporal_annotations
         date_annotations = temporal_annotations[0]
@@ -103,29 +161,24 @@ class Seq2SeqIQUESTQU(TemporalQuestionUnderstanding):
                 for item in instance["gold_constraint"]:
                     qtemporal_values.append(item)
 
-            tsf = self._output_tsf(qtemporal_type, qentity, qrelation, qanswer_type, qtemporal_signal, qtemporal_values)
-
-            instance["structured_temporal_form"] = tsf
-
-            return instance
+        return self._output_tsf(qtemporal_type, qentity, qrelation, qanswer_type, qtemporal_signal, qtemporal_values)
 
-        # translate implicit constraint into temporal value when there is no other constraint
-        if qtemporal_type == "implicit" and self.run_tvr:
-            # implicit resolver
-            temporal_value, iques_instance = self.tvr.resolve_implicit_temporal_value(instance, topk_answers, sources)
-            if temporal_value:
-                qtemporal_values += temporal_value
-                if iques_instance:
-                    instance["intermediate_question_pipeline_result"] = iques_instance
-            else:
-                self.logger.info(
-                    f"Fail to generate intermediate question or get temporal value for question {question}")
-
-        tsf = self._output_tsf(qtemporal_type, qentity, qrelation, qanswer_type, qtemporal_signal, qtemporal_values)
-
-        instance["structured_temporal_form"] = tsf
-
-        return instance
+    def _requires_tvr(self, tsf):
+        """Check if the implicit temporal value of the TSF needs to be resolved by the TVR."""
+        if "tqu_oracle_temporal_value" in self.config and self.config["tqu_oracle_temporal_value"]:
+            # gold temporal values are used
+            return False
+        return tsf["category"] == "implicit" and self.run_tvr
+
+    def _add_implicit_temporal_value(self, instance, tsf, temporal_value, iques_instance):
+        """Add the temporal values resolved by the TVR to the TSF."""
+        if temporal_value:
+            tsf["temporal_value"] += temporal_value
+            if iques_instance:
+                instance["intermediate_question_pipeline_result"] = iques_instance
+        else:
+            self.logger.info(
+                f"Fail to generate intermediate question or get temporal value for question {instance['question']}")
 
     def _output_tsf(self, qtemporal_type, entity, relation, answer_type, temporal_signal, temporal_values):
         tsf = {
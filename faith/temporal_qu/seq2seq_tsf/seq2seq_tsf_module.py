@@ -55,6 +55,17 @@ class Seq2SeqTSFModule:
         """Run inference on a single question."""
         return self.inference_on_instance({"question": question})["structured_temporal_form"]
 
+    def inference_on_questions(self, questions):
+        """Run inference on a batch of questions, with padded batched generation."""
+        # load TSF model (if required)
+        self._load()
+        with torch.no_grad():
+            if self.config.get("tsf_avoid_hallucination"):
+                # top-k TSFs are checked for each question individually
+                return [self._inference(question) for question in questions]
+            tsfs = self.tsf_model.inference_on_batch(questions)
+            return [self._format_tsf(tsf) for tsf in tsfs]
+
     def _inference(self, question):
         def _normalize_input(_input):
             return _input.replace(",", " ")
@@ -121,6 +121,16 @@ class TemporalQuestionUnderstanding:
             self.inference_on_instance(instance, topk_answers, sources)
         return input_data
 
+    def inference_on_instances(self, instances, topk_answers, sources=["kb", "text", "table", "info"]):
+        """Run TQU on a batch of instances."""
+        for instance in instances:
+            self.inference_on_instance(instance, topk_answers, sources)
+        return instances
+
+    def load(self):
+        """Load the models of the TQU (can be done upfront, e.g. before forking worker processes)."""
+        pass
+
     def inference_on_instance(self, instance, topk_answers, sources=["kb", "text", "table", "info"]):
         raise Exception(
             "This is an abstract function which should be overwritten in a derived class!"
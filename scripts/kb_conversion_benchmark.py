@@ -0,0 +1,140 @@
+"""
+Benchmark for the conversion of CLOCQ search spaces to KB-evidences.
+
+Compares `ClocqRetriever.retrieve_KB_facts` on a cache hit with the baseline
+implementation of the ClocqRetriever, loaded from the given git revision
+(by default the initial commit of the repository). The search spaces are the
+CLOCQ results recorded in the transport archive (run the pipeline with
+`transport_mode: "record"` first), and both implementations must produce the
+same evidences for each of them.
+
+Usage:
+    python scripts/kb_conversion_benchmark.py <PATH_TO_CONFIG> [--tsf <TSF>] [--limit <N>] [--repeat <N>] [--baseline <REVISION>]
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from faith.library.utils import get_config, get_logger
+from faith.library.transport import Transport
+from faith.library.string_library import StringLibrary
+from faith.faithful_er.evidence_retrieval.clocq_er import ClocqRetriever
+
+MODULE_PATH = "faith/faithful_er/evidence_retrieval/clocq_er.py"
+SERVICE = "clocq_search_space"
+
+
+class _Annotator:
+    """Minimal stand-in for the TemporalValueAnnotator (only the library is required)."""
+
+    def __init__(self, config):
+        self.library = StringLibrary(config)
+
+
+def load_baseline_module(revision):
+    """Load the module of the ClocqRetriever at the given git revision."""
+    if revision is None:
+        revision = _git("rev-list", "--max-parents=0", "HEAD").split()[0]
+    source = _git("show", f"{revision}:{MODULE_PATH}")
+    module = types.ModuleType("baseline_clocq_er")
+    exec(compile(source, f"{revision}:{MODULE_PATH}", "exec"), module.__dict__)
+    return module, revision
+
+
+def _git(*args):
+    return subprocess.run(["git", *args], cwd=REPO_DIR, check=True, capture_output=True, text=True).stdout
+
+
+def load_search_spaces(config, tsf=None, limit=20):
+    """Load the recorded CLOCQ results (of the given TSF, or the first `limit` ones) from the transport archive."""
+    transport = Transport(dict(config, transport_mode="replay"))
+    if tsf is not None:
+        requests = [[tsf, config["clocq_params"]]]
+    else:
+        keys = transport.archive.keys(f"{SERVICE}|||")[:limit]
+        requests = [json.loads(key.split("|||", 1)[1]) for key in keys]
+    if not requests:
+        raise Exception(f"No search spaces recorded in the transport archive of {config['benchmark']}")
+    return [(request[0], transport.call(SERVICE, request, _unreachable)) for request in requests]
+
+
+def _unreachable():
+    raise Exception("CLOCQ is not called in the benchmark")
+
+
+def create_retriever(config):
+    """ClocqRetriever with the given search spaces in its (in-memory) cache."""
+    retriever = ClocqRetriever(dict(config, er_use_cache=False), _Annotator(config), clocq=object(),
+                               wiki_retriever=object())
+    retriever.use_cache = True
+    retriever.cache = dict()
+    return retriever
+
+
+def create_baseline_retriever(module, config):
+    """Baseline ClocqRetriever (without CLOCQ and Wikipedia backends) with an in-memory cache."""
+    retriever = module.ClocqRetriever.__new__(module.ClocqRetriever)
+    retriever.config = config
+    retriever.logger = get_logger(module.__name__, config)
+    retriever.temporal_value_annotator = _Annotator(config)
+    retriever.library = retriever.temporal_value_annotator.library
+    retriever.use_cache = True
+    retriever.cache = dict()
+    return retriever
+
+
+def measure(function, repeat):
+    """Mean time (in milliseconds) of the given function."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the conversion of CLOCQ search spaces to KB-evidences.")
+    parser.add_argument("config_path")
+    parser.add_argument("--tsf", help="TSF of the recorded search space (default: all recorded search spaces)")
+    parser.add_argument("--limit", type=int, default=20, help="maximum number of recorded search spaces")
+    parser.add_argument("--repeat", type=int, default=20, help="conversions per search space")
+    parser.add_argument("--baseline", help="git revision of the baseline (default: initial commit)")
+    args = parser.parse_args()
+
+    config = get_config(args.config_path)
+    config["log_level"] = "WARNING"
+    search_spaces = load_search_spaces(config, args.tsf, args.limit)
+    module, revision = load_baseline_module(args.baseline)
+    retriever = create_retriever(config)
+    baseline_retriever = create_baseline_retriever(module, config)
+
+    total, baseline_total = 0, 0
+    print(f"Baseline: {MODULE_PATH} at {revision}, {args.repeat} runs per search space")
+    for tsf, clocq_result in search_spaces:
+        # cache entries in the format of the respective implementation
+        retriever.cache[retriever._get_search_space_key(tsf)] = retriever._normalize_search_space(clocq_result)
+        baseline_retriever.cache[tsf] = clocq_result
+
+        # both implementations should produce the same evidences
+        evidences = retriever.retrieve_KB_facts(tsf)
+        baseline_evidences = baseline_retriever.retrieve_KB_facts(tsf)
+        assert evidences == baseline_evidences, f"Evidences differ from the baseline for: {tsf}"
+
+        duration = measure(lambda: retriever.retrieve_KB_facts(tsf), args.repeat)
+        baseline_duration = measure(lambda: baseline_retriever.retrieve_KB_facts(tsf), args.repeat)
+        total += duration
+        baseline_total += baseline_duration
+        print(f"{len(clocq_result['search_space'])} facts: baseline {baseline_duration:.2f} ms, "
+              f"current {duration:.2f} ms ({tsf})")
+    print(f"Total over {len(search_spaces)} search spaces: baseline {baseline_total:.2f} ms, "
+          f"current {total:.2f} ms, speedup {baseline_total / total:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
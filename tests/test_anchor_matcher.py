@@ -0,0 +1,125 @@
+"""
+Tests of the anchor matcher: same anchors and positions as the substring scan over all anchors before.
+"""
+import random
+import unittest
+from importlib.util import find_spec
+
+from faith.faithful_er.evidence_retrieval.wikipedia_retriever.anchor_matcher import AnchorMatcher
+
+
+def sort_anchor_tuples(anchor_dict):
+    """Anchor tuples in order of priority, as in `EvidenceAnnotator.annotate_wikidata_entities`."""
+    anchor_tuples = sorted(anchor_dict.items(), key=lambda y: len(y[0]), reverse=True)
+    return [(key, value) for key, value in anchor_tuples if not "#" in value]
+
+
+def baseline_find(anchor_tuples, text):
+    """Substring scan over all anchors, as in `_detect_wikipedia_entities` before the matcher."""
+    return [
+        (anchor_text, anchor_path, text.find(anchor_text))
+        for anchor_text, anchor_path in anchor_tuples
+        if anchor_text in text
+    ]
+
+
+def baseline_detect_wikipedia_entities(evidence_text, doc_anchor_tuples):
+    """Wikipedia paths and disambiguations as detected before the matcher (without the page entity)."""
+    finds = list()
+    disambiguations = list()
+    wikipedia_paths = list()
+    for anchor_text, anchor_path in doc_anchor_tuples:
+        if anchor_text in evidence_text:
+            if "#" in anchor_path:
+                continue
+            new_start = evidence_text.find(anchor_text)
+            new_end = new_start + len(anchor_text)
+            duplicate = False
+            for _start, _end in finds:
+                if new_start >= _start and new_start <= _end:
+                    duplicate = True
+                elif new_end >= _start and new_end <= _end:
+                    duplicate = True
+            if not duplicate:
+                finds.append((new_start, new_end))
+                wikipedia_paths.append(anchor_path)
+                disambiguations.append((anchor_text, anchor_path))
+    return wikipedia_paths, disambiguations
+
+
+def generate_case(rng):
+    """Anchors and a text over a small alphabet (many overlapping, nested and repeated occurrences)."""
+    anchor_dict = dict()
+    for i in range(rng.randint(0, 12)):
+        anchor_text = "".join(rng.choice("ab c") for _ in range(rng.randint(1, 5)))
+        anchor_dict[anchor_text] = f"Path_{i}" if rng.random() < 0.9 else f"Path_{i}#Section"
+    text = "".join(rng.choice("ab cd") for _ in range(rng.randint(0, 40)))
+    return anchor_dict, text
+
+
+class TestAnchorMatcher(unittest.TestCase):
+    def assert_same_as_baseline(self, anchor_dict, text):
+        anchor_tuples = sort_anchor_tuples(anchor_dict)
+        self.assertEqual(AnchorMatcher(anchor_tuples).find(text), baseline_find(anchor_tuples, text))
+
+    def test_nested_anchors(self):
+        anchor_tuples = sort_anchor_tuples({
+            "York": "York", "New York": "New_York", "New York City": "New_York_City",
+            "City": "City", "Yorkshire": "Yorkshire",
+        })
+        matches = AnchorMatcher(anchor_tuples).find("Born in New York City, he moved to York.")
+        self.assertEqual(matches, [
+            ("New York City", "New_York_City", 8), ("New York", "New_York", 8),
+            ("York", "York", 12), ("City", "City", 17),
+        ])
+        self.assertEqual(matches, baseline_find(anchor_tuples, "Born in New York City, he moved to York."))
+
+    def test_overlapping_anchors(self):
+        anchor_tuples = sort_anchor_tuples({"abcd": "A", "bcde": "B", "cdef": "C", "de": "D", "e": "E"})
+        matches = AnchorMatcher(anchor_tuples).find("xabcdefx cdef")
+        self.assertEqual(matches, [("abcd", "A", 1), ("bcde", "B", 2), ("cdef", "C", 3), ("de", "D", 4), ("e", "E", 5)])
+        self.assertEqual(matches, baseline_find(anchor_tuples, "xabcdefx cdef"))
+
+    def test_first_occurrence_and_priority(self):
+        # anchors of the same length are kept in anchor dict order
+        anchor_dict = {"she": "She", "he": "He", "hers": "Hers", "his": "His", "ab": "Ab", "aa": "Aa"}
+        for text in ["ushers", "he she his hers", "aaaab", "aabaa", "", "no match", "h"]:
+            self.assert_same_as_baseline(anchor_dict, text)
+        matches = AnchorMatcher(sort_anchor_tuples(anchor_dict)).find("he saw her, then she left with him and his")
+        self.assertEqual(matches, [("she", "She", 17), ("his", "His", 39), ("he", "He", 0)])
+
+    def test_unicode_and_empty_anchors(self):
+        anchor_dict = {"": "Empty", "Zürich": "Zürich", "Zürich HB": "Zürich_HB", "ü": "U", "東京": "Tokyo"}
+        matcher = AnchorMatcher(sort_anchor_tuples(anchor_dict))
+        # empty anchors never match
+        self.assertEqual(matcher.find(""), [])
+        self.assertEqual(matcher.find("Zürich HB, 東京"), [
+            ("Zürich HB", "Zürich_HB", 0), ("Zürich", "Zürich", 0), ("東京", "Tokyo", 11), ("ü", "U", 1)
+        ])
+
+    def test_same_as_substring_scan_on_generated_cases(self):
+        rng = random.Random(0)
+        for _ in range(3000):
+            anchor_dict, text = generate_case(rng)
+            self.assert_same_as_baseline(anchor_dict, text)
+
+    @unittest.skipUnless(find_spec("requests"), "requires requests")
+    def test_same_entities_as_before(self):
+        from faith.faithful_er.evidence_retrieval.wikipedia_retriever.evidence_annotator import EvidenceAnnotator
+
+        annotator = EvidenceAnnotator.__new__(EvidenceAnnotator)
+        rng = random.Random(1)
+        for _ in range(3000):
+            anchor_dict, text = generate_case(rng)
+            doc_anchor_tuples = sorted(anchor_dict.items(), key=lambda y: len(y[0]), reverse=True)
+            wiki_paths, disambiguations = annotator._detect_wikipedia_entities(
+                "Page", {"evidence_text": text}, AnchorMatcher(sort_anchor_tuples(anchor_dict))
+            )
+            expected_paths, expected_disambiguations = baseline_detect_wikipedia_entities(text, doc_anchor_tuples)
+            # the path of the page entity is added last
+            self.assertEqual(wiki_paths, expected_paths + ["Page"])
+            self.assertEqual(disambiguations[:-1], expected_disambiguations)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,368 @@
+"""
+Tests of the ClocqRetriever with a fake CLOCQ backend (no network access).
+"""
+import os
+import re
+import copy
+import random
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+from faith.library.utils import get_config
+
+ENT_PATTERN = re.compile("^Q[0-9]+$")
+PRE_PATTERN = re.compile("^P[0-9]+$")
+KB_ITEM_SEPARATOR = ", "
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVALUATE_CONFIG_PATH = os.path.join(REPO_DIR, "config", "tiq", "evaluate.yml")
+DEPENDENCIES_AVAILABLE = all(
+    importlib.util.find_spec(module) is not None for module in ["clocq", "requests", "spacy", "mwparserfromhell", "wikitables"]
+)
+
+# facts of the fake KB (items with id and label)
+NEIGHBORHOODS = {
+    "Q1": [
+        [{"id": "Q1", "label": "Berlin Wall"}, {"id": "P571", "label": "inception"},
+         {"id": '"1961-08-13T00:00:00Z"', "label": '"1961-08-13T00:00:00Z"'}],
+        [{"id": "Q1", "label": "Berlin Wall"}, {"id": "P17", "label": "country"}, {"id": "Q2", "label": "Germany"}],
+        [{"id": "Q1", "label": "Berlin Wall"}, {"id": "P17", "label": "country"}, {"id": "Q2", "label": "Germany"},
+         {"id": "P580", "label": "start time"}, {"id": '"1990-01-01T00:00:00Z"', "label": '"1990-01-01T00:00:00Z"'}],
+    ],
+    "Q2": [
+        [{"id": "Q2", "label": "Germany"}, {"id": "P36", "label": "capital"}, {"id": "Q3", "label": "Berlin"}],
+        [{"id": "Q1", "label": "Berlin Wall"}, {"id": "P17", "label": "country"}, {"id": "Q2", "label": "Germany"}],
+        [{"id": "Q2", "label": "Germany"}, {"id": "P6", "label": "head of government"}, {"id": "Q4", "label": "Helmut Kohl"},
+         {"id": "P580", "label": "start time"}, {"id": '"1982-10-01T00:00:00Z"', "label": '"1982-10-01T00:00:00Z"'},
+         {"id": "P582", "label": "end time"}, {"id": '"1998-10-27T00:00:00Z"', "label": '"1998-10-27T00:00:00Z"'}],
+    ],
+}
+KB_ITEM_TUPLE = [
+    {"item": {"id": "Q1", "label": "Berlin Wall"}, "question_word": "berlin wall"},
+    {"item": {"id": "Q2", "label": "Germany"}, "question_word": "germany"},
+    {"item": {"id": "P17", "label": "country"}, "question_word": "country"},
+]
+
+
+# items for generated KB-facts (with timestamps as returned by CLOCQ)
+ITEMS = [
+    {"id": "Q1", "label": "Berlin Wall"}, {"id": "Q2", "label": "Germany"}, {"id": "Q3", "label": "Berlin"},
+    {"id": "Q4", "label": "Helmut Kohl"}, {"id": "P17", "label": "country"}, {"id": "P31", "label": "instance of"},
+    {"id": "P580", "label": "start time"}, {"id": "P582", "label": "end time"}, {"id": "P585", "label": "point in time"},
+    {"id": '"1961-08-13T00:00:00Z"', "label": '"1961-08-13T00:00:00Z"'},
+    {"id": '"1990-01-01T00:00:00Z"', "label": '"1990-01-01T00:00:00Z"'},
+    {"id": "1998-10-27T00:00:00Z", "label": "1998-10-27T00:00:00Z"},
+    {"id": "-0044-03-15T00:00:00Z", "label": "-0044-03-15T00:00:00Z"},
+    {"id": '"155 metres"', "label": '"155 metres"'}, {"id": "42", "label": "42"},
+]
+
+
+def baseline_kb_fact_to_evidence(library, kb_fact, question_items_set):
+    """Conversion of a KB-fact in the initial version of the ClocqRetriever (modifies the fact)."""
+
+    def _format_fact(kb_fact):
+        """Correct format of fact (if necessary)."""
+        start_timestamp = None
+        end_timestamp = None
+        timespan = []
+        disambiguation = list()
+        retrieved_for = list()
+        for item in kb_fact:
+            index = kb_fact.index(item)
+            item_pre = kb_fact[index - 1]
+            if item["id"] in question_items_set:
+                retrieved_for.append(item)
+            if library.is_timestamp(item["id"]):
+                item["label"] = library.convert_timestamp_to_date(item["id"])
+                item["label"] = item["label"].replace('"', "")
+                item["id"] = item["id"].replace('"', "")
+                if (item["label"], item["id"]) not in disambiguation:
+                    disambiguation.append((item["label"], item["id"]))
+                if item_pre["id"] == 'P580':
+                    # start time
+                    start_timestamp = item["id"]
+                elif item_pre["id"] == 'P582':
+                    # end time
+                    if "-01-01T00:00:00Z" in item["id"]:
+                        # timestamp is year, end time in timespan is changed to YYYY-12-31
+                        end_timestamp = item["id"].replace("-01-01T00:00:00Z", "-12-31T00:00:00Z")
+                    else:
+                        end_timestamp = item["id"]
+                else:
+                    # point in time or other time
+                    if "-01-01T00:00:00Z" in item["id"]:
+                        start_timestamp = item["id"]
+                        # timestamp is year, end time in timespan is changed to YYYY-12-31
+                        end_timestamp = item["id"].replace("-01-01T00:00:00Z", "-12-31T00:00:00Z")
+                    else:
+                        start_timestamp = item["id"]
+                        end_timestamp = item["id"]
+
+        # generate timespan with start time and end time
+        if start_timestamp and end_timestamp:
+            timespan.append([start_timestamp, end_timestamp])
+        elif start_timestamp and not end_timestamp:
+            # no end time
+            timespan.append([start_timestamp, None])
+        elif not start_timestamp and end_timestamp:
+            # no start time
+            timespan.append([None, end_timestamp])
+        return kb_fact, timespan, disambiguation, retrieved_for
+
+    def _get_wikidata_entities(kb_fact):
+        """Return wikidata_entities for fact."""
+        items = list()
+        for item in kb_fact:
+            # skip undesired answers
+            if PRE_PATTERN.match(item["id"]):
+                continue
+            # append to set
+            items.append(item)
+            # augment candidates with years (for differen granularity of answer)
+            if library.is_timestamp(item["id"]):
+                year = library.get_year(item["id"])
+                new_item = {
+                    "id": library.convert_year_to_timestamp(year),
+                    "label": year,
+                }
+                items.append(new_item)
+        return items
+
+    kb_fact, timespan, disambiguation, retrieved_for = _format_fact(kb_fact)
+    return {
+        "evidence_text": KB_ITEM_SEPARATOR.join([item["label"] for item in kb_fact]),
+        "wikidata_entities": _get_wikidata_entities(kb_fact),
+        "disambiguations": [
+            (item["label"], item["id"]) for item in kb_fact if ENT_PATTERN.match(item["id"])
+        ],
+        "retrieved_for_entity": retrieved_for,
+        "tempinfo": [timespan, disambiguation] if timespan and disambiguation else None,
+        "source": "kb",
+    }
+
+
+def baseline_remove_duplicate_evidence(evidences):
+    """Merging of duplicate evidences in the initial version of the ClocqRetriever."""
+    evi_dic = {}
+    for evidence in evidences:
+        text = evidence["evidence_text"]
+        source = evidence["source"]
+        # keep unique evidence text per source
+        text_source = f"{text}|||{source}"
+        if text_source not in evi_dic:
+            evi_dic[text_source] = {
+                "wikidata_entities": [],
+                "disambiguations": [],
+                "retrieved_for_entity": [],
+                "tempinfo": evidence["tempinfo"],
+            }
+
+        for item in evidence["wikidata_entities"]:
+            if item not in evi_dic[text_source]["wikidata_entities"]:
+                evi_dic[text_source]["wikidata_entities"].append(item)
+
+        for item in evidence["disambiguations"]:
+            if item not in evi_dic[text_source]["disambiguations"]:
+                evi_dic[text_source]["disambiguations"].append(item)
+
+        for item in evidence["retrieved_for_entity"]:
+            if item not in evi_dic[text_source]["retrieved_for_entity"]:
+                evi_dic[text_source]["retrieved_for_entity"].append(item)
+
+    for key, value in evi_dic.items():
+        text = key.split("|||")[0]
+        source = key.split("|||")[1]
+        value.update({"evidence_text": text, "source": source})
+
+    return list(evi_dic.values())
+
+
+def generate_search_space(rng, num_facts):
+    """Random KB-facts (with repeated items and facts), and question items."""
+    facts = [[dict(rng.choice(ITEMS)) for _ in range(rng.randint(1, 7))] for _ in range(num_facts)]
+    facts += [copy.deepcopy(rng.choice(facts)) for _ in range(num_facts // 4)]
+    rng.shuffle(facts)
+    question_items_set = set(item["id"] for item in rng.sample(ITEMS, 4))
+    return facts, question_items_set
+
+
+class FakeClocq:
+    """CLOCQ with a tiny KB, counting the calls per function."""
+
+    def __init__(self):
+        self.calls = {"get_search_space": 0, "entity_linking": 0, "get_neighborhood": 0}
+
+    def get_search_space(self, question, parameters=dict(), include_labels=True, include_type=False):
+        self.calls["get_search_space"] += 1
+        search_space = [fact for facts in NEIGHBORHOODS.values() for fact in facts]
+        return {"kb_item_tuple": KB_ITEM_TUPLE, "search_space": search_space}
+
+    def entity_linking(self, question, parameters=dict()):
+        self.calls["entity_linking"] += 1
+        return KB_ITEM_TUPLE
+
+    def get_neighborhood(self, kb_item, p=1000, include_labels=True):
+        self.calls["get_neighborhood"] += 1
+        return NEIGHBORHOODS.get(kb_item, [])
+
+
+class FakeTemporalValueAnnotator:
+    def __init__(self, library):
+        self.library = library
+
+
+def make_config(data_dir, **overrides):
+    """Evaluation config with the data (and caches) in the given directory."""
+    config = get_config(EVALUATE_CONFIG_PATH)
+    config["log_level"] = "ERROR"
+    config["path_to_data"] = data_dir
+    config["path_to_stopwords"] = os.path.join(REPO_DIR, config["path_to_stopwords"])
+    config["transport_mode"] = "live"
+    config["er_use_cache"] = True
+    config["er_cache_backend"] = "pickle"
+    config["er_kb_evidences_cache"] = False
+    config["er_entity_neighborhood_cache"] = False
+    config.update(overrides)
+    return config
+
+
+def make_retriever(config, clocq):
+    from faith.library.string_library import StringLibrary
+    from faith.faithful_er.evidence_retrieval.clocq_er import ClocqRetriever
+
+    annotator = FakeTemporalValueAnnotator(StringLibrary(config))
+    return ClocqRetriever(config, annotator, clocq=clocq, wiki_retriever=object())
+
+
+@unittest.skipUnless(DEPENDENCIES_AVAILABLE, "requires the dependencies of the ER")
+class ClocqRetrieverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+
+
+class TestNeighborhoodSearchSpaces(ClocqRetrieverTestCase):
+    def test_assembled_search_space_is_cached_under_tsf(self):
+        clocq = FakeClocq()
+        retriever = make_retriever(make_config(self.data_dir, er_entity_neighborhood_cache=True), clocq)
+        first = retriever.retrieve_KB_facts("berlin wall germany")
+        second = retriever.retrieve_KB_facts("berlin wall germany")
+        self.assertEqual(first, second)
+        self.assertEqual(clocq.calls["entity_linking"], 1)
+        self.assertEqual(clocq.calls["get_neighborhood"], 2)
+        self.assertEqual(clocq.calls["get_search_space"], 0)
+
+    def test_search_spaces_of_other_mode_are_not_served(self):
+        clocq = FakeClocq()
+        tsf = "berlin wall germany"
+        # populate the cache with the CLOCQ search space of the tsf
+        retriever = make_retriever(make_config(self.data_dir), clocq)
+        retriever.retrieve_KB_facts(tsf)
+        retriever.store_cache()
+        self.assertEqual(clocq.calls["get_search_space"], 1)
+
+        retriever = make_retriever(make_config(self.data_dir, er_entity_neighborhood_cache=True), clocq)
+        evidences, _ = retriever.retrieve_KB_facts(tsf)
+        self.assertEqual(clocq.calls["entity_linking"], 1)
+        # facts shared by the neighborhoods are contained once
+        self.assertEqual(len(evidences), 5)
+
+        # and the other way round
+        retriever = make_retriever(make_config(self.data_dir), clocq)
+        evidences, _ = retriever.retrieve_KB_facts(tsf)
+        self.assertEqual(len(evidences), 6)
+        self.assertEqual(clocq.calls["get_search_space"], 1)
+
+    def test_neighborhoods_are_limited(self):
+        clocq = FakeClocq()
+        config = make_config(self.data_dir, er_entity_neighborhood_cache=True, er_neighborhood_max_facts=1)
+        retriever = make_retriever(config, clocq)
+        evidences, question_entities = retriever.retrieve_KB_facts("berlin wall germany")
+        self.assertEqual([evidence["evidence_text"] for evidence in evidences], [
+            "Berlin Wall, inception, 13 August 1961",
+            "Germany, capital, Berlin",
+        ])
+        self.assertEqual([entity["item"]["id"] for entity in question_entities], ["Q1", "Q2"])
+
+
+class TestKBEvidencesCache(ClocqRetrieverTestCase):
+    def test_cached_evidences_are_identical(self):
+        for neighborhoods in [False, True]:
+            uncached = make_retriever(make_config(self.data_dir, er_entity_neighborhood_cache=neighborhoods), FakeClocq())
+            expected = uncached.retrieve_KB_evidences("berlin wall germany")
+
+            config = make_config(self.data_dir, er_entity_neighborhood_cache=neighborhoods, er_kb_evidences_cache=True)
+            retriever = make_retriever(config, FakeClocq())
+            question_entities = []
+            self.assertEqual(retriever.retrieve_KB_evidences("berlin wall germany"), expected)
+            self.assertEqual(retriever.retrieve_KB_evidences("berlin wall germany", question_entities.append), expected)
+            self.assertEqual(question_entities, [expected[1]])
+            retriever.store_cache()
+
+            # cached evidences from disk, without converting the search space
+            retriever = make_retriever(config, FakeClocq())
+            retriever._kb_facts_to_evidences = None
+            self.assertEqual(retriever.retrieve_KB_evidences("berlin wall germany"), expected)
+
+    def test_cache_is_disabled_by_default(self):
+        for config_name in ["evaluate.yml", "train_tqu_fer.yml", "train_ha_graph_reduction.yml",
+                            "train_ha_answer_inference.yml"]:
+            config = get_config(os.path.join(REPO_DIR, "config", "tiq", config_name))
+            self.assertFalse(config["er_kb_evidences_cache"], config_name)
+
+
+class TestEquivalenceWithBaseline(ClocqRetrieverTestCase):
+    """The conversion and merging of evidences give the same results as in the initial version."""
+
+    def setUp(self):
+        super().setUp()
+        self.retriever = make_retriever(make_config(self.data_dir), FakeClocq())
+        self.rng = random.Random(0)
+
+    def test_kb_facts_to_evidences(self):
+        library = self.retriever.library
+        for _ in range(20):
+            facts, question_items_set = generate_search_space(self.rng, 50)
+            expected = [baseline_kb_fact_to_evidence(library, kb_fact, question_items_set)
+                        for kb_fact in copy.deepcopy(facts)]
+            normalized = self.retriever._normalize_search_space({"kb_item_tuple": [], "search_space": facts})
+            self.assertEqual(self.retriever._kb_facts_to_evidences(normalized["search_space"], question_items_set),
+                             expected)
+            # facts are not modified
+            self.assertEqual(self.retriever._normalize_search_space({"kb_item_tuple": [], "search_space": facts}),
+                             normalized)
+
+    def test_remove_duplicate_evidence(self):
+        library = self.retriever.library
+        for _ in range(20):
+            facts, question_items_set = generate_search_space(self.rng, 50)
+            evidences = [baseline_kb_fact_to_evidence(library, kb_fact, question_items_set) for kb_fact in facts]
+            # the same texts from other sources, with overlapping items
+            for evidence in self.rng.sample(evidences, 20):
+                evidence = copy.deepcopy(evidence)
+                evidence["source"] = self.rng.choice(["text", "table", "info"])
+                evidence["wikidata_entities"] = list(reversed(evidence["wikidata_entities"])) + [dict(ITEMS[0])]
+                evidences.append(evidence)
+            self.rng.shuffle(evidences)
+            expected = baseline_remove_duplicate_evidence(copy.deepcopy(evidences))
+            self.assertEqual(self.retriever.remove_duplicate_evidence(copy.deepcopy(evidences)), expected)
+            # order of the merged evidences and items is kept as well
+            self.assertEqual([evidence["evidence_text"] for evidence in
+                              self.retriever.remove_duplicate_evidence(copy.deepcopy(evidences))],
+                             [evidence["evidence_text"] for evidence in expected])
+
+    def test_equal_items_of_other_types_are_merged_like_baseline(self):
+        evidences = [
+            {"evidence_text": "a", "source": "kb", "tempinfo": None, "wikidata_entities": [{"id": "Q1", "n": 1}],
+             "disambiguations": [("A", "Q1"), ["A", "Q1"]], "retrieved_for_entity": [{"id": "Q1", "n": 1.0}]},
+            {"evidence_text": "a", "source": "kb", "tempinfo": None, "wikidata_entities": [{"n": True, "id": "Q1"}],
+             "disambiguations": [("A", "Q1")], "retrieved_for_entity": [{"id": "Q1", "n": [1]}]},
+        ]
+        self.assertEqual(self.retriever.remove_duplicate_evidence(copy.deepcopy(evidences)),
+                         baseline_remove_duplicate_evidence(copy.deepcopy(evidences)))
+
+
+if __name__ == "__main__":
+    unittest.main()
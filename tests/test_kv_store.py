@@ -0,0 +1,156 @@
+"""
+Tests of the key-value stores: buffered writes, forked processes, and sharded raw blobs.
+"""
+import os
+import zlib
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import multiprocessing
+
+from faith.library.kv_store import SqliteStore, ShardedStore
+
+
+def _read_rows(path):
+    """All rows of the given store, read with a separate connection."""
+    connection = sqlite3.connect(path)
+    try:
+        return dict(connection.execute("SELECT key, value FROM kv").fetchall())
+    finally:
+        connection.close()
+
+
+def _write_in_child(store, queue):
+    try:
+        store["child"] = {"pid": os.getpid()}
+        store.flush()
+        queue.put((store.get("parent"), store.local.pid == os.getpid()))
+    except Exception as e:
+        queue.put(repr(e))
+
+
+class KVStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+
+class TestSqliteStore(KVStoreTestCase):
+    def test_entries_are_written_on_close(self):
+        path = os.path.join(self.tmp_dir, "store.db")
+        store = SqliteStore(path, flush_size=100)
+        store["a"] = [1, 2]
+        store["b"] = {"c": None}
+        # buffered: visible in the store, but not written yet
+        self.assertEqual(store["a"], [1, 2])
+        self.assertEqual(_read_rows(path), dict())
+        store.close()
+        self.assertEqual(set(_read_rows(path)), {"a", "b"})
+
+        store = SqliteStore(path)
+        self.assertEqual((store["a"], store["b"], len(store)), ([1, 2], {"c": None}, 2))
+        self.assertNotIn("d", store)
+        with self.assertRaises(KeyError):
+            store["d"]
+        # the store can still be used after closing
+        store.close()
+        store["d"] = 4
+        store.close()
+        self.assertEqual(SqliteStore(path)["d"], 4)
+
+    def test_entries_are_written_when_buffer_is_full(self):
+        path = os.path.join(self.tmp_dir, "store.db")
+        store = SqliteStore(path, flush_size=3)
+        store["a"] = 1
+        store["b"] = 2
+        self.assertEqual(_read_rows(path), dict())
+        store["c"] = 3
+        self.assertEqual(len(_read_rows(path)), 3)
+
+    def test_keys_with_prefix(self):
+        store = SqliteStore(os.path.join(self.tmp_dir, "store.db"))
+        store.update({"clocq|||a": 1, "clocq|||b": 2, "wikipedia|||a": 3, "clocq_|||c": 4})
+        store["clocq|||c"] = 5
+        self.assertEqual(store.keys("clocq|||"), ["clocq|||a", "clocq|||b", "clocq|||c"])
+        self.assertEqual(len(store.keys()), 5)
+        # no wildcards in prefixes
+        self.assertEqual(store.keys("clocq_%"), [])
+
+    def test_raw_values(self):
+        store = SqliteStore(os.path.join(self.tmp_dir, "store.db"), raw=True)
+        store["a"] = b"\x00blob"
+        store.flush()
+        self.assertEqual(store["a"], b"\x00blob")
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_forked_process_reconnects(self):
+        path = os.path.join(self.tmp_dir, "store.db")
+        store = SqliteStore(path)
+        store["parent"] = "written by parent"
+        store.flush()
+        # the connection of the parent is open when forking
+        self.assertEqual(store.local.pid, os.getpid())
+
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        process = context.Process(target=_write_in_child, args=(store, queue))
+        process.start()
+        result = queue.get(timeout=30)
+        process.join()
+        self.assertEqual(result, ("written by parent", True))
+
+        # parent keeps using its own connection, and sees the writes of the child
+        self.assertEqual(store["child"], {"pid": process.pid})
+        self.assertEqual(len(store), 2)
+
+
+class TestShardedStore(KVStoreTestCase):
+    def test_values_are_compressed_raw_blobs(self):
+        path = os.path.join(self.tmp_dir, "dump")
+        store = ShardedStore(path, num_shards=4, flush_size=2)
+        entities = {f"Q{i}": [{"evidence_text": f"evidence {i}", "source": "text"}] for i in range(20)}
+        store.update(entities)
+        store["Q100"] = []
+        store.close()
+
+        rows = dict()
+        for shard in range(4):
+            rows.update(_read_rows(os.path.join(path, f"shard_{shard:03d}.db")))
+        self.assertEqual(set(rows), set(entities) | {"Q100"})
+        # blobs are compressed pickles of the values (not pickled again)
+        for key, value in entities.items():
+            self.assertEqual(pickle.loads(zlib.decompress(rows[key])), value)
+
+        store = ShardedStore(path, num_shards=16)
+        self.assertEqual(len(store.shards), 4)
+        self.assertEqual(len(store), 21)
+        self.assertEqual(store["Q3"], entities["Q3"])
+        self.assertEqual(store.get("Q100"), [])
+        self.assertIsNone(store.get("Q200"))
+        self.assertIn("Q100", store)
+        self.assertNotIn("Q200", store)
+
+    def test_stores_with_pickled_blobs_are_read(self):
+        # store created before raw blobs were supported: compressed pickles, pickled again
+        path = os.path.join(self.tmp_dir, "dump")
+        os.makedirs(path)
+        with open(os.path.join(path, "shards.json"), "w") as fp:
+            fp.write('{"num_shards": 2}')
+        shards = [SqliteStore(os.path.join(path, f"shard_{shard:03d}.db")) for shard in range(2)]
+        for key in ["Q1", "Q2", "Q3"]:
+            shards[zlib.crc32(key.encode("utf-8")) % 2][key] = zlib.compress(pickle.dumps([key]))
+        for shard in shards:
+            shard.close()
+
+        store = ShardedStore(path)
+        self.assertEqual([store[key] for key in ["Q1", "Q2", "Q3"]], [["Q1"], ["Q2"], ["Q3"]])
+        # new entries are written in the format of the store
+        store["Q4"] = ["Q4"]
+        store.close()
+        self.assertEqual(ShardedStore(path)["Q4"], ["Q4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
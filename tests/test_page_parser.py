@@ -0,0 +1,202 @@
+"""
+Tests of the single-pass parser of Wikipedia pages: anchors and infobox as extracted via BeautifulSoup before.
+"""
+import random
+import unittest
+from importlib.util import find_spec
+
+from faith.faithful_er.evidence_retrieval.wikipedia_retriever.page_parser import WikipediaPageParser
+from faith.faithful_er.evidence_retrieval.wikipedia_retriever.infobox_parser import InfoboxParser
+import faith.library.wikipedia_library as wiki
+
+PAGE = """<html><body>
+<p>The <a href="/wiki/Eiffel_Tower">Eiffel Tower</a> is in <a href="/wiki/Paris">Paris</a>,
+see <a href="/wiki/Paris_(disambiguation)">Paris</a>.</p>
+<p><a href="https://example.org/Louvre">Louvre</a> and <a href="/wiki/Louvre">Louvre</a>,
+<a href="/wiki/File:Tower.jpg">Tower image</a>, <a href="/wiki/Category:Towers">Towers category</a>,
+<a href="/wiki/Special:Search">Search page</a>, <a href="/wiki/UK">UK</a>, <a>no link</a>.</p>
+<p><a href="/wiki/Gustave_Eiffel"><b>Gustave</b> Eiffel</a> built it with <a href="/wiki/Maurice_Koechlin">  Maurice <i>Koechlin</i>
+</a>
+&amp; <a href="/wiki/AT%26T">AT&amp;T</a> and <a href="/wiki/Stephen_Sauvestre">Stephen Sauvestre<script>x = 1;</script></a>.</p>
+<table class="infobox vcard"><tbody>
+<tr><th colspan="2">Eiffel Tower</th></tr>
+<tr><th>Location</th><td><a href="/wiki/Paris">Paris</a>, <a href="/wiki/France">France</a></td></tr>
+<tr><th>Architect</th><td>Gustave Eiffel &amp; Maurice Koechlin<br/>Stephen Sauvestre</td></tr>
+<tr><th>Opened</th><td>31 March 1889<!-- comment --> <span>(<a href="/wiki/Exposition_Universelle_(1889)">World's Fair</a>)</span></td></tr>
+<tr><th>Height</th><td>330 m<sup><a href="#cite_note-1">[1]</a></sup><div class="navbox"><a href="/wiki/Navbox_in_infobox">Navbox in infobox</a></div></td></tr>
+<tr><th>Owner</th><td><p>City of Paris
+</td></tr>
+</tbody></table>
+<table class="infobox"><tr><th>Second</th><td><a href="/wiki/Second_infobox">Second infobox</a></td></tr></table>
+<div class="navbox"><a href="/wiki/Notre-Dame">Notre-Dame</a><div><a href="/wiki/Louvre_Pyramid">Louvre Pyramid</a></div></div>
+<div class="navbox-inner"><a href="/wiki/Arc_de_Triomphe">Arc de Triomphe</a></div>
+<p><a href="/wiki/Notre-Dame_de_Paris">Notre-Dame</a> <a href="/wiki/Unclosed">Unclosed anchor</p>
+<p>after</p></span>
+</body></html>"""
+
+EXPECTED_ANCHOR_DICT = {
+    "AT&T": "AT%26T",
+    "Arc de Triomphe": "Arc_de_Triomphe",
+    "Eiffel Tower": "Eiffel_Tower",
+    "France": "France",
+    "Gustave Eiffel": "Gustave_Eiffel",
+    "Louvre": "Louvre",
+    "Maurice Koechlin": "Maurice_Koechlin",
+    "Notre-Dame": "Notre-Dame_de_Paris",
+    "Paris": "Paris",
+    "Second infobox": "Second_infobox",
+    "Stephen Sauvestre": "Stephen_Sauvestre",
+    "Unclosed anchor": "Unclosed",
+    "World's Fair": "Exposition_Universelle_(1889)",
+}
+
+# texts and links of the randomly generated pages
+TEXTS = ["Paris", "Eiffel Tower", "AT&amp;T", "a &lt; b", "  ", "\n", "France", "Q", "x &gt; y", "&#160;1889"]
+HREFS = ["/wiki/Paris", "/wiki/France", "/wiki/File:X.jpg", "/wiki/Category:Y", "https://example.org", None, "#cite"]
+
+
+def parse(page_html):
+    """Anchor dict, and parsed infobox tables with the anchor dict after parsing the infobox."""
+    page = WikipediaPageParser().parse(page_html)
+    anchor_dict = page.get_anchor_dict()
+    if not page.has_infobox():
+        return anchor_dict, None, None
+    infobox_anchor_dict = dict(anchor_dict)
+    tables = page.replay_infobox(InfoboxParser(infobox_anchor_dict)).tables
+    return anchor_dict, tables, infobox_anchor_dict
+
+
+def baseline_parse(page_html):
+    """Extraction via BeautifulSoup, as in the WikipediaRetriever before the single-pass parser."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page_html, features="html.parser")
+
+    # prune navigation bar
+    for div in soup.find_all("div", {"class": "navbox"}):
+        div.decompose()
+
+    # go through links
+    anchor_dict = dict()
+    for tag in soup.find_all("a"):
+        # anchor text
+        text = tag.text.strip()
+        if len(text) < 3:
+            continue
+        # duplicate anchor text (keep first)
+        if anchor_dict.get(text):
+            continue
+        # wiki title (=entity)
+        href = tag.attrs.get("href")
+        if not wiki.is_wikipedia_path(href):
+            continue
+        anchor_dict[text] = wiki.format_wiki_path(href)
+
+    infoboxes = soup.find_all("table", {"class": "infobox"})
+    if not infoboxes:
+        return anchor_dict, None, None
+    infobox_anchor_dict = dict(anchor_dict)
+    p = InfoboxParser(infobox_anchor_dict)
+    p.feed(str(infoboxes[0]))
+    return anchor_dict, p.tables, infobox_anchor_dict
+
+
+def generate_page(rng):
+    """Wikipedia-like page with nested navboxes and infoboxes, unclosed and stray tags, and escaped characters."""
+
+    def _element(depth):
+        if depth > 4 or rng.random() < 0.3:
+            return rng.choice(TEXTS)
+        kind = rng.choice(["a", "a", "p", "b", "span", "div", "navbox", "infobox", "tr", "td", "th", "pre",
+                           "br", "script", "comment", "unclosed", "stray"])
+        children = "".join(_element(depth + 1) for _ in range(rng.randint(0, 3)))
+        if kind == "a":
+            href = rng.choice(HREFS)
+            return f'<a href="{href}">{children}</a>' if href else f"<a>{children}</a>"
+        if kind == "navbox":
+            return f'<div class="navbox">{children}</div>'
+        if kind == "infobox":
+            return f'<table class="infobox">{children}</table>'
+        if kind == "br":
+            return "<br/>" + children
+        if kind == "script":
+            return "<script>var a = 1 < 2;</script>"
+        if kind == "comment":
+            return "<!-- comment -->" + children
+        if kind == "unclosed":
+            return "<span>" + children
+        if kind == "stray":
+            return children + "</td>"
+        return f"<{kind}>{children}</{kind}>"
+
+    return "".join(_element(0) for _ in range(rng.randint(1, 6)))
+
+
+class TestWikipediaPageParser(unittest.TestCase):
+    def test_anchor_dict(self):
+        anchor_dict, _, _ = parse(PAGE)
+        self.assertEqual(anchor_dict, EXPECTED_ANCHOR_DICT)
+
+    def test_first_anchor_wins(self):
+        anchor_dict, _, _ = parse(
+            '<a href="/wiki/Paris">Paris</a> <a href="/wiki/Paris,_Texas">Paris</a>'
+            # anchors which are not kept do not block later anchors with the same text
+            '<a href="https://example.org">Berlin</a> <a href="/wiki/Category:Berlin">Berlin</a>'
+            '<a href="/wiki/Berlin">Berlin</a> <a href="/wiki/Berlin_(band)"> Berlin </a>'
+        )
+        self.assertEqual(anchor_dict, {"Paris": "Paris", "Berlin": "Berlin"})
+
+    def test_navboxes_are_pruned(self):
+        anchor_dict, tables, _ = parse(
+            '<div class="navbox"><a href="/wiki/Navbox">Navbox</a><div class="navbox">'
+            '<a href="/wiki/Nested">Nested</a></div><a href="/wiki/After_nested">After nested</a></div>'
+            '<div class="navbox"><table class="infobox"><tr><td>In navbox</td></tr></table></div>'
+            '<div class="navboxes"><a href="/wiki/Other_class">Other class</a></div>'
+            '<a href="/wiki/Navbox">Navbox</a>'
+        )
+        self.assertEqual(anchor_dict, {"Other class": "Other_class", "Navbox": "Navbox"})
+        # infoboxes within navboxes are pruned as well
+        self.assertIsNone(tables)
+
+    def test_infobox(self):
+        anchor_dict, tables, infobox_anchor_dict = parse(PAGE)
+        # only the first infobox is parsed, without the navbox in it
+        self.assertEqual(len(tables), 1)
+        rows = [[(cell["cell_type"], cell["text"], cell["entities"]) for cell in row] for row in tables[0]]
+        self.assertEqual(rows, [
+            [("header", "Eiffel Tower", ["Eiffel_Tower"])],
+            [("header", "Location", []), ("data", "Paris ,  France", ["Paris", "France"])],
+            [("header", "Architect", []), ("data", "Gustave Eiffel   Maurice Koechlin Stephen Sauvestre",
+                                           ["Gustave_Eiffel", "Maurice_Koechlin", "Stephen_Sauvestre"])],
+            [("header", "Opened", []), ("data", "31 March 1889   ( World's Fair )", ["Exposition_Universelle_(1889)"])],
+            [("header", "Height", []), ("data", "330 m [1]", [])],
+            [("header", "Owner", []), ("data", "City of Paris", ["Paris"])],
+        ])
+        # anchors of the infobox are in the anchor dict already (links to cite notes are no Wikipedia paths)
+        self.assertEqual(infobox_anchor_dict, EXPECTED_ANCHOR_DICT)
+        self.assertEqual(anchor_dict, EXPECTED_ANCHOR_DICT)
+
+    def test_page_without_infobox(self):
+        page = WikipediaPageParser().parse('<table class="wikitable"><tr><td>No infobox</td></tr></table>')
+        self.assertFalse(page.has_infobox())
+        self.assertEqual(page.get_anchor_dict(), dict())
+
+    @unittest.skipUnless(find_spec("bs4"), "requires bs4")
+    def test_same_as_beautiful_soup(self):
+        self.assertEqual(parse(PAGE), baseline_parse(PAGE))
+
+    @unittest.skipUnless(find_spec("bs4"), "requires bs4")
+    def test_same_as_beautiful_soup_on_generated_pages(self):
+        rng = random.Random(0)
+        num_infoboxes = 0
+        for _ in range(1000):
+            page_html = generate_page(rng)
+            result = parse(page_html)
+            self.assertEqual(result, baseline_parse(page_html), page_html)
+            num_infoboxes += result[1] is not None
+        # the generated pages cover both cases
+        self.assertGreater(num_infoboxes, 100)
+        self.assertLess(num_infoboxes, 900)
+
+
+if __name__ == "__main__":
+    unittest.main()
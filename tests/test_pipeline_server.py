@@ -0,0 +1,256 @@
+"""
+Offline tests of the pipeline server: micro-batching, and answering
+questions with a stubbed pipeline and stubbed CLOCQ/Wikipedia backends.
+"""
+import os
+import json
+import socket
+import threading
+import unittest
+import http.client
+import importlib.util
+from http.server import ThreadingHTTPServer
+
+from faith.library.utils import get_config
+from faith.library.transport import Transport, persistent_caches_enabled
+from faith.pipeline_server import MicroBatcher, PipelineServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVALUATE_CONFIG_PATH = os.path.join(REPO_DIR, "config", "tiq", "evaluate.yml")
+
+CONFIG = {
+    "log_level": "ERROR",
+    "transport_mode": "stub",
+    "server_max_batch_size": 4,
+    "server_max_wait": 0.05,
+    "server_store_cache_every": 2,
+}
+
+
+class StubPipeline:
+    """Pipeline returning the question as answer (and recording the batches)."""
+
+    def __init__(self):
+        self.batches = []
+        self.num_stored_caches = 0
+
+    def inference_on_batch(self, instances, topk_answers, sources):
+        self.batches.append([instance["Question"] for instance in instances])
+        for instance in instances:
+            instance["structured_temporal_form"] = {"entity": instance["Question"]}
+            instance["ranked_answers"] = [{"answer": {"id": instance["Question"], "label": instance["Question"]}, "rank": 1}]
+            instance["candidate_evidences"] = [
+                {"evidence_text": f"evidence {i}", "source": sources[0], "wikidata_entities": [], "score": 1.0}
+                for i in range(10)
+            ]
+        return instances
+
+    def store_cache(self):
+        self.num_stored_caches += 1
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def _submit_concurrently(self, batcher, instances):
+        """Submit all instances at (nearly) the same time, and return the futures in order."""
+        barrier = threading.Barrier(len(instances))
+        futures = [None] * len(instances)
+
+        def submit(i):
+            barrier.wait()
+            futures[i] = batcher.submit(instances[i])
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(instances))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return futures
+
+    def test_batches_are_limited_by_max_batch_size(self):
+        batches = []
+
+        def process_batch(instances):
+            batches.append(list(instances))
+            return instances
+
+        # all requests arrive within the max wait of the first batch
+        batcher = MicroBatcher(process_batch, max_batch_size=3, max_wait=1)
+        futures = [batcher.submit(i) for i in range(8)]
+        self.assertEqual([future.result(timeout=5) for future in futures], list(range(8)))
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6, 7]])
+
+    def test_concurrent_requests_are_batched(self):
+        batches = []
+
+        def process_batch(instances):
+            batches.append(list(instances))
+            return instances
+
+        batcher = MicroBatcher(process_batch, max_batch_size=8, max_wait=0.5)
+        futures = self._submit_concurrently(batcher, list(range(8)))
+        self.assertEqual([future.result(timeout=5) for future in futures], list(range(8)))
+        self.assertLess(len(batches), 8)
+
+    def test_single_request_is_processed_after_max_wait(self):
+        batcher = MicroBatcher(lambda instances: [i * 2 for i in instances], max_batch_size=8, max_wait=0.01)
+        self.assertEqual(batcher.submit(21).result(timeout=5), 42)
+
+    def test_results_are_matched_to_requests(self):
+        # results are returned in the order of the instances of the batch
+        batcher = MicroBatcher(lambda instances: [f"answer {i}" for i in instances], max_batch_size=4, max_wait=0.1)
+        futures = self._submit_concurrently(batcher, list(range(10)))
+        self.assertEqual([future.result(timeout=5) for future in futures], [f"answer {i}" for i in range(10)])
+
+    def test_errors_are_set_on_all_futures_of_the_batch(self):
+        def process_batch(instances):
+            if "fail" in instances:
+                raise ValueError("batch failed")
+            return instances
+
+        batcher = MicroBatcher(process_batch, max_batch_size=2, max_wait=1)
+        futures = [batcher.submit("ok"), batcher.submit("fail")]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
+        # the worker keeps processing later batches
+        self.assertEqual(batcher.submit("ok").result(timeout=5), "ok")
+
+
+class TestPipelineServer(unittest.TestCase):
+    def test_answer(self):
+        pipeline = StubPipeline()
+        server = PipelineServer(pipeline, CONFIG)
+        result = server.answer("who won the 2014 world cup?", "2023-07-15", "kb_text")
+        self.assertEqual(result["question"], "who won the 2014 world cup?")
+        self.assertEqual(result["ranked_answers"][0]["answer"]["id"], "who won the 2014 world cup?")
+        self.assertEqual(len(result["supporting_evidences"]), 5)
+        self.assertEqual(set(result["supporting_evidences"][0]), {"evidence_text", "source", "wikidata_entities"})
+        # response is JSON-serializable
+        json.dumps(result)
+
+    def test_caches_are_stored_periodically(self):
+        pipeline = StubPipeline()
+        server = PipelineServer(pipeline, CONFIG)
+        for i in range(4):
+            server.answer(f"question {i}")
+        self.assertEqual(len(pipeline.batches), 4)
+        self.assertEqual(pipeline.num_stored_caches, 2)
+
+    def test_unknown_sources_are_rejected(self):
+        pipeline = StubPipeline()
+        server = PipelineServer(pipeline, CONFIG)
+        for sources_str in ["kb_web", "", "kb__text", None]:
+            with self.assertRaises(ValueError):
+                server.answer("question", sources_str=sources_str)
+        self.assertEqual(pipeline.batches, [])
+
+    def test_http_status_codes(self):
+        pipeline = StubPipeline()
+        server = PipelineServer(pipeline, CONFIG)
+        http_server = ThreadingHTTPServer(("localhost", 0), server._get_request_handler())
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        self.addCleanup(http_server.server_close)
+        self.addCleanup(http_server.shutdown)
+
+        def post(request):
+            connection = http.client.HTTPConnection("localhost", http_server.server_address[1], timeout=5)
+            connection.request("POST", "/answer", body=json.dumps(request))
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+
+        status, result = post({"question": "question", "sources": "kb_text"})
+        self.assertEqual(status, 200)
+        self.assertEqual(result["question"], "question")
+        status, result = post({"question": "question", "sources": "kb_web"})
+        self.assertEqual(status, 400)
+        self.assertIn("kb_web", result["error"])
+        status, _ = post({"sources": "kb"})
+        self.assertEqual(status, 400)
+        self.assertEqual(len(pipeline.batches), 1)
+
+
+class TestStubTransport(unittest.TestCase):
+    def test_backends_are_stubbed(self):
+        transport = Transport(CONFIG)
+
+        def unreachable(*args, **kwargs):
+            raise AssertionError("stubbed backend was called")
+
+        search_space = transport.call("clocq_search_space", ["tsf", {}], unreachable)
+        self.assertEqual(search_space, {"kb_item_tuple": [], "search_space": []})
+        # responses can be modified by the caller
+        search_space["kb_item_tuple"].append("item")
+        self.assertEqual(transport.call("clocq_search_space", ["tsf", {}], unreachable)["kb_item_tuple"], [])
+        self.assertEqual(transport.call("clocq_neighborhood", ["Q1", 1000], unreachable), [])
+        self.assertIsNone(transport.call("wikipedia_html", "https://en.wikipedia.org/wiki/X", unreachable))
+        self.assertEqual(json.loads(transport.call("wikipedia_redirects", "url", unreachable)), {"query": {}})
+        # services which are not stubbed are called
+        self.assertEqual(transport.call("sutime", ["/annotate", {}], lambda: "annotations"), "annotations")
+
+    def test_persistent_caches_are_disabled(self):
+        self.assertFalse(persistent_caches_enabled(CONFIG))
+        self.assertTrue(persistent_caches_enabled({"transport_mode": "replay"}))
+        self.assertTrue(persistent_caches_enabled(dict()))
+
+
+def _sutime_is_running():
+    try:
+        socket.create_connection(("localhost", 7779), timeout=1).close()
+    except OSError:
+        return False
+    return True
+
+
+def _pipeline_is_available():
+    """Whether the dependencies, models and data of the pipeline are available (and SUTime is running)."""
+    if any(importlib.util.find_spec(module) is None for module in ["torch", "transformers", "clocq", "spacy"]):
+        return False
+    config = get_config(EVALUATE_CONFIG_PATH)
+    data_dir = os.path.join(REPO_DIR, config["path_to_data"], config["benchmark"])
+    return os.path.isdir(data_dir) and _sutime_is_running()
+
+
+def _snapshot(directory):
+    """Size and modification time of all files in the given directory."""
+    snapshot = dict()
+    for root, _, files in os.walk(directory):
+        for file in files:
+            path = os.path.join(root, file)
+            stat = os.stat(path)
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+@unittest.skipUnless(_pipeline_is_available(), "requires the models and data of the pipeline, and SUTime")
+class TestPipelineServerWithStubbedBackends(unittest.TestCase):
+    """The real pipeline (default evaluation config) with stubbed CLOCQ and Wikipedia."""
+
+    def setUp(self):
+        # paths in the config are relative to the repository
+        cwd = os.getcwd()
+        os.chdir(REPO_DIR)
+        self.addCleanup(os.chdir, cwd)
+
+    def test_answer_does_not_write_caches(self):
+        from faith.pipeline import Pipeline
+
+        config = get_config(EVALUATE_CONFIG_PATH)
+        config["transport_mode"] = "stub"
+        config["server_store_cache_every"] = 1
+        data_dir = os.path.join(config["path_to_data"], config["benchmark"])
+        snapshot = _snapshot(data_dir)
+
+        pipeline = Pipeline(config)
+        server = PipelineServer(pipeline, config)
+        result = server.answer("Who was the president of the US when the Berlin Wall fell?", "2023-07-15")
+        pipeline.store_cache()
+
+        self.assertIn("structured_temporal_form", result)
+        self.assertIsInstance(result["ranked_answers"], list)
+        # nothing was found, and the (empty) results were not written to the caches
+        self.assertEqual(result["supporting_evidences"], [])
+        self.assertEqual(_snapshot(data_dir), snapshot)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Tests of the run manifest: identification of runs, and resuming stages and outputs.
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+from faith.library.utils import get_config
+from faith.library.run_manifest import RunManifest, config_fingerprint
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRAIN_CONFIG_PATH = os.path.join(REPO_DIR, "config", "tiq", "train_tqu_fer.yml")
+EVALUATE_CONFIG_PATH = os.path.join(REPO_DIR, "config", "tiq", "evaluate.yml")
+
+
+class ManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.config = get_config(EVALUATE_CONFIG_PATH)
+        self.config["run_manifest_dir"] = os.path.join(self.tmp_dir, "manifests")
+        self.input_path = os.path.join(self.tmp_dir, "test.json")
+        with open(self.input_path, "w") as fp:
+            json.dump([{"Id": i, "Question": f"question {i}"} for i in range(3)], fp)
+        self.output_paths = [os.path.join(self.tmp_dir, "out", "tqu.jsonl"), os.path.join(self.tmp_dir, "out", "ha.jsonl")]
+
+    def manifest(self, config=None, **params):
+        return RunManifest(config or self.config, "evaluate", [self.input_path], **params)
+
+    def write_outputs(self, lines):
+        for output_path in self.output_paths:
+            with open(output_path, "a") as fp:
+                fp.write(lines)
+
+
+class TestConfigFingerprint(ManifestTestCase):
+    def test_throughput_and_cache_keys_are_ignored(self):
+        changed = dict(self.config)
+        changed.update({
+            "log_level": "DEBUG", "evaluate_stream_window": 100, "evaluate_async": True,
+            "clocq_deadline": 300, "clocq_max_in_flight": 1, "wikipedia_timeout": 60,
+            "transport_mode": "replay", "transport_archive_path": "other.db", "transport_replay_latency": 1,
+            "server_port": 1234, "er_cache_backend": "sqlite", "er_kb_evidences_cache": False,
+            "tvr_use_cache": True,
+        })
+        self.assertEqual(config_fingerprint(changed), config_fingerprint(self.config))
+
+    def test_relevant_keys_change_fingerprint(self):
+        for key, value in [("evs_max_evidences", 1), ("clocq_p", 10), ("er_neighborhood_max_facts", 5),
+                           ("transport_mode", "stub")]:
+            changed = dict(self.config, **{key: value})
+            self.assertNotEqual(config_fingerprint(changed), config_fingerprint(self.config), key)
+
+
+class TestRunManifest(ManifestTestCase):
+    def test_finished_stages_are_resumed(self):
+        manifest = self.manifest(sources_str="kb")
+        self.assertFalse(manifest.is_stage_done("evaluate"))
+        manifest.mark_stage_done("evaluate")
+        self.assertTrue(self.manifest(sources_str="kb").is_stage_done("evaluate"))
+        # other run parameters, config or inputs -> other run
+        self.assertFalse(self.manifest(sources_str="text").is_stage_done("evaluate"))
+        self.assertFalse(self.manifest(dict(self.config, evs_max_evidences=1), sources_str="kb").is_stage_done("evaluate"))
+        with open(self.input_path, "a") as fp:
+            fp.write(" ")
+        self.assertFalse(self.manifest(sources_str="kb").is_stage_done("evaluate"))
+
+    def test_partially_written_outputs_are_truncated(self):
+        manifest = self.manifest()
+        self.assertEqual(manifest.prepare_outputs("evaluate", self.output_paths), set())
+        self.write_outputs('{"Id": 0}\n{"Id": 1}\n')
+        manifest.mark_questions_done("evaluate", [0, 1], self.output_paths)
+        # crash while writing question 2
+        self.write_outputs('{"Id": 2, "incompl')
+
+        manifest = self.manifest()
+        self.assertEqual(manifest.prepare_outputs("evaluate", self.output_paths), {0, 1})
+        for output_path in self.output_paths:
+            with open(output_path) as fp:
+                self.assertEqual(fp.read(), '{"Id": 0}\n{"Id": 1}\n')
+
+    def test_removed_outputs_reset_stage(self):
+        manifest = self.manifest()
+        manifest.prepare_outputs("evaluate", self.output_paths)
+        self.write_outputs('{"Id": 0}\n')
+        manifest.mark_questions_done("evaluate", [0], self.output_paths)
+        os.remove(self.output_paths[1])
+
+        manifest = self.manifest()
+        self.assertEqual(manifest.prepare_outputs("evaluate", self.output_paths), set())
+        for output_path in self.output_paths:
+            self.assertEqual(os.path.getsize(output_path), 0)
+        # the reset is recorded as well
+        self.assertEqual(self.manifest().prepare_outputs("evaluate", self.output_paths), set())
+
+    def test_incomplete_event_is_ignored(self):
+        manifest = self.manifest()
+        manifest.prepare_outputs("evaluate", self.output_paths)
+        self.write_outputs('{"Id": 0}\n')
+        manifest.mark_questions_done("evaluate", [0], self.output_paths)
+        with open(manifest.manifest_path, "a") as fp:
+            fp.write('{"event": "questions_done", "stage": "evaluate", "ids": [1')
+        self.assertEqual(self.manifest().prepare_outputs("evaluate", self.output_paths), {0})
+
+
+@unittest.skipUnless(
+    all(importlib.util.find_spec(module) is not None for module in ["torch", "transformers", "clocq"]),
+    "requires the dependencies of the pipeline",
+)
+class TestTrainResume(ManifestTestCase):
+    def test_finished_stages_do_not_load_modules(self):
+        from faith.pipeline import Pipeline
+
+        config = get_config(TRAIN_CONFIG_PATH)
+        config["run_manifest"] = True
+        config["run_manifest_dir"] = os.path.join(self.tmp_dir, "manifests")
+        config["benchmark_path"] = self.tmp_dir
+        input_dir = os.path.join(self.tmp_dir, config["benchmark"])
+        os.makedirs(input_dir)
+        for path in [config["train_input_path"], config["dev_input_path"]]:
+            with open(os.path.join(input_dir, path), "w") as fp:
+                json.dump([], fp)
+        # results are logged relative to the working directory
+        cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        self.addCleanup(os.chdir, cwd)
+
+        pipeline = Pipeline(config)
+        manifest = pipeline._get_manifest("train", [
+            os.path.join(input_dir, config["train_input_path"]),
+            os.path.join(input_dir, config["dev_input_path"]),
+        ], sources_str="kb_text_table_info")
+        stages = ["tqu_train", "tqu_inference", "fer_er", "fer_pruning", "fer_es_train", "fer_es_inference", "ha_train"]
+        for stage in stages:
+            manifest.mark_stage_done(stage)
+
+        def not_loaded():
+            raise AssertionError("module of a finished stage was loaded")
+
+        pipeline._load_tqu = pipeline._load_fer = pipeline._load_ha = not_loaded
+        pipeline.train("kb_text_table_info")
+
+
+if __name__ == "__main__":
+    unittest.main()
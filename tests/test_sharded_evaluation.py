@@ -0,0 +1,113 @@
+"""
+Tests of the sharded evaluation: streaming the benchmark, options and slices of the shards.
+"""
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import contextlib
+import importlib.util
+
+from faith.library.utils import get_config, read_instances
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVALUATE_CONFIG_PATH = os.path.join(REPO_DIR, "config", "tiq", "evaluate.yml")
+PIPELINE_AVAILABLE = all(importlib.util.find_spec(module) is not None for module in ["torch", "transformers", "clocq"])
+
+INSTANCES = [
+    {"Id": i, "Question": f'question {i} with "quotes", [brackets] and {{braces}}', "Answer": [{"id": f"Q{i}"}]}
+    for i in range(25)
+]
+
+
+class TestReadInstances(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def write(self, content):
+        path = os.path.join(self.tmp_dir, "benchmark.json")
+        with open(path, "w") as fp:
+            fp.write(content)
+        return path
+
+    def test_json_and_jsonl_are_read(self):
+        for content in [json.dumps(INSTANCES), json.dumps(INSTANCES, indent=4),
+                        "\n".join(json.dumps(instance) for instance in INSTANCES) + "\n"]:
+            self.assertEqual(list(read_instances(self.write(content))), INSTANCES)
+        self.assertEqual(list(read_instances(self.write(" [ ] "))), [])
+
+    def test_json_is_parsed_incrementally(self):
+        from faith.library.utils import _iterate_json_array
+
+        fp = io.StringIO(json.dumps(INSTANCES)[1:])
+        instances = _iterate_json_array(fp, chunk_size=16)
+        self.assertEqual(next(instances), INSTANCES[0])
+        # only the beginning of the file was read
+        self.assertLess(fp.tell(), len(json.dumps(INSTANCES[:2])))
+        self.assertEqual(list(instances), INSTANCES[1:])
+
+    def test_truncated_json_fails(self):
+        with self.assertRaises(json.JSONDecodeError):
+            list(read_instances(self.write(json.dumps(INSTANCES)[:-10])))
+
+
+@unittest.skipUnless(PIPELINE_AVAILABLE, "requires the dependencies of the pipeline")
+class TestEvaluateOptions(unittest.TestCase):
+    def parse(self, function, args):
+        from faith.pipeline import parse_evaluate_options
+
+        return parse_evaluate_options(function, args)
+
+    def assertInvalid(self, function, args):
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            self.parse(function, args)
+
+    def test_valid_options(self):
+        options = self.parse("--evaluate", [])
+        self.assertEqual((options.sources_str, options.workers, options.shard_count), ("kb_text_table_info", None, None))
+        options = self.parse("--evaluate", ["kb", "--shard-index", "1", "--shard-count", "4"])
+        self.assertEqual((options.sources_str, options.shard_index, options.shard_count), ("kb", 1, 4))
+        self.assertEqual(self.parse("--evaluate-dev", ["--workers", "3"]).workers, 3)
+        self.assertEqual(self.parse("--merge-shards", ["kb_text", "--shard-count", "4"]).shard_count, 4)
+
+    def test_invalid_options(self):
+        for args in [["--shard-count", "4"], ["--shard-index", "1"], ["--shard-index", "4", "--shard-count", "4"],
+                     ["--shard-index", "0", "--shard-count", "2", "--workers", "2"], ["--workers", "0"],
+                     ["--workers", "two"], ["--unknown", "1"]]:
+            self.assertInvalid("--evaluate", args)
+        self.assertInvalid("--merge-shards", ["kb"])
+
+
+@unittest.skipUnless(PIPELINE_AVAILABLE, "requires the dependencies of the pipeline")
+class TestEvaluateShard(unittest.TestCase):
+    def test_shards_cover_benchmark(self):
+        from faith.pipeline import Pipeline
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        config = get_config(EVALUATE_CONFIG_PATH)
+        config["benchmark_path"] = tmp_dir
+        config["run_manifest"] = False
+        os.makedirs(os.path.join(tmp_dir, config["benchmark"]))
+        with open(os.path.join(tmp_dir, config["benchmark"], config["test_input_path"]), "w") as fp:
+            json.dump(INSTANCES, fp)
+        # results are logged relative to the working directory
+        cwd = os.getcwd()
+        os.chdir(tmp_dir)
+        self.addCleanup(os.chdir, cwd)
+
+        pipeline = Pipeline(config)
+        pipeline.store_cache = lambda: None
+        shards = []
+        pipeline._evaluate_stream_split = lambda instances, *args: shards.append(list(instances))
+        for shard_index in range(4):
+            pipeline.evaluate_shard(shard_index, 4, sources_str="kb")
+        self.assertEqual([len(shard) for shard in shards], [6, 6, 6, 7])
+        self.assertEqual([instance for shard in shards for instance in shard], INSTANCES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Tests of the staged executor: order of results, bounded items in flight, and errors.
+"""
+import time
+import random
+import threading
+import unittest
+
+from faith.library.staged_executor import Stage, StagedExecutor
+
+
+class TestStagedExecutor(unittest.TestCase):
+    def test_results_are_in_input_order(self):
+        rng = random.Random(0)
+        delays = [rng.random() * 0.01 for _ in range(50)]
+
+        def slow_square(i):
+            # items overtake each other within the stage
+            time.sleep(delays[i])
+            return i * i
+
+        results = []
+        stages = [Stage("square", slow_square, concurrency=4), Stage("add", lambda x: x + 1, concurrency=2)]
+        StagedExecutor(stages, queue_size=2).run(range(50), results.append)
+        self.assertEqual(results, [i * i + 1 for i in range(50)])
+
+    def test_empty_input(self):
+        results = []
+        StagedExecutor([Stage("identity", lambda x: x)]).run([], results.append)
+        self.assertEqual(results, [])
+
+    def test_items_in_flight_are_bounded(self):
+        lock = threading.Lock()
+        in_flight = {"current": 0, "max": 0}
+        started = list()
+
+        def items():
+            for i in range(30):
+                with lock:
+                    in_flight["current"] += 1
+                    in_flight["max"] = max(in_flight["max"], in_flight["current"])
+                yield i
+
+        def process(i):
+            started.append(i)
+            # the first item is slow: later results wait for it in the reorder window
+            if i == 0:
+                time.sleep(0.2)
+            return i
+
+        def on_done(i):
+            with lock:
+                in_flight["current"] -= 1
+
+        executor = StagedExecutor([Stage("process", process, concurrency=8)], queue_size=4, max_in_flight=5)
+        executor.run(items(), on_done)
+        # the next item is taken from the input before waiting for a free slot
+        self.assertEqual(in_flight["max"], 5 + 1)
+        self.assertEqual(sorted(started), list(range(30)))
+
+    def test_exclusive_stages_share_one_thread(self):
+        lock = threading.Lock()
+        running = {"current": 0, "max": 0}
+        threads = set()
+
+        def exclusive(i):
+            with lock:
+                running["current"] += 1
+                running["max"] = max(running["max"], running["current"])
+                threads.add(threading.get_ident())
+            time.sleep(0.001)
+            with lock:
+                running["current"] -= 1
+            return i
+
+        stages = [Stage("a", exclusive, concurrency=4, exclusive=True), Stage("io", lambda i: i, concurrency=4),
+                  Stage("b", exclusive, exclusive=True)]
+        self.assertEqual(stages[0].concurrency, 1)
+        results = []
+        StagedExecutor(stages).run(range(20), results.append)
+        self.assertEqual(results, list(range(20)))
+        self.assertEqual(running["max"], 1)
+        self.assertEqual(len(threads), 1)
+
+    def test_errors_are_raised(self):
+        processed = []
+
+        def fail_on_5(i):
+            if i == 5:
+                raise ValueError("item 5 failed")
+            return i
+
+        stages = [Stage("fail", fail_on_5, concurrency=2), Stage("process", lambda i: i)]
+        with self.assertRaises(ValueError):
+            StagedExecutor(stages, queue_size=2).run(range(100), processed.append)
+        # results are passed on in order up to the failed item, and the run stops
+        self.assertEqual(processed, list(range(len(processed))))
+        self.assertLess(len(processed), 100)
+        self.assertNotIn(5, processed)
+
+    def test_errors_of_on_done_are_raised(self):
+        def on_done(i):
+            if i == 3:
+                raise KeyError(i)
+
+        with self.assertRaises(KeyError):
+            StagedExecutor([Stage("identity", lambda i: i)]).run(range(10), on_done)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Tests of the string tables: converted pickles return the same values as the source dicts.
+"""
+import os
+import sys
+import pickle
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from faith.library.string_table import StringTable, load_mapping, write_string_table
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# labels and mappings as in the Wikidata/Wikipedia dumps (non-ASCII, empty, and prefix keys)
+LABELS = {
+    "Q1": "universe",
+    "Q10": "",
+    "Q100": "Boston",
+    "Q2": "Earth",
+    "Q90": "Paris",
+    "Q12345": "Ærø Municipality",
+    "Q5": "human 😀",
+    "": "empty key",
+    "São Paulo": "Q174",
+    "Zürich": "Q72",
+    "zürich": "Q72",
+}
+MAPPINGS = {
+    "Q76": ["Barack_Obama"],
+    "Q30": ["United_States", "USA"],
+    "Q7": [],
+    "Q1490": {"title": "Tōkyō", "year": 1868},
+    "Q9": None,
+}
+MISSING_KEYS = ["Q3", "Q1000", "Q0", "q1", "Q1 ", "Zurich", "São", " ", "\x00", "￿", "😀"]
+
+
+class TestStringTable(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def _convert(self, mapping, name):
+        """Pickle the mapping, and convert the pickle via the command line (as for the dumps)."""
+        pickle_path = os.path.join(self.tmp_dir, f"{name}.pickle")
+        with open(pickle_path, "wb") as fp:
+            pickle.dump(mapping, fp)
+        sst_path = os.path.join(self.tmp_dir, f"{name}.sst")
+        subprocess.run(
+            [sys.executable, "faith/library/string_table.py", pickle_path, sst_path],
+            cwd=REPO_DIR, env=dict(os.environ, PYTHONPATH=REPO_DIR), check=True, capture_output=True
+        )
+        return pickle_path, sst_path
+
+    def _assert_same_as_pickle(self, pickle_path, sst_path):
+        with open(pickle_path, "rb") as fp:
+            source = pickle.load(fp)
+        table = load_mapping(sst_path)
+        self.assertIsInstance(table, StringTable)
+        self.assertEqual(len(table), len(source))
+        for key, value in source.items():
+            self.assertIn(key, table)
+            self.assertEqual(table.get(key), value)
+            self.assertEqual(table[key], value)
+        for key in MISSING_KEYS:
+            self.assertNotIn(key, table)
+            self.assertEqual(table.get(key), source.get(key))
+            self.assertEqual(table.get(key, "default"), source.get(key, "default"))
+            with self.assertRaises(KeyError):
+                table[key]
+        # non-string keys are never in the table
+        self.assertIsNone(table.get(None))
+        self.assertIsNone(table.get(1))
+
+    def test_labels_round_trip(self):
+        pickle_path, sst_path = self._convert(LABELS, "labels")
+        self._assert_same_as_pickle(pickle_path, sst_path)
+        # pickles are still loaded as they are
+        self.assertEqual(load_mapping(pickle_path), LABELS)
+
+    def test_mappings_round_trip(self):
+        # values that are not strings are pickled (None values are distinct from missing keys)
+        pickle_path, sst_path = self._convert(MAPPINGS, "mappings")
+        self._assert_same_as_pickle(pickle_path, sst_path)
+        table = load_mapping(sst_path)
+        self.assertIn("Q9", table)
+        self.assertIsNone(table["Q9"])
+
+    def test_empty_and_many_entries(self):
+        for mapping in [dict(), {f"Q{i}": f"label {i}" for i in range(1000)}]:
+            path = os.path.join(self.tmp_dir, "table.sst")
+            self.assertEqual(write_string_table(mapping, path), len(mapping))
+            table = StringTable(path)
+            self.assertEqual({key: table[key] for key in mapping}, mapping)
+            self.assertIsNone(table.get("Q1000"))
+            self.assertEqual(len(table), len(mapping))
+
+    def test_other_files_are_rejected(self):
+        path = os.path.join(self.tmp_dir, "labels.sst")
+        with open(path, "wb") as fp:
+            pickle.dump(LABELS, fp)
+        with self.assertRaises(ValueError):
+            StringTable(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
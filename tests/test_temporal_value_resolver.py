@@ -0,0 +1,116 @@
+"""
+Tests of the memo of answered intermediate questions in the temporal value resolver.
+"""
+import os
+import copy
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+from faith.library.utils import get_config
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVALUATE_CONFIG_PATH = os.path.join(REPO_DIR, "config", "tiq", "evaluate.yml")
+DEPENDENCIES_AVAILABLE = all(importlib.util.find_spec(module) is not None for module in ["torch", "transformers"])
+
+INSTANCE = {
+    "Id": 1,
+    "Question": "Who was the chancellor of Germany when the Berlin Wall fell?",
+    "Question creation date": "2023-07-15",
+    "answers": [{"id": "Q2518", "label": "Helmut Kohl"}],
+    "generated_iquestion": "when did the Berlin Wall fall||date",
+}
+
+
+class FakeStringLibrary:
+    def is_timestamp(self, string):
+        return string.endswith("T00:00:00Z")
+
+
+class FakeFER:
+    string_lib = FakeStringLibrary()
+
+
+class FakePipeline:
+    """QA pipeline answering all questions with the same date (and the keys written by FER and HA)."""
+
+    fer = FakeFER()
+
+    def __init__(self):
+        self.num_questions = 0
+
+    def inference_on_batch(self, instances, topk_answers, sources):
+        for instance in instances:
+            self.num_questions += 1
+            answer_presence = any(answer["id"] == "Q2518" for answer in instance["answers"])
+            instance["structured_temporal_form"] = {"entity": "Berlin Wall", "category": "explicit"}
+            instance["candidate_evidences"] = [{"evidence_text": "Berlin Wall, fall, 9 November 1989", "source": "kb"}]
+            instance["answer_presence"] = answer_presence
+            instance["answer_presence_per_src"] = {"kb": 1} if answer_presence else {}
+            instance["ranked_answers"] = [{"answer": {"id": "1989-11-09T00:00:00Z", "label": "9 November 1989"},
+                                           "score": 1.0, "rank": 1}]
+            instance["p_at_1"] = 1.0 if answer_presence else 0.0
+            instance["mrr"] = instance["p_at_1"]
+            instance["h_at_5"] = instance["p_at_1"]
+        return instances
+
+
+@unittest.skipUnless(DEPENDENCIES_AVAILABLE, "requires the dependencies of the TVR")
+class TestTemporalValueResolverMemo(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+
+    def make_resolver(self, pipeline):
+        from faith.temporal_qu.implicit_resolver.temporal_value_resolver import TemporalValueResolver
+
+        config = get_config(EVALUATE_CONFIG_PATH)
+        config["log_level"] = "ERROR"
+        config["path_to_data"] = self.data_dir
+        config["tvr_use_cache"] = True
+        return TemporalValueResolver(config, pipeline)
+
+    def resolve(self, resolver, instance):
+        intermediate_questions = resolver.create_intermediate_questions(instance)
+        resolver.answer_intermediate_questions([iques for _, iques in intermediate_questions], 1, ["kb"])
+        return resolver.collect_temporal_values(intermediate_questions, 1)
+
+    def test_memoized_results_are_identical(self):
+        pipeline = FakePipeline()
+        resolver = self.make_resolver(pipeline)
+        miss = self.resolve(resolver, copy.deepcopy(INSTANCE))
+        hit = self.resolve(resolver, copy.deepcopy(INSTANCE))
+        self.assertEqual(pipeline.num_questions, 1)
+        self.assertEqual(hit, miss)
+        self.assertEqual(miss[0], [["1989-11-09", "1989-11-09"]])
+        self.assertEqual(miss[1][0]["p_at_1"], 1.0)
+
+        # memo stored to disk
+        resolver.store_cache()
+        hit = self.resolve(self.make_resolver(FakePipeline()), copy.deepcopy(INSTANCE))
+        self.assertEqual(hit, miss)
+
+    def test_repeated_questions_in_batch_are_identical(self):
+        pipeline = FakePipeline()
+        resolver = self.make_resolver(pipeline)
+        instances = [copy.deepcopy(INSTANCE), copy.deepcopy(INSTANCE)]
+        intermediate_questions = [resolver.create_intermediate_questions(instance) for instance in instances]
+        resolver.answer_intermediate_questions([iques for questions in intermediate_questions for _, iques in questions],
+                                               1, ["kb"])
+        self.assertEqual(pipeline.num_questions, 1)
+        self.assertEqual(intermediate_questions[0], intermediate_questions[1])
+
+    def test_results_for_other_gold_answers_are_not_shared(self):
+        pipeline = FakePipeline()
+        resolver = self.make_resolver(pipeline)
+        self.resolve(resolver, copy.deepcopy(INSTANCE))
+        other = dict(copy.deepcopy(INSTANCE), answers=[{"id": "Q57", "label": "Egon Krenz"}])
+        _, iques_answers = self.resolve(resolver, other)
+        self.assertEqual(pipeline.num_questions, 2)
+        self.assertEqual(iques_answers[0]["p_at_1"], 0.0)
+        self.assertFalse(iques_answers[0]["answer_presence"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Tests of the timing registry: aggregates, span names across threads, and forked processes.
+"""
+import os
+import unittest
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from faith.library import timing
+from faith.library.timing import TimingRegistry
+
+
+class TestTimingRegistry(unittest.TestCase):
+    def test_report(self):
+        registry = TimingRegistry()
+        for duration in range(1, 101):
+            registry.record("fer", duration)
+        report = registry.report()["fer"]
+        self.assertEqual(report["count"], 100)
+        self.assertEqual(report["total"], 5050)
+        self.assertEqual(report["mean"], 50.5)
+        self.assertEqual(report["max"], 100)
+        self.assertEqual((report["p50"], report["p95"], report["p99"]), (50, 95, 99))
+
+    def test_memory_is_bounded(self):
+        registry = TimingRegistry(max_samples=100)
+        for duration in range(1, 10001):
+            registry.record("fer", duration / 10000)
+        self.assertEqual(len(registry.stats["fer"]["samples"]), 100)
+        report = registry.report()["fer"]
+        # count, total and max are exact, percentiles are estimated
+        self.assertEqual(report["count"], 10000)
+        self.assertAlmostEqual(report["total"], 5000.5)
+        self.assertEqual(report["max"], 1.0)
+        self.assertAlmostEqual(report["p50"], 0.5, delta=0.15)
+        self.assertGreater(report["p99"], 0.9)
+
+    def test_span_names_are_independent_of_threads(self):
+        registry = TimingRegistry()
+
+        def retrieve():
+            with registry.span("er"):
+                pass
+
+        with registry.span("fer"):
+            retrieve()
+            wrapped = registry.in_current_span(retrieve)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(lambda _: wrapped(), range(2)))
+                executor.submit(wrapped).result()
+        self.assertEqual(registry.report()["fer/er"]["count"], 4)
+        self.assertEqual(set(registry.report()), {"fer", "fer/er"})
+        # the threads of the pool do not keep the spans of the caller
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(registry.in_current_span(retrieve)).result()
+            executor.submit(retrieve).result()
+        self.assertEqual(registry.report()["er"]["count"], 2)
+
+
+def _report_in_child(queue):
+    queue.put(timing.TIMINGS.report())
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+class TestForkedProcesses(unittest.TestCase):
+    def test_spans_of_parent_are_not_inherited(self):
+        timing.TIMINGS.record("parent", 1.0)
+        self.addCleanup(timing.TIMINGS.reset)
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        process = context.Process(target=_report_in_child, args=(queue,))
+        process.start()
+        self.assertEqual(queue.get(timeout=10), dict())
+        process.join()
+        self.assertIn("parent", timing.TIMINGS.report())
+
+
+if __name__ == "__main__":
+    unittest.main()
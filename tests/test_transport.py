@@ -0,0 +1,186 @@
+"""
+Tests of recording and replaying the requests to CLOCQ, Wikipedia and SUTime.
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+from faith.library.utils import get_config, BackgroundLoader
+from faith.library.transport import Transport, MissingRecordingError, RecordedError, get_transport
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVALUATE_CONFIG_PATH = os.path.join(REPO_DIR, "config", "tiq", "evaluate.yml")
+
+
+def _available(*modules):
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+
+class FakeResponse:
+    """Response of the SUTime service (as returned by requests)."""
+
+    def __init__(self, content):
+        self.content = content
+
+
+def unreachable(*args, **kwargs):
+    raise AssertionError("service was called in replay mode")
+
+
+class TransportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+
+    def make_config(self, mode, **overrides):
+        config = {
+            "log_level": "ERROR",
+            "path_to_data": self.data_dir,
+            "benchmark": "tiq",
+            "transport_mode": mode,
+            "transport_archive_path": "transport/transport_archive.db",
+        }
+        config.update(overrides)
+        return config
+
+
+class TestRecordReplay(TransportTestCase):
+    # requests and responses of the three services, as passed by the modules
+    RECORDINGS = [
+        ("clocq_search_space", ["berlin wall germany", {"k": "AUTO"}],
+         {"kb_item_tuple": [{"item": {"id": "Q1", "label": "Berlin Wall"}}], "search_space": [[{"id": "Q1"}]]}),
+        ("clocq_neighborhood", ["Q1", 1000], [[{"id": "Q1", "label": "Berlin Wall"}]]),
+        ("wikipedia_html", "https://en.wikipedia.org/wiki/Berlin_Wall", "<html><body>Berlin Wall</body></html>"),
+        ("wikipedia_api", {"titles": "Berlin Wall", "action": "query"}, {"query": {"pages": {"1": {"extract": "..."}}}}),
+        ("wikipedia_redirects", "https://en.wikipedia.org/w/api.php?titles=Berlin_Wall", b'{"query": {}}'),
+        ("sutime", ["/annotation", {"string": "in 1989", "reference_time": "2023-01-01"}],
+         FakeResponse(b'[{"text": "1989", "value": "1989"}]')),
+    ]
+
+    def test_recorded_responses_are_replayed(self):
+        recorder = Transport(self.make_config("record"))
+        for service, request, response in self.RECORDINGS:
+            self.assertIs(recorder.call(service, request, lambda: response), response)
+
+        replayer = Transport(self.make_config("replay"))
+        for service, request, response in self.RECORDINGS:
+            replayed = replayer.call(service, request, unreachable)
+            if isinstance(response, FakeResponse):
+                self.assertEqual(replayed.content, response.content)
+            else:
+                self.assertEqual(replayed, response)
+
+    def test_failed_requests_are_replayed(self):
+        recorder = Transport(self.make_config("record"))
+
+        def failed_request():
+            raise ConnectionError("connection refused")
+
+        with self.assertRaises(ConnectionError):
+            recorder.call("wikipedia_html", "https://en.wikipedia.org/wiki/X", failed_request)
+        replayer = Transport(self.make_config("replay"))
+        with self.assertRaises(RecordedError) as context:
+            replayer.call("wikipedia_html", "https://en.wikipedia.org/wiki/X", unreachable)
+        self.assertIn("connection refused", str(context.exception))
+        self.assertNotIsInstance(context.exception, MissingRecordingError)
+
+    def test_requests_are_matched_by_service_and_content(self):
+        recorder = Transport(self.make_config("record"))
+        recorder.call("clocq_neighborhood", ["Q1", 1000], lambda: ["Q1"])
+        replayer = Transport(self.make_config("replay"))
+        # same request to another service, other request to the same service
+        with self.assertRaises(MissingRecordingError):
+            replayer.call("clocq_search_space", ["Q1", 1000], unreachable)
+        with self.assertRaises(MissingRecordingError):
+            replayer.call("clocq_neighborhood", ["Q1", 100], unreachable)
+        # key order of requests does not matter
+        recorder.call("wikipedia_api", {"a": 1, "b": 2}, lambda: "page")
+        self.assertEqual(replayer.call("wikipedia_api", {"b": 2, "a": 1}, unreachable), "page")
+
+    def test_transports_are_shared_per_archive(self):
+        config = self.make_config("replay")
+        self.assertIs(get_transport(config), get_transport(dict(config)))
+        other_data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_data_dir)
+        self.assertIsNot(get_transport(config), get_transport(dict(config, path_to_data=other_data_dir)))
+
+
+@unittest.skipUnless(_available("requests"), "requires requests")
+class TestSutimeReplay(TransportTestCase):
+    def test_annotations_are_replayed(self):
+        from faith.library.temporal_annotator.sutime_date_annotator_client import SutimeClient
+
+        annotations = [{"text": "1989", "type": "DATE", "value": "1989", "start": 3, "end": 7}]
+        recorder = Transport(self.make_config("record"))
+        request = ["/annotation", {"string": "in 1989", "reference_time": "2023-01-01"}]
+        recorder.call("sutime", request, lambda: FakeResponse(json.dumps(annotations).encode("utf-8")))
+
+        client = SutimeClient(host="http://localhost", port="1", transport=Transport(self.make_config("replay")))
+        self.assertEqual(client.sutime_annotation_normalization("in 1989", "2023-01-01"), annotations)
+        with self.assertRaises(MissingRecordingError):
+            client.sutime_annotation_normalization("in 1990", "2023-01-01")
+
+    @unittest.skipUnless(_available("spacy"), "requires spacy")
+    def test_temporal_value_annotator_uses_transport(self):
+        config = get_config(EVALUATE_CONFIG_PATH)
+        if not _available(config["spacy_model"]):
+            self.skipTest(f"requires the spacy model {config['spacy_model']}")
+        from faith.library.string_library import StringLibrary
+        from faith.library.temporal_library import TemporalValueAnnotator
+
+        config.update(self.make_config("replay"))
+        config["path_to_stopwords"] = os.path.join(REPO_DIR, config["path_to_stopwords"])
+        annotator = TemporalValueAnnotator(config, StringLibrary(config))
+        self.assertIs(annotator.sutime.transport, get_transport(config))
+
+
+@unittest.skipUnless(
+    _available("requests", "spacy", "mwparserfromhell", "wikitables"), "requires the dependencies of the ER"
+)
+class TestWikipediaReplay(TransportTestCase):
+    def make_retriever(self, config):
+        from faith.faithful_er.evidence_retrieval.wikipedia_retriever.wikipedia_retriever import WikipediaRetriever
+
+        evaluate_config = get_config(EVALUATE_CONFIG_PATH)
+        evaluate_config.update(config)
+        evaluate_config["er_wikipedia_use_cache"] = True
+        evaluate_config["er_wikipedia_dump"] = "wikipedia/wikipedia_dump.pickle"
+        evaluate_config["er_on_the_fly"] = False
+        retriever = WikipediaRetriever(evaluate_config, temporal_value_annotator=None)
+        # retrieve on the fly, with a single known Wikipedia page
+        retriever.on_the_fly = True
+        retriever._wikipedia_mappings = BackgroundLoader(lambda: {"Q1": "Berlin_Wall"})
+        return retriever
+
+    def test_missing_recording_is_not_stored(self):
+        retriever = self.make_retriever(self.make_config("replay"))
+        with self.assertRaises(MissingRecordingError):
+            retriever.retrieve_wp_evidences({"id": "Q1", "label": "Berlin Wall"})
+        self.assertNotIn("Q1", retriever.wikipedia_dump)
+
+    def test_missing_page_is_stored(self):
+        # the request failed when it was recorded -> page is remembered as missing
+        recorder = self.make_retriever(self.make_config("record"))
+        recorder.fetcher = FailingFetcher()
+        self.assertEqual(recorder.retrieve_wp_evidences({"id": "Q1", "label": "Berlin Wall"}), [])
+
+        retriever = self.make_retriever(self.make_config("replay"))
+        self.assertEqual(retriever.retrieve_wp_evidences({"id": "Q1", "label": "Berlin Wall"}), [])
+        self.assertEqual(retriever.wikipedia_dump["Q1"], [])
+
+
+class FailingFetcher:
+    """Fetcher for Wikipedia, for which all requests fail."""
+
+    def get_text(self, *args, **kwargs):
+        raise Exception("404 Client Error: Not Found")
+
+    def get_json(self, *args, **kwargs):
+        raise Exception("404 Client Error: Not Found")
+
+
+if __name__ == "__main__":
+    unittest.main()